@@ -0,0 +1,170 @@
+"""
+Batched ordinary least squares: fit many small regressions at once
+(e.g. one per inlet, per year, per leave-one-inlet-out subset or per
+predictor set) with one batched QR decomposition instead of a loop of
+lstsq calls.
+
+Every fit in a batch has the same number of samples and predictors;
+samples can be excluded from individual fits with a boolean mask
+(nan's in X or y are always excluded). Excluded samples are zeroed
+out, so they do not enter the QR decomposition.
+
+Example (DOdeep on DOin and Tflush, one fit per inlet):
+    X = design([df_DOin.T.values, df_Tflush.T.values])   # (inlets x months x 3)
+    results = fit(X, df_DOdeep.T.values)
+    results['coef'][:,0]       # DOin slope of every inlet
+    cv = kfold_cv(X, df_DOdeep.T.values, k=4)
+
+Predictor sets are just different design matrices, e.g.
+design([np.log(Tflush)]) or design([df_DOin.shift(1).T.values, ...]).
+"""
+
+import numpy as np
+from scipy.stats import t as t_dist
+from scipy.stats import f as f_dist
+
+
+def design(predictors, intercept=True):
+    """
+    Stack predictors into a batch of design matrices.
+
+    INPUT:
+        predictors: list of arrays, each (samples,) or (batch x samples)
+        intercept: add a column of ones as the last predictor
+
+    OUTPUT: array (batch x samples x predictors)
+    """
+    predictors = [np.asarray(x, dtype=float) for x in predictors]
+    if intercept:
+        predictors.append(np.ones(predictors[0].shape[-1]))
+    predictors = np.broadcast_arrays(*[np.atleast_2d(x) for x in predictors])
+    return np.stack(predictors, axis=-1)
+
+
+def fit(X, y, mask=None, intercept=True):
+    """
+    Least-squares fit of y on X for every item of a batch.
+
+    INPUT:
+        X: array (batch x samples x predictors), see design()
+        y: array (batch x samples) (or (samples,) for the same y in every fit)
+        mask: optional boolean array (batch x samples); False excludes a sample
+        intercept: True if X has an intercept column (for R^2 and the F-test)
+
+    OUTPUT: dictionary of arrays
+        coef, se, t, p: (batch x predictors) coefficients, standard errors,
+            t statistics and two-sided p-values
+        r2, adj_r2: (batch,) coefficient of determination (and adjusted)
+        f, p_model: (batch,) F-test of the whole model
+        n, dof: (batch,) number of samples used and residual degrees of freedom
+        rmse: (batch,) root mean square residual
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), X.shape[:-1])
+    valid = np.all(np.isfinite(X), axis=-1) & np.isfinite(y)
+    if mask is not None:
+        valid = valid & np.broadcast_to(mask, valid.shape)
+    Xz = np.where(valid[...,None], X, 0)
+    yz = np.where(valid, y, 0)
+
+    npred = X.shape[-1]
+    n = valid.sum(axis=-1)
+    dof = n - npred
+
+    # batched QR: X = Q R, coef = R^-1 Q^T y
+    # (pinv, so rank-deficient fits give nan-free minimum-norm solutions)
+    Q, R = np.linalg.qr(Xz)
+    Rinv = np.linalg.pinv(R)
+    coef = np.einsum('bij,bkj,bk->bi', Rinv, Q, yz)
+
+    residual = np.where(valid, yz - np.einsum('bsp,bp->bs', Xz, coef), 0)
+    rss = np.sum(residual**2, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = rss / dof
+        # covariance of the coefficients: sigma^2 (X^T X)^-1 = sigma^2 R^-1 R^-T
+        var = sigma2[:,None] * np.sum(Rinv**2, axis=-1)
+        se = np.sqrt(var)
+        tstat = coef / se
+        p = 2 * t_dist.sf(np.abs(tstat), dof[:,None])
+
+        if intercept:
+            ymean = yz.sum(axis=-1) / n
+            tss = np.sum(np.where(valid, yz - ymean[:,None], 0)**2, axis=-1)
+            dof_model = npred - 1
+        else:
+            tss = np.sum(yz**2, axis=-1)
+            dof_model = npred
+        r2 = 1 - rss/tss
+        adj_r2 = 1 - (1 - r2) * (n - 1 + (not intercept)) / dof
+        f = ((tss - rss) / dof_model) / sigma2
+        p_model = f_dist.sf(f, dof_model, dof)
+
+    return {'coef': coef, 'se': se, 't': tstat, 'p': p,
+            'r2': r2, 'adj_r2': adj_r2, 'f': f, 'p_model': p_model,
+            'n': n, 'dof': dof, 'rmse': np.sqrt(rss / n)}
+
+
+def predict(X, coef):
+    """
+    Predictions (batch x samples) of fitted coefficients (batch x predictors).
+    """
+    return np.einsum('bsp,bp->bs', np.asarray(X, dtype=float), coef)
+
+
+def leave_one_out_masks(groups):
+    """
+    Masks for leave-one-group-out fits (e.g. leave one inlet out).
+
+    INPUT: groups: array (samples,) with the group label of every sample
+
+    OUTPUT: labels, masks
+        labels: the unique groups
+        masks: boolean array (groups x samples), False for the left-out group
+    """
+    groups = np.asarray(groups)
+    labels = np.unique(groups)
+    return labels, groups[None,:] != labels[:,None]
+
+
+def kfold_cv(X, y, k=5, seed=0, mask=None, intercept=True):
+    """
+    k-fold cross-validation of every fit in a batch. All k x batch
+    training fits are solved in one call to fit().
+
+    INPUT:
+        X, y, mask, intercept: as in fit()
+        k: number of folds (samples are assigned to folds at random,
+            with the same folds for every item of the batch)
+
+    OUTPUT: dictionary of arrays
+        predicted: (batch x samples) out-of-fold predictions (nan where excluded)
+        rmse, r2: (batch,) out-of-fold root mean square error and R^2
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), X.shape[:-1])
+    nbatch, nsamples, npred = X.shape
+    valid = np.all(np.isfinite(X), axis=-1) & np.isfinite(y)
+    if mask is not None:
+        valid = valid & np.broadcast_to(mask, valid.shape)
+
+    rng = np.random.default_rng(seed)
+    folds = rng.permutation(nsamples) % k
+
+    # (k x batch) training fits, stacked along the batch axis
+    train = valid[None,:,:] & (folds[None,None,:] != np.arange(k)[:,None,None])
+    results = fit(np.broadcast_to(X, (k,) + X.shape).reshape(-1, nsamples, npred),
+                  np.broadcast_to(y, (k,) + y.shape).reshape(-1, nsamples),
+                  mask=train.reshape(-1, nsamples), intercept=intercept)
+    coef = results['coef'].reshape(k, nbatch, npred)
+
+    # prediction of every sample by the fit that left its fold out
+    predicted = np.einsum('bsp,bsp->bs', X, coef[folds].transpose(1,0,2))
+    predicted = np.where(valid, predicted, np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = valid.sum(axis=-1)
+        residual = np.where(valid, y - predicted, 0)
+        rss = np.sum(residual**2, axis=-1)
+        ymean = np.where(valid, y, 0).sum(axis=-1) / n
+        tss = np.sum(np.where(valid, y - ymean[:,None], 0)**2, axis=-1)
+        return {'predicted': predicted, 'rmse': np.sqrt(rss / n), 'r2': 1 - rss/tss}
@@ -0,0 +1,88 @@
+"""
+Benchmark the direct and FFT backends of helper_functions.lowpass
+and report where the FFT backend becomes faster.
+
+Run as a script:
+    python benchmark_lowpass.py
+
+Prints the time of both backends for a range of record lengths and
+filter lengths (71 = Godin, others = Hanning), the backend picked by
+method='auto', and the record length at which the FFT backend first
+wins for each filter length.
+"""
+
+import time
+import numpy as np
+
+import helper_functions
+
+# record lengths (e.g. hours) and filter lengths to test
+RECORD_LENGTHS = [365, 1000, 4000, 8760, 20000, 50000, 100000]
+FILTER_LENGTHS = [10, 30, 40, 71, 150, 400]
+# number of independent series filtered together (e.g. grid cells)
+NCOLUMNS = 16
+
+
+def time_call(func, *args, repeat=3, **kwargs):
+    """
+    Returns the best wall-clock time [s] of repeat calls to func.
+    """
+    best = np.inf
+    for i in range(repeat):
+        tic = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - tic)
+    return best
+
+
+def run_benchmark(record_lengths=RECORD_LENGTHS, filter_lengths=FILTER_LENGTHS,
+                  ncolumns=NCOLUMNS, repeat=3):
+    """
+    Time both backends for every (filter length, record length) pair.
+
+    OUTPUT: list of dicts with keys
+        nf, nt, direct [s], fft [s], auto (backend chosen by lowpass)
+    """
+    rng = np.random.default_rng(0)
+    results = []
+    for nf in filter_lengths:
+        if nf == 71:
+            filt = helper_functions.godin_shape()
+        else:
+            filt = helper_functions.hanning_shape(n=nf)
+        for nt in record_lengths:
+            data = rng.standard_normal((nt, ncolumns))
+            t_direct = time_call(helper_functions.convolve_axis0, data, filt, repeat=repeat)
+            t_fft = time_call(helper_functions.fftconvolve_axis0, data, filt, repeat=repeat)
+            results.append({'nf': nf, 'nt': nt,
+                            'direct': t_direct, 'fft': t_fft,
+                            'auto': helper_functions.choose_method(nt, len(filt))})
+    return results
+
+
+def crossover(results):
+    """
+    Returns {filter length: shortest record length where fft was faster}
+    (None if the direct backend won at every record length tested).
+    """
+    cross = {}
+    for row in results:
+        cross.setdefault(row['nf'], None)
+        if cross[row['nf']] is None and row['fft'] < row['direct']:
+            cross[row['nf']] = row['nt']
+    return cross
+
+
+def print_results(results):
+    print('\n  nf       nt   direct [ms]   fft [ms]   faster   auto')
+    for row in results:
+        faster = 'fft' if row['fft'] < row['direct'] else 'direct'
+        print('{:4d} {:8d} {:13.3f} {:10.3f} {:>8s} {:>6s}'.format(
+            row['nf'], row['nt'], row['direct']*1000, row['fft']*1000, faster, row['auto']))
+    print('\nShortest record length where fft is faster:')
+    for nf, nt in crossover(results).items():
+        print('    nf = {:4d}: {}'.format(nf, nt if nt is not None else 'never (in tested range)'))
+
+
+if __name__ == '__main__':
+    print_results(run_benchmark())
@@ -0,0 +1,173 @@
+"""
+Benchmark every analysis stage and figure on synthetic data
+(synthetic_data.py) at several scales, and check for regressions
+against a saved baseline.
+
+The stages are those of main.py (main.build_graph, run on the synthetic
+data directory and timed with stage_profiler.StageProfiler), so new
+stages are benchmarked as soon as they are added there. The multi-year
+pipeline (multi_year.py) is timed as one more stage.
+
+Run as a script:
+    python benchmark_stages.py [--scales small medium] [--save-baseline]
+                               [--baseline benchmark_baseline.json] [--tolerance 0.5]
+
+Writes the timings to benchmark_results.json. With --save-baseline they
+also become the new baseline; otherwise, if a baseline exists, the run
+fails (exit code 1) when a stage is more than tolerance (default 50%)
+slower than in the baseline (stages faster than MIN_SECONDS in both
+runs are not compared, as their timings are mostly noise).
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+# (main.py; its main() would clash with the one below)
+import main as analysis
+import synthetic_data
+import render_figures
+import multi_year
+import stage_profiler
+
+# scales: number of inlets, number of years, grid size (eta x xi)
+SCALES = {
+    'small': {'ninlets': 13, 'nyears': 1, 'grid_shape': (400, 200)},
+    'medium': {'ninlets': 52, 'nyears': 2, 'grid_shape': synthetic_data.GRID_SHAPE},
+    'large': {'ninlets': 208, 'nyears': 4, 'grid_shape': (2604, 1326)},
+}
+
+# default files
+RESULTS_FILE = 'benchmark_results.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# allowed slowdown relative to the baseline
+TOLERANCE = 0.5
+
+# stages faster than this [s] are not checked for regressions
+MIN_SECONDS = 0.25
+
+
+def run_scale(ninlets, nyears, grid_shape, workdir):
+    """
+    Write synthetic data of one scale and time every stage on it
+    (every stage of main.build_graph, one after the other, with
+    headless figures; the data store, grid geometry and result cache
+    are built from scratch).
+
+    OUTPUT: {stage: seconds}
+    """
+    profiler = stage_profiler.StageProfiler()
+    data_dir = os.path.join(workdir, 'data')
+    years = [str(2017 + i) for i in range(nyears)]
+    profiler.call('write synthetic data', synthetic_data.write_dataset,
+                  data_dir, ninlets, years=years, grid_shape=grid_shape)
+
+    # run main.py on the synthetic data
+    settings = {'data_dir': analysis.data_dir, 'figure_dir': analysis.figure_dir, 'year': analysis.year}
+    analysis.data_dir = data_dir
+    analysis.figure_dir = os.path.join(workdir, 'figures')
+    analysis.year = years[0]
+    try:
+        analysis.build_graph(headless=True).run(values=analysis.CONSTANTS, max_workers=1, profiler=profiler)
+    finally:
+        for name, value in settings.items():
+            setattr(analysis, name, value)
+
+    profiler.call('multi_year', multi_year.run_years, years, data_dir, max_workers=1)
+    return {record['stage']: record['wall'] for record in profiler.records}
+
+
+def run_benchmark(scales=('small',)):
+    """
+    OUTPUT: {scale: {stage: seconds}}
+    """
+    render_figures.use_agg()
+    results = {}
+    for scale in scales:
+        workdir = tempfile.mkdtemp(prefix='benchmark_' + scale + '_')
+        try:
+            results[scale] = run_scale(workdir=workdir, **SCALES[scale])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE, min_seconds=MIN_SECONDS):
+    """
+    Stages that got slower than the baseline.
+
+    OUTPUT: list of (scale, stage, baseline seconds, seconds)
+    """
+    slower = []
+    for scale, timings in results.items():
+        for stage, seconds in timings.items():
+            before = baseline.get(scale, {}).get(stage)
+            if before is None or max(before, seconds) < min_seconds:
+                continue
+            if seconds > before * (1 + tolerance):
+                slower.append((scale, stage, before, seconds))
+    return slower
+
+
+def print_results(results, baseline=None):
+    for scale, timings in results.items():
+        print('\n{} ({})'.format(scale, ', '.join('{}={}'.format(key, value)
+                                                  for key, value in SCALES[scale].items())))
+        print('  {:<28s} {:>10s} {:>10s}'.format('stage', 'time [s]', 'baseline'))
+        for stage, seconds in timings.items():
+            before = (baseline or {}).get(scale, {}).get(stage)
+            print('  {:<28s} {:10.3f} {:>10s}'.format(stage, seconds,
+                                                    '' if before is None else '{:.3f}'.format(before)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark analysis stages on synthetic data.')
+    parser.add_argument('--scales', nargs='+', default=['small'], choices=list(SCALES))
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--results', default=RESULTS_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.scales)
+    with open(args.results, 'w') as handle:
+        json.dump(results, handle, indent=2)
+
+    if args.save_baseline:
+        # keep the baseline of scales that were not run
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as handle:
+                baseline = json.load(handle)
+        baseline.update(results)
+        with open(args.baseline, 'w') as handle:
+            json.dump(baseline, handle, indent=2)
+        print_results(results)
+        print('\nsaved baseline to {}'.format(args.baseline))
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    print_results(results, baseline)
+    if baseline is None:
+        print('\nno baseline ({}); run with --save-baseline to create one'.format(args.baseline))
+        return 0
+
+    slower = regressions(results, baseline, args.tolerance)
+    if slower:
+        print('\nREGRESSIONS (more than {:.0f}% slower than the baseline):'.format(args.tolerance*100))
+        for scale, stage, before, seconds in slower:
+            print('  {} / {}: {:.3f} s -> {:.3f} s'.format(scale, stage, before, seconds))
+        return 1
+    print('\nno regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
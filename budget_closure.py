@@ -0,0 +1,90 @@
+"""
+Budget-closure diagnostics for all inlets at once.
+
+All inlets are stacked into one (days x inlets x terms) array
+(see inlet_arrays.py) and every residual and ratio is computed for every
+inlet and period in one pass, instead of in a loop over inlets.
+
+For every inlet and period (the whole record, and each calendar period
+if dates are given) the table has, in mg/L per day:
+    error: TEF error, i.e. the vertical transport of the shallow and deep
+        layers, which should cancel
+    <term>: mean of each deep layer budget term
+    storage residual: d/dt(DO) - sum of the deep layer budget terms
+and the ratios 'error/<term>' of the mean error to the mean of each term.
+
+Example:
+    table = closure_table(inlets,shallowlay_dict,deeplay_dict,
+                          dimensions_dict,kmolm3sec_to_mgLday,dates=dates_data)
+    table.loc['lynchcove']                      # one inlet, all periods
+    table.xs('annual', level='period')          # all inlets, whole record
+"""
+
+import numpy as np
+import pandas as pd
+
+import inlet_arrays
+import grouped_reduction
+
+# deep layer budget terms (their sum should be d/dt(DO))
+BUDGET_TERMS = ['TEF Exchange Flow',
+                'WWTPs',
+                'Vertical Transport',
+                'Photosynthesis',
+                'Bio Consumption']
+
+# label of the whole-record period
+ANNUAL = 'annual'
+
+
+def closure_table(inlets,shallowlay_dict,deeplay_dict,
+                  dimensions_dict,kmolm3sec_to_mgLday,
+                  dates=None,freq='M'):
+    """
+    INPUT:
+        dates: daily DatetimeIndex of the data (one entry per sample);
+            if None, only the whole-record (annual) values are computed
+        freq: calendar period of the other rows (pandas period frequency)
+
+    OUTPUT: DataFrame with index (inlet, period)
+    """
+    # (days x inlets x terms) deep layer terms and (days x inlets) shallow vertical transport
+    deep = inlet_arrays.stack_terms(deeplay_dict, inlets, BUDGET_TERMS + ['d/dt(DO)'])
+    shallow_vertical = inlet_arrays.stack_term(shallowlay_dict, inlets, 'Vertical Transport')
+    ndays = deep.shape[0]
+
+    # convert to mg/L per day
+    scale = kmolm3sec_to_mgLday / inlet_arrays.inlet_volumes(dimensions_dict, inlets)
+    deep = deep * scale[None,:,None]
+    error = (shallow_vertical * scale[None,:] +
+             deep[:,:,BUDGET_TERMS.index('Vertical Transport')])
+    residual = deep[:,:,-1] - deep[:,:,:len(BUDGET_TERMS)].sum(axis=2)
+
+    # (days x inlets x columns): error, budget terms, storage residual
+    values = np.concatenate((error[:,:,None], deep[:,:,:len(BUDGET_TERMS)],
+                             residual[:,:,None]), axis=2)
+
+    # period bounds: whole record first, then calendar periods
+    labels = [ANNUAL]
+    starts = [0]
+    ends = [ndays]
+    if dates is not None:
+        if len(dates) != ndays:
+            raise ValueError('closure_table: {} dates for {} days of data'.format(len(dates), ndays))
+        periods, period_starts, period_ends = grouped_reduction.group_bounds(dates, freq)
+        labels += [str(period) for period in periods]
+        starts = np.concatenate((starts, period_starts))
+        ends = np.concatenate((ends, period_ends))
+
+    # (periods x inlets x columns)
+    means = grouped_reduction.grouped_reduce(values, starts, ends, 'nanmean')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = means[:,:,:1] / means[:,:,1:1+len(BUDGET_TERMS)]
+
+    columns = (['error'] + BUDGET_TERMS + ['storage residual'] +
+               ['error/' + term for term in BUDGET_TERMS])
+    table = np.concatenate((means, ratios), axis=2)
+    # rows ordered inlet by inlet
+    table = table.transpose(1,0,2).reshape(-1, len(columns))
+    index = pd.MultiIndex.from_product([inlets, labels], names=['inlet','period'])
+    return pd.DataFrame(table, index=index, columns=columns)
@@ -1,48 +1,47 @@
 """
 calculate and print error of budget
 expressed as a % of QinDOin and biological consumption
+
+returns the two percentages
+(per-inlet and per-month diagnostics: see budget_closure.py)
 """
 import numpy as np
 
-def budget_error(inlets,shallowlay_dict,deeplay_dict,
-                 dimensions_dict,kmolm3sec_to_mgLday):
+import budget_closure
 
-    print('\n=============================================================')
-    print('========================Budget Error=========================')
-    print('=============================================================\n')
+def budget_error(inlets,shallowlay_dict,deeplay_dict,
+                 dimensions_dict,kmolm3sec_to_mgLday,verbose=True):
 
-    # initialize lists
-    error_QinDOin_ann_avg = []
-    error_consumption_ann_avg = []
+    # annual mean closure diagnostics of all inlets
+    table = budget_closure.closure_table(inlets,shallowlay_dict,deeplay_dict,
+                                         dimensions_dict,kmolm3sec_to_mgLday)
+    error_QinDOin, error_consumption = bulk_error(table)
 
-    for inlet in inlets:
+    # print bulk statistics
+    if verbose:
+        print_budget_error(error_QinDOin,error_consumption)
 
-        # calculate budget error (mg/L per day)
-        error_TEF = (shallowlay_dict[inlet]['Vertical Transport']+deeplay_dict[inlet]['Vertical Transport'])/ (
-            dimensions_dict[inlet]['Inlet volume'].values) * kmolm3sec_to_mgLday
-        inlet_error_ann_avg = np.nanmean(error_TEF)
+    return error_QinDOin, error_consumption
 
-        # calculate QinDOin (mg/L per day)
-        QinDOin = (deeplay_dict[inlet]['TEF Exchange Flow'].values/dimensions_dict[inlet]['Inlet volume'].values) * kmolm3sec_to_mgLday
-        inlet_QinDOin_ann_avg = np.nanmean(QinDOin)
+def bulk_error(table):
+    """
+    Bulk error statistics from a budget_closure.closure_table:
+    mean over inlets of (annual mean error)/(annual mean QinDOin)
+    and of (annual mean error)/(annual mean deep consumption), in %
+    """
+    annual = table.xs(budget_closure.ANNUAL, level='period')
+    error_QinDOin = np.abs(np.nanmean(annual['error/TEF Exchange Flow'])) * 100
+    error_consumption = np.abs(np.nanmean(annual['error/Bio Consumption'])) * 100
+    return error_QinDOin, error_consumption
 
-        # calculate biological consumption in deep layer (mg/L per day)
-        consumption = (deeplay_dict[inlet]['Bio Consumption'].values/dimensions_dict[inlet]['Inlet volume'].values) * kmolm3sec_to_mgLday
-        inlet_consumption_ann_avg = np.nanmean(consumption)
+def print_budget_error(error_QinDOin,error_consumption):
 
-        # add values to list
-        error_QinDOin_ann_avg.append(inlet_error_ann_avg/inlet_QinDOin_ann_avg)
-        error_consumption_ann_avg.append(inlet_error_ann_avg/inlet_consumption_ann_avg)
-        
-    # calculate bulk statistics
-    error_QinDOin = np.abs(np.nanmean(error_QinDOin_ann_avg)) * 100
-    error_consumption = np.abs(np.nanmean(error_consumption_ann_avg)) * 100
+    print('\n=============================================================')
+    print('========================Budget Error=========================')
+    print('=============================================================\n')
 
-    # print bulk statistics
     print('(annual mean error)/(annual mean QinDOin) [expressed as percentage]')
     print('    {}%'.format(round(error_QinDOin,2)))
     print('\n')
     print('(annual mean error)/(annual mean deep consumption) [expressed as percentage]')
-    print('    {}%'.format(round(error_consumption,2)))
-
-    return
\ No newline at end of file
+    print('    {}%'.format(round(error_consumption,2)))
\ No newline at end of file
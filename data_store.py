@@ -0,0 +1,275 @@
+"""
+Columnar on-disk store for the terminal inlet data dictionaries.
+
+The pickled dictionaries in ../DATA_terminal_inlet_DO are nested
+dicts of pandas objects, and unpickling them in full dominates startup
+time and memory. This module converts each dictionary once into a
+directory of .npy files (one array per inlet x budget term) plus a
+json manifest, and reads them back memory-mapped, so callers only
+pay for the inlets and terms they actually touch.
+
+Layout of the store:
+    store_dir/manifest.json
+    store_dir/<dict name>/<key number>/<term number>.npy
+    store_dir/<dict name>/<key number>/<term number>_index.npy (if needed)
+
+Every array is stored with a dtype that can be memory-mapped: tz-aware
+datetimes as int64 nanoseconds (with the time zone in the manifest) and
+strings as fixed-width unicode arrays. Leaves that cannot be converted
+(e.g. mixed Python objects) make build_store fail before the manifest
+entry of their dictionary is written.
+"""
+
+import os
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+# dictionaries read by main.py and the pickle file each one comes from
+DICT_FILES = {
+    'hyp_vol_dict': 'PS_hypoxic_volume_dict.pickle',
+    'hyp_days_dict': 'days_with_bottom_hypoxia_dict.pickle',
+    'hyp_seas_DO_dict': 'mean_hypoxic_season_bottom_DO_dict.pickle',
+    'deeplay_dict': 'deeplay_dict.pickle',
+    'shallowlay_dict': 'shallowlay_dict.pickle',
+    'dimensions_dict': 'dimensions_dict.pickle',
+    'DOconcen_dict': 'DOconcen_dict.pickle',
+}
+
+# default name of the store directory (created inside the data directory)
+STORE_NAME = 'columnar_store'
+MANIFEST = 'manifest.json'
+
+
+def build_store(data_dir, store_dir=None, names=None):
+    """
+    Convert the pickled dictionaries in data_dir to the columnar store.
+    Only dictionaries whose pickle is new or has changed since the
+    last conversion are rewritten, so this is cheap to call every run.
+
+    INPUT:
+        data_dir: directory with the pickled dictionaries
+        store_dir: where to write the store (default: data_dir/columnar_store)
+        names: list of dictionary names to convert (default: all of DICT_FILES)
+
+    OUTPUT: path to the store directory
+    """
+    if store_dir is None:
+        store_dir = os.path.join(data_dir, STORE_NAME)
+    if names is None:
+        names = list(DICT_FILES.keys())
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = read_manifest(store_dir)
+
+    for name in names:
+        pickle_path = os.path.join(data_dir, DICT_FILES[name])
+        if not os.path.exists(pickle_path):
+            continue
+        stat = os.stat(pickle_path)
+        source = {'file': DICT_FILES[name],
+                  'mtime': stat.st_mtime,
+                  'size': stat.st_size}
+        # skip dictionaries that are already up to date
+        if name in manifest and manifest[name]['source'] == source:
+            continue
+        with open(pickle_path, 'rb') as handle:
+            dict_in = pickle.load(handle)
+        # (raises ValueError for leaves that cannot be stored, before
+        # the manifest lists this dictionary)
+        manifest[name] = write_dict(store_dir, name, dict_in)
+        manifest[name]['source'] = source
+        # write the manifest after every dictionary so an interrupted
+        # conversion does not lose the dictionaries already written
+        write_manifest(store_dir, manifest)
+
+    return store_dir
+
+
+def write_dict(store_dir, name, dict_in):
+    """
+    Write one (one- or two-level) dictionary to the store and return
+    its manifest entry. Two-level dictionaries (e.g. deeplay_dict)
+    map inlet -> term -> time series; one-level dictionaries
+    (e.g. hyp_vol_dict) map key -> array.
+    """
+    entry = {'keys': []}
+    for k, (key, value) in enumerate(dict_in.items()):
+        key_dir = os.path.join(store_dir, name, '{:03d}'.format(k))
+        os.makedirs(key_dir, exist_ok=True)
+        key_entry = {'name': key, 'key_type': type(key).__name__}
+        if isinstance(value, (dict, pd.DataFrame)):
+            # two-level dictionary: one array per term
+            key_entry['terms'] = []
+            for t, (term, leaf) in enumerate(value.items()):
+                term_entry = {'name': term}
+                term_entry.update(_save_leaf(key_dir, '{:03d}'.format(t), leaf,
+                                             '{} {} {}'.format(name, key, term)))
+                key_entry['terms'].append(term_entry)
+        else:
+            # one-level dictionary: a single array for this key
+            key_entry['terms'] = None
+            key_entry.update(_save_leaf(key_dir, 'value', value, '{} {}'.format(name, key)))
+        entry['keys'].append(key_entry)
+    return entry
+
+
+class StoredDict(dict):
+    """
+    Dictionary loaded from the store. store_key identifies its source
+    pickle (file, size and mtime, as recorded in the manifest) and the
+    keys and terms loaded, so result_cache.py can key on it instead of
+    hashing every array (the arrays are read-only memory maps).
+    """
+    store_key = None
+
+
+def load_dict(store_dir, name, keys=None, terms=None, mmap=True):
+    """
+    Load a dictionary from the store.
+
+    INPUT:
+        store_dir: path returned by build_store()
+        name: dictionary name (e.g. 'deeplay_dict')
+        keys: list of top-level keys (e.g. inlets) to load (default: all)
+        terms: list of terms to load for two-level dictionaries (default: all)
+        mmap: if True, arrays are memory-mapped instead of read into memory
+
+    OUTPUT: dictionary (StoredDict) with the same keys as the original pickle.
+        Values that were pandas Series are returned as Series backed by
+        the memory-mapped arrays, everything else as numpy arrays.
+    """
+    manifest = read_manifest(store_dir)
+    if name not in manifest:
+        raise KeyError('{} is not in the store at {}'.format(name, store_dir))
+    mmap_mode = 'r' if mmap else None
+
+    dict_out = StoredDict()
+    dict_out.store_key = store_key(store_dir, name, keys, terms, manifest)
+    for k, key_entry in enumerate(manifest[name]['keys']):
+        key = _restore_key(key_entry)
+        if keys is not None and key not in keys:
+            continue
+        key_dir = os.path.join(store_dir, name, '{:03d}'.format(k))
+        if key_entry['terms'] is None:
+            dict_out[key] = _load_leaf(key_dir, 'value', key_entry, mmap_mode)
+            continue
+        dict_out[key] = {}
+        for t, term_entry in enumerate(key_entry['terms']):
+            if terms is not None and term_entry['name'] not in terms:
+                continue
+            dict_out[key][term_entry['name']] = _load_leaf(
+                key_dir, '{:03d}'.format(t), term_entry, mmap_mode)
+    return dict_out
+
+
+def store_key(store_dir, name, keys=None, terms=None, manifest=None):
+    """
+    Identifies a dictionary loaded with load_dict (its source pickle, as
+    recorded in the manifest, and the keys and terms loaded) without
+    loading any data; None if the manifest has no source for it.
+    """
+    if manifest is None:
+        manifest = read_manifest(store_dir)
+    if name not in manifest or 'source' not in manifest[name]:
+        return None
+    return json.dumps({'name': name, 'source': manifest[name]['source'],
+                       'keys': keys, 'terms': terms}, sort_keys=True, default=str)
+
+
+def list_keys(store_dir, name):
+    """
+    Return the top-level keys (e.g. inlet names) of a stored dictionary
+    without loading any data.
+    """
+    manifest = read_manifest(store_dir)
+    return [_restore_key(key_entry) for key_entry in manifest[name]['keys']]
+
+
+def read_manifest(store_dir):
+    manifest_path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as handle:
+        return json.load(handle)
+
+
+def write_manifest(store_dir, manifest):
+    manifest_path = os.path.join(store_dir, MANIFEST)
+    # write to a temporary file first so readers never see a partial manifest
+    with open(manifest_path + '.tmp', 'w') as handle:
+        json.dump(manifest, handle, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _save_leaf(key_dir, stem, leaf, label):
+    # save values (and the index of a Series, if it is not the default one)
+    # returns the manifest entry of the leaf: the kind of object that was
+    # saved and the time zones of tz-aware values, so it can be rebuilt
+    entry = {'kind': 'array'}
+    if isinstance(leaf, pd.Series):
+        entry['kind'] = 'series'
+        index = leaf.index
+        if not index.equals(pd.RangeIndex(len(index))):
+            index, entry['index_tz'] = _storable(index, label + ' (index)')
+            np.save(os.path.join(key_dir, stem + '_index.npy'), index)
+            entry['kind'] = 'series_index'
+    values, entry['tz'] = _storable(leaf, label)
+    np.save(os.path.join(key_dir, stem + '.npy'), values)
+    return {key: value for key, value in entry.items() if value is not None}
+
+
+def _storable(values, label):
+    # array of values with a dtype that can be memory-mapped, and the
+    # time zone of tz-aware datetimes (stored as int64 nanoseconds)
+    if isinstance(getattr(values, 'dtype', None), pd.DatetimeTZDtype):
+        values = pd.DatetimeIndex(values).as_unit('ns')
+        return values.asi8, str(values.tz)
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy()
+    values = np.asarray(values)
+    if values.dtype.hasobject:
+        if pd.api.types.infer_dtype(values, skipna=False) != 'string':
+            raise ValueError('data_store: {} has values of dtype object ({}) that cannot be '
+                             'memory-mapped'.format(label, pd.api.types.infer_dtype(values, skipna=False)))
+        # fixed-width unicode
+        values = values.astype(str)
+    # unpickled datetime arrays can carry dtype metadata that .npy cannot store
+    if values.dtype.metadata is not None:
+        values = values.astype(np.dtype(values.dtype.str))
+    return values, None
+
+
+def _load_leaf(key_dir, stem, entry, mmap_mode):
+    values = _load_array(os.path.join(key_dir, stem + '.npy'), entry.get('tz'), mmap_mode)
+    if entry['kind'] == 'series_index':
+        index = _load_array(os.path.join(key_dir, stem + '_index.npy'), entry.get('index_tz'), mmap_mode)
+        return pd.Series(values, index=index, copy=False)
+    if entry['kind'] == 'series':
+        return pd.Series(values, copy=False)
+    return values
+
+
+def _load_array(path, tz, mmap_mode):
+    # memory-map arrays of plain dtypes only (object arrays written by
+    # older versions of the store cannot be memory-mapped)
+    with open(path, 'rb') as handle:
+        if np.lib.format.read_magic(handle) == (1, 0):
+            dtype = np.lib.format.read_array_header_1_0(handle)[2]
+        else:
+            dtype = np.lib.format.read_array_header_2_0(handle)[2]
+    if dtype.hasobject:
+        values = np.load(path, allow_pickle=True)
+    else:
+        values = np.load(path, mmap_mode=mmap_mode)
+    if tz is not None:
+        # int64 nanoseconds since the epoch (UTC)
+        return pd.DatetimeIndex(pd.to_datetime(np.asarray(values), unit='ns', utc=True)).tz_convert(tz)
+    return values
+
+
+def _restore_key(key_entry):
+    # json turns every key into a string, so restore integer keys
+    if key_entry['key_type'] == 'int':
+        return int(key_entry['name'])
+    return key_entry['name']
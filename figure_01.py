@@ -2,7 +2,6 @@
 Creat map of LiveOcean's Salish Sea and Puget Sound bathymetry
 """
 
-import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 from matplotlib.ticker import MaxNLocator
@@ -10,23 +9,19 @@ import cmocean
 
 import helper_functions
 
-def model_bathy(grid_ds):
+def model_bathy(grid):
+    """
+    grid: GridGeometry of the LiveOcean grid (see grid_geometry.py)
+    """
 
     background = 'white'
 
     # Get LiveOcean grid info --------------------------------------------------
 
-    # get the grid data
-    z = -grid_ds.h.values
-    mask_rho = np.transpose(grid_ds.mask_rho.values)
-    lon = grid_ds.lon_rho.values
-    lat = grid_ds.lat_rho.values
-    X = lon[0,:] # grid cell X values
-    Y = lat[:,0] # grid cell Y values
-    plon, plat = helper_functions.get_plon_plat(lon,lat)
-    # make a version of z with nans where masked
-    zm = z.copy()
-    zm[np.transpose(mask_rho) == 0] = np.nan
+    # psi grid and depth with nans where masked
+    plon = grid.plon
+    plat = grid.plat
+    zm = grid.zm
 
     # Create bathymetry plot --------------------------------------------------------------
 
@@ -38,11 +33,15 @@ def model_bathy(grid_ds):
 
     # Salish Sea ----------------------------------------------------------
     ax0 = fig.add_subplot(1,2,1)
-    cs = ax0.pcolormesh(plon, plat, zm*-1, vmin=0, vmax=250, cmap=newcmap)
-    helper_functions.dar(ax0)
+    xlim = [-124.98549,-122]  # Salish Sea
+    ylim = [46.8165519,50.39679] # Salish Sea
+    # only plot the part of the grid that is visible
+    cs = helper_functions.pcolormesh_cropped(ax0, plon, plat, zm*-1, xlim, ylim, grid.index,
+                                             vmin=0, vmax=250, cmap=newcmap)
     # Set axis limits
-    ax0.set_xlim(-124.98549,-122)  # Salish Sea
-    ax0.set_ylim(46.8165519,50.39679) # Salish Sea
+    ax0.set_xlim(xlim)
+    ax0.set_ylim(ylim)
+    helper_functions.dar(ax0)
 
     plt.xticks(rotation=30,horizontalalignment='right',fontsize=12)
     plt.yticks(fontsize=12)
@@ -85,16 +84,19 @@ def model_bathy(grid_ds):
 
     # Puget Sound ----------------------------------------------------------
     ax1 = fig.add_subplot(1,2,2)
-    cs = ax1.pcolormesh(plon, plat, zm*-1, vmin=0, vmax=250, cmap=newcmap)
+    xlim = [-123.3,-122.1]
+    ylim = [46.93,48.45]
+    cs = helper_functions.pcolormesh_cropped(ax1, plon, plat, zm*-1, xlim, ylim, grid.index,
+                                             vmin=0, vmax=250, cmap=newcmap)
     cbar = plt.colorbar(cs,ax=ax1, location='right', pad=0.05)
     cbar.ax.tick_params(labelsize=11)
     cbar.ax.set_ylabel('Depth [m]', fontsize=11)
     cbar.outline.set_visible(False)
     # format figure
-    helper_functions.dar(ax1)
     # Set axis limits
-    ax1.set_xlim([-123.3,-122.1])
-    ax1.set_ylim([46.93,48.45])
+    ax1.set_xlim(xlim)
+    ax1.set_ylim(ylim)
+    helper_functions.dar(ax1)
     ax1.set_yticklabels([])
     ax1.set_xticklabels([])
     # add title
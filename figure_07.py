@@ -4,7 +4,6 @@ Plot time series of Puget Sound hypoxic volume
 
 import matplotlib.dates as mdates
 import numpy as np
-import xarray as xr
 import matplotlib.patches as patches
 import pandas as pd
 import cmocean
@@ -13,7 +12,11 @@ import matplotlib.pylab as plt
 import helper_functions
 
 
-def hypoxic_volume(grid_ds,hyp_vol_dict,PSbox_ds):
+def hypoxic_volume(grid,hyp_vol_dict,PSbox):
+    """
+    grid, PSbox: GridGeometry of the LiveOcean grid and of the
+    Puget Sound sub-domain (see grid_geometry.py)
+    """
 
     years =  ['2014','2015','2016','2017','2018','2019']
 
@@ -22,16 +25,10 @@ def hypoxic_volume(grid_ds,hyp_vol_dict,PSbox_ds):
     ##############################################################
 
     # get the grid data
-    z = -grid_ds.h.values
-    mask_rho = np.transpose(grid_ds.mask_rho.values)
-    lon = grid_ds.lon_rho.values
-    lat = grid_ds.lat_rho.values
-    plon, plat = helper_functions.get_plon_plat(lon,lat)
-    # make a version of z with nans where masked
-    # this gives us a binary map of land and water cells
-    zm = z.copy()
-    zm[np.transpose(mask_rho) == 0] = np.nan
-    zm[np.transpose(mask_rho) != 0] = -1
+    plon = grid.plon
+    plat = grid.plat
+    # binary map of land (nan) and water (-1) cells
+    zm = grid.land_water(-1)
 
     ##############################################################
     ##             Plot hypoxic volume time series              ##
@@ -55,28 +52,22 @@ def hypoxic_volume(grid_ds,hyp_vol_dict,PSbox_ds):
     ax0.set_ylabel('Latitude', fontsize=12)
     ax0.set_xlabel('Longitude', fontsize=12)
     ax0.tick_params(axis='both', labelsize=12)
-    ax0.pcolormesh(plon, plat, zm, vmin=-8, vmax=0, cmap=plt.get_cmap(cmocean.cm.ice))
+    # only plot the part of the grid that is visible
+    helper_functions.pcolormesh_cropped(ax0, plon, plat, zm, [xmin,xmax], [ymin,ymax], grid.index,
+                                        vmin=-8, vmax=0, cmap=plt.get_cmap(cmocean.cm.ice))
     helper_functions.dar(ax0)
     # Create a Rectangle patch to omit Straits
-    # get lat and lon
-    lons = PSbox_ds.coords['lon_rho'].values
-    lats = PSbox_ds.coords['lat_rho'].values
-    lon = lons[0,:]
-    lat = lats[:,0]
     # Straits
     lonmax = -122.76
     lonmin = xmin
     latmax = ymax
     latmin = 48.14
-    # convert lat/lon to eta/xi
-    diff = np.absolute(lon-lonmin)
-    ximin = diff.argmin()
-    diff = np.absolute(lon-lonmax)
-    ximax = diff.argmin()
-    diff = np.absolute(lat-latmin)
-    etamin = diff.argmin()
-    diff = np.absolute(lat-latmax)
-    etamax = diff.argmin()
+    # convert lat/lon to eta/xi (nearest grid cell of both corners)
+    eta, xi, _ = PSbox.index.nearest([lonmin,lonmax], [latmin,latmax])
+    etamin, etamax = eta
+    ximin, ximax = xi
+    lon = PSbox.lon[0,:]
+    lat = PSbox.lat[:,0]
     rect = patches.Rectangle((lon[ximin], lat[etamin]), lon[ximax]-lon[ximin], lat[etamax]-lat[etamin],
                             edgecolor='none', facecolor='white', alpha=0.9)
     # Add the patch to the Axes
@@ -91,7 +82,7 @@ def hypoxic_volume(grid_ds,hyp_vol_dict,PSbox_ds):
     startdate = '2020.01.01'
     enddate = '2020.12.31'
     dates = pd.date_range(start= startdate, end= enddate, freq= '1d')
-    dates_local = [helper_functions.get_dt_local(x) for x in dates]
+    dates_local = helper_functions.get_dt_local_index(dates)
 
     # plot timeseries
     for i,year in enumerate(years):
@@ -11,7 +11,11 @@ import matplotlib.pylab as plt
 import helper_functions
 
 
-def pugetsound_hyp_map(grid_ds,PSbox_ds,hyp_days_dict,hyp_seas_DO_dict):
+def pugetsound_hyp_map(grid,PSbox,hyp_days_dict,hyp_seas_DO_dict):
+    """
+    grid, PSbox: GridGeometry of the LiveOcean grid and of the
+    Puget Sound sub-domain (see grid_geometry.py)
+    """
 
     # Puget Sound region
     xmin = -123.29
@@ -21,15 +25,10 @@ def pugetsound_hyp_map(grid_ds,PSbox_ds,hyp_days_dict,hyp_seas_DO_dict):
 
 
     # Get LiveOcean grid info 
-    z = -grid_ds.h.values
-    mask_rho = np.transpose(grid_ds.mask_rho.values)
-    lon = grid_ds.lon_rho.values
-    lat = grid_ds.lat_rho.values
-    plon, plat = helper_functions.get_plon_plat(lon,lat)
-    # make a version of z with nans where masked
-    zm = z.copy()
-    zm[np.transpose(mask_rho) == 0] = np.nan
-    zm[np.transpose(mask_rho) != 0] = -1.1
+    plon = grid.plon
+    plat = grid.plat
+    # binary map of land (nan) and water (-1.1) cells
+    zm = grid.land_water(-1.1)
 
 
     ##############################################################
@@ -39,18 +38,20 @@ def pugetsound_hyp_map(grid_ds,PSbox_ds,hyp_days_dict,hyp_seas_DO_dict):
     # Create map of Puget Sound (fully grey)
     fig = plt.figure(figsize=(11,9))
     ax = fig.add_subplot(1,2,1)
-    plt.pcolormesh(plon, plat, zm, linewidth=0.5, vmin=-1.5, vmax=0, cmap=plt.get_cmap('Greys'))
+    # (only the part of the grid inside the Puget Sound region is plotted)
+    helper_functions.pcolormesh_cropped(ax, plon, plat, zm, [xmin,xmax], [ymin,ymax], grid.index,
+                                        linewidth=0.5, vmin=-1.5, vmax=0, cmap=plt.get_cmap('Greys'))
 
     # get average number of days that each grid cell experiences bottom hypoxia every year
     DO_days = hyp_days_dict['avg']
 
     # get lat and lon for plotting
-    lons = PSbox_ds.coords['lon_rho'].values
-    lats = PSbox_ds.coords['lat_rho'].values
-    px, py = helper_functions.get_plon_plat(lons,lats)
+    px = PSbox.plon
+    py = PSbox.plat
 
     # plot average number of days that each grid cell experiences bottom hypoxia every year
-    cs = ax.pcolormesh(px,py,DO_days, vmin=0, vmax=np.nanmax(DO_days), cmap='rainbow')
+    cs = helper_functions.pcolormesh_cropped(ax, px, py, DO_days, [xmin,xmax], [ymin,ymax], PSbox.index,
+                                             vmin=0, vmax=np.nanmax(DO_days), cmap='rainbow')
     cbar = fig.colorbar(cs)
     cbar.ax.tick_params(labelsize=12)
     cbar.outline.set_visible(False)
@@ -86,7 +87,8 @@ def pugetsound_hyp_map(grid_ds,PSbox_ds,hyp_days_dict,hyp_seas_DO_dict):
     cmap = plt.cm.get_cmap('rainbow_r', 10)
     vmin = 0
     vmax = 10
-    cs = ax.pcolormesh(px,py,hyp_seas_DO_dict['avg'], vmin=vmin, vmax=vmax, cmap=cmap)
+    cs = helper_functions.pcolormesh_cropped(ax, px, py, hyp_seas_DO_dict['avg'], [xmin,xmax], [ymin,ymax], PSbox.index,
+                                             vmin=vmin, vmax=vmax, cmap=cmap)
     cbar = fig.colorbar(cs, location='right')
     cbar.ax.tick_params(labelsize=12)
     cbar.outline.set_visible(False)
@@ -2,6 +2,7 @@
 plot monthly mean DOdeep vs. % hypoxic volume
 and monthly mean DOdeep time series
 """
+import numpy as np
 import matplotlib.pylab as plt
 import matplotlib.dates as mdates
 import helper_functions
@@ -41,14 +42,13 @@ def dodeep_hypvol_timeseries(MONTHLYmean_DOdeep,
     # add drawdown period
     ax[1].axvline(dates_local_daily[minday],0,12,color='grey')
     ax[1].axvline(dates_local_daily[maxday],0,12,color='grey')
-    # loop through inlets
-    for i,inlet in enumerate(inlets):
-        # get average deep layer DO
-        deep_lay_DO_alltime = DOconcen_dict[inlet]['Deep Layer DO']
-        # 30-day hanning window
-        deep_lay_DO_alltime = helper_functions.lowpass(deep_lay_DO_alltime.values,n=30)
-        # plot
-        ax[1].plot(dates_local_daily,deep_lay_DO_alltime,linewidth=1,color='navy',alpha=0.5)
+    # stack deep layer DO of all inlets into one (time x inlets) array
+    deep_lay_DO_alltime = np.stack([DOconcen_dict[inlet]['Deep Layer DO'].values for inlet in inlets], axis=1)
+    # 30-day hanning window (all inlets filtered in one call)
+    # gaps are skipped as long as half of the window weight is valid data
+    deep_lay_DO_alltime = helper_functions.lowpass(deep_lay_DO_alltime,n=30,min_coverage=0.5)
+    # plot (one line per inlet)
+    ax[1].plot(dates_local_daily,deep_lay_DO_alltime,linewidth=1,color='navy',alpha=0.5)
 
     # format labels
     ax[1].set_xlim([dates_local_hrly[0],dates_local_hrly[-2]])
@@ -3,20 +3,69 @@ Plots example budget for Lynch Cove
 and plots barcharts of budget terms for hypoxic and oxygenated inlets
 during the drawdown period (June 15 through August 15).
 
-Also conducts Welch's t-test to test whether biological drawdown rate
-or net decrease rates are different between hypoxic and oxygenated inlets.
+The Welch's t-tests of whether biological drawdown rate or net decrease
+rates are different between hypoxic and oxygenated inlets are done
+in group_stats.py (on the group averages from get_group_averages).
 """
 import numpy as np
 import matplotlib.pylab as plt
 import matplotlib.dates as mdates
-from scipy.stats import shapiro
-from scipy.stats import bartlett
-from scipy.stats import ttest_ind
 import helper_functions
+import inlet_arrays
+import inlet_rates
+
+# budget terms that are not shown in panel (c) (distinct terms)
+# and panel (d) (combined terms)
+SKIP_DISTINCT = ['WWTPs',
+                 'Exchange Flow & Vertical',
+                 'Photosynthesis & Consumption',
+                 'Volume',
+                 'Qin m3/s']
+SKIP_COMBINED = ['TEF Exchange Flow',
+                 'WWTPs',
+                 'Vertical Transport',
+                 'Photosynthesis',
+                 'Bio Consumption',
+                 'Volume',
+                 'Qin m3/s']
+
+def get_group_averages(rates,hyp_inlets,minday,maxday):
+    """
+    Drawdown-period rates [mg/L per day] of every inlet,
+    split into oxygenated and hypoxic inlets.
+
+    rates: inlet_rates.InletRates of the deep layer
+
+    returns [oxy_dict, hyp_dict, oxy_dict_combined, hyp_dict_combined],
+    dictionaries of {budget term: list of inlet values} for the
+    distinct terms (panel c) and the combined terms (panel d)
+    """
+    # time average normalized by volume of every inlet and term
+    avg = rates.reduce(minday,maxday)
+    groups = rates.split_groups(hyp_inlets)
+
+    group_averages = []
+    for skip in [SKIP_DISTINCT, SKIP_COMBINED]:
+        # skip variables we are not interested in
+        terms = [term for term in rates.terms if term not in skip]
+        for group in groups:
+            group_averages.append({term: [avg[rates.inlet_index[inlet],rates.term_index[term]] for inlet in group]
+                                   for term in terms})
+
+    return group_averages
 
 def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
                     dates_local_hrly,dates_local_daily,hyp_inlets,
-                    minday,maxday,kmolm3sec_to_mgLday): 
+                    minday,maxday,kmolm3sec_to_mgLday,
+                    rates=None,group_averages=None):
+    """
+    rates: inlet_rates.InletRates of the deep layer (built here if None)
+    group_averages: output of get_group_averages (computed here if None)
+    """
+
+    # volume-normalized rates [mg/L per day]
+    if rates is None:
+        rates = inlet_rates.InletRates(deeplay_dict,inlets,kmolm3sec_to_mgLday)
 
     # initialize figure
     fig, ax = plt.subplots(4,1,figsize=(9.1,9.5))
@@ -42,17 +91,30 @@ def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
 
     # plot deep budget time series
     nwin = 10 # hanning window length
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['d/dt(DO)'].values,n=nwin),color='k',
+    # stack all budget terms into one (time x terms) array and filter them in one call
+    # (taken from the inlet dataset array in one step, see inlet_arrays.py)
+    deep = inlet_arrays.stack_terms(deeplay_dict, [inlet], ['d/dt(DO)','Vertical Transport','TEF Exchange Flow',
+                                                            'Photosynthesis','Bio Consumption'])[:,0]
+    shallow_vertical = inlet_arrays.stack_term(shallowlay_dict, [inlet], 'Vertical Transport')[:,0]
+    budget_terms = np.stack([deep[:,0],
+                             deep[:,1] + shallow_vertical,
+                             deep[:,2],
+                             deep[:,1],
+                             deep[:,3],
+                             deep[:,4]], axis=1)
+    # gaps are skipped as long as half of the window weight is valid data
+    budget_terms = helper_functions.lowpass(budget_terms,n=nwin,min_coverage=0.5)
+    ax[0].plot(dates_local_daily,budget_terms[:,0],color='k',
                 linewidth=2,label=r'$\frac{d}{dt}\int_V$DO dV',zorder=5)
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['Vertical Transport'].values + shallowlay_dict[inlet]['Vertical Transport'].values,n=nwin),
+    ax[0].plot(dates_local_daily,budget_terms[:,1],
                 color='darkorange', linewidth=2,label='Error')
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['TEF Exchange Flow'].values,n=nwin),color='#0D4B91',
+    ax[0].plot(dates_local_daily,budget_terms[:,2],color='#0D4B91',
             linewidth=3,label='Exchange Flow')
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['Vertical Transport'].values,n=nwin),color='#99C5F7',
+    ax[0].plot(dates_local_daily,budget_terms[:,3],color='#99C5F7',
             linewidth=3,label='Vertical')
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['Photosynthesis'].values,n=nwin),color='#8F0445',
+    ax[0].plot(dates_local_daily,budget_terms[:,4],color='#8F0445',
                 linewidth=3, label='Photosynthesis')
-    ax[0].plot(dates_local_daily,helper_functions.lowpass(deeplay_dict[inlet]['Bio Consumption'].values,n=nwin),color='#FCC2DD',
+    ax[0].plot(dates_local_daily,budget_terms[:,5],color='#FCC2DD',
                 linewidth=3,label='Consumption')
     ax[0].legend(loc='lower right',ncol=6, fontsize=9, handletextpad=0.15)
 
@@ -75,8 +137,13 @@ def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
     ax[1].set_ylim([-0.3,0.3])
     # set bar width
     width = 0.2
+    # drawdown-period time average divided by the time-averaged volume [mg/L per day]
+    # (ratio of the means, not the mean of the daily rates used in panels (c) and (d))
+    term_avg = np.nanmean(inlet_arrays.stack_terms(deeplay_dict,[inlet],rates.terms)[minday:maxday,0], axis=0)
+    volume_avg = np.nanmean(inlet_arrays.stack_term(deeplay_dict,[inlet],'Volume')[minday:maxday,0])
+    inlet_avg = term_avg / volume_avg * kmolm3sec_to_mgLday
     # create bar chart
-    for attribute, measurement in deeplay_dict[inlet].items():
+    for attribute in rates.terms:
         # skip variables we are not interested in
         if attribute in ['WWTPs',
                         'Exchange Flow & Vertical',
@@ -106,12 +173,7 @@ def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
             label = r'$\frac{d}{dt}$DO (net decrease)'
             pos = -0.2
 
-        # calculate time average
-        time_avg = np.nanmean(measurement[minday:maxday])
-        # get volume average
-        avg = time_avg/(np.nanmean(deeplay_dict[inlet]['Volume'][minday:maxday])) # kmol O2 /s /m3
-        # convert to mg/L per day
-        avg = avg * kmolm3sec_to_mgLday
+        avg = inlet_avg[rates.term_index[attribute]]
 
         # plot bars
         ax[1].bar(pos, avg, width, zorder=5, align='center', edgecolor=color,color=color, label=label)
@@ -146,76 +208,11 @@ def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
     ax[2].set_ylim([-2.5,2.5])
     ax[3].set_ylim([-0.35,0.25])
 
-    # create a new dictionary of results
-    oxy_dict = {}
-    hyp_dict = {}
-    
-    for inlet in inlets:
-        for attribute, measurement in deeplay_dict[inlet].items():
-            # skip variables we are not interested in
-            if attribute in ['WWTPs',
-                            'Exchange Flow & Vertical',
-                            'Photosynthesis & Consumption',
-                            'Volume',
-                            'Qin m3/s']:
-                continue
-            # calculate time average normalized by volume
-            avg = np.nanmean(measurement[minday:maxday]/(deeplay_dict[inlet]['Volume'][minday:maxday])) # kmol O2 /s /m3
-            # convert to mg/L per day
-            avg = avg * kmolm3sec_to_mgLday
-
-            # save values in dictionary
-            if inlet in hyp_inlets:
-                if attribute in hyp_dict.keys():
-                    hyp_dict[attribute].append(avg)
-                else:
-                    hyp_dict[attribute] = [avg]
-            else:
-                if attribute in oxy_dict.keys():
-                    oxy_dict[attribute].append(avg)
-                else:
-                    oxy_dict[attribute] = [avg]
-
-    # t-test for d/dt(DO)
-    print('\n=============================================================')
-    print('=================Welch\'s t-test for d/dt(DO)=================')
-    print('=============================================================\n')
-    for attribute in oxy_dict:
-        if attribute == 'd/dt(DO)':
-            a = oxy_dict[attribute]
-            b = hyp_dict[attribute]
-            # Perform Shapiro-Wilk test
-            print(' 1. Check that inlet-level mean d/dt(DO) rates of oxygenated')
-            print('    and hypoxic groups are normally distributed')
-            print('      Shapiro-Wilk test (p < 0.05 means data are NOT normally distributed)\n')
-            stat,shapiro_test_oxy_p = shapiro(a)
-            stat,shapiro_test_hyp_p = shapiro(b)
-            print('        p = {} for oxygenated inlets'.format(round(shapiro_test_oxy_p,3)))
-            print('        p = {} for hypoxic inlets'.format(round(shapiro_test_hyp_p,3)))
-            print('        => Data are normally distributed\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Perform Bartlett's test
-            print(' 2. Check whether d/dt(DO) rates of oxygenated and hypoxic')
-            print('    inlet groups have similar variances')
-            print('      Bartlett\'s test (p < 0.05 means variances are significantly different)\n')
-            sta,bartlett_p_value = bartlett(a, b)
-            print('        p = {}'.format(round(bartlett_p_value,3)))
-            print('        => Variances are significantly different\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Conduct Welch's t-test
-            print(' 3. Check whether group-level mean d/dt(DO) rates of oxygenated')
-            print('    and hypoxic groups are statistically similar')
-            print('      Welch\'s t-test')
-            print('      Null hypothesis: d/dt(DO) of hypoxic and oxygenated inlets is the same')
-            print('      p < 0.05 means we reject null hypothesis\n')
-            ttest,p_value = ttest_ind(a, b, axis=0, equal_var=False)
-            print('        p = {}'.format(round(p_value,3)))
-            print('        => d/dt(DO) of hypoxic and oxygenated inlets are statistically similar\n')
-        else:
-            continue
-
+    # get drawdown-period group averages (if not precomputed)
+    if group_averages is None:
+        group_averages = get_group_averages(rates,hyp_inlets,minday,maxday)
+    [oxy_dict, hyp_dict, oxy_dict_combined, hyp_dict_combined] = group_averages
 
-    print('\n')
     for i,dict in enumerate([oxy_dict,hyp_dict]):
     # average all oxygenated and hypoxic inlet rate values
         if i ==0:
@@ -291,114 +288,9 @@ def budget_barchart(inlets,shallowlay_dict,deeplay_dict,
     multiplier_deep1 = 0
     multiplier_deep2 = 0
 
-    # create a new dictionary of results
-    oxy_dict = {}
-    hyp_dict = {}
-
-    for inlet in inlets:
-        for attribute, measurement in deeplay_dict[inlet].items():
-            # skip variables we are not interested in
-            if attribute in ['TEF Exchange Flow',
-                            'WWTPs',
-                            'Vertical Transport',
-                            'Photosynthesis',
-                            'Bio Consumption',
-                            'Volume',
-                            'Qin m3/s']:
-                continue
-                # calculate time average normalized by volume
-            avg = np.nanmean(measurement[minday:maxday]/(deeplay_dict[inlet]['Volume'][minday:maxday])) # kmol O2 /s /m3
-            # convert to mg/L per day
-            avg = avg * kmolm3sec_to_mgLday
-
-            # save values in dictionary
-            if inlet in ['penn','case','holmes','portsusan','lynchcove','dabob']:
-                if attribute in hyp_dict.keys():
-                    hyp_dict[attribute].append(avg)
-                else:
-                    hyp_dict[attribute] = [avg]
-            else:
-                if attribute in oxy_dict.keys():
-                    oxy_dict[attribute].append(avg)
-                else:
-                    oxy_dict[attribute] = [avg]
-
-    # t-test for Photosynthesis & Consumption
-    print('\n=============================================================')
-    print('=======Welch\'s t-test for Photosynthesis & Consumption=======')
-    print('=============================================================\n')
-    for attribute in oxy_dict:
-        if attribute == 'Photosynthesis & Consumption':
-            a = oxy_dict[attribute]
-            b = hyp_dict[attribute]
-            # Perform Shapiro-Wilk test
-            print(' 1. Check that inlet-level mean Photosynthesis & Consumption of oxygenated')
-            print('    and hypoxic groups are normally distributed')
-            print('      Shapiro-Wilk test (p < 0.05 means data are NOT normally distributed)\n')
-            stat,shapiro_test_oxy_p = shapiro(a)
-            stat,shapiro_test_hyp_p = shapiro(b)
-            print('        p = {} for oxygenated inlets'.format(round(shapiro_test_oxy_p,3)))
-            print('        p = {} for hypoxic inlets'.format(round(shapiro_test_hyp_p,3)))
-            print('        => Data are normally distributed\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Perform Bartlett's test
-            print(' 2. Check whether Photosynthesis & Consumption of oxygenated and hypoxic')
-            print('    inlet groups have similar variances')
-            print('      Bartlett\'s test (p < 0.05 means variances are significantly different)\n')
-            sta,bartlett_p_value = bartlett(a, b)
-            print('        p = {}'.format(round(bartlett_p_value,3)))
-            print('        => Variances are significantly different\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Conduct Welch's t-test
-            print(' 3. Check whether group-level mean Photosynthesis & Consumption of oxygenated')
-            print('    and hypoxic groups are statistically similar')
-            print('      Welch\'s t-test')
-            print('      Null hypothesis: Photosynthesis & Consumption of hypoxic and oxygenated inlets is the same')
-            print('      p < 0.05 means we reject null hypothesis\n')
-            ttest,p_value = ttest_ind(a, b, axis=0, equal_var=False)
-            print('        p = {}'.format(round(p_value,3)))
-            print('        => Photosynthesis & Consumption of hypoxic and oxygenated inlets are statistically similar\n')
-        else:
-            continue
-
-    # t-test for Exchange Flow & Vertical
-    print('\n=============================================================')
-    print('=========Welch\'s t-test for Exchange Flow & Vertical=========')
-    print('=============================================================\n')
-    for attribute in oxy_dict:
-        if attribute == 'Exchange Flow & Vertical':
-            a = oxy_dict[attribute]
-            b = hyp_dict[attribute]
-            # Perform Shapiro-Wilk test
-            print(' 1. Check that inlet-level mean Exchange Flow & Vertical of oxygenated')
-            print('    and hypoxic groups are normally distributed')
-            print('      Shapiro-Wilk test (p < 0.05 means data are NOT normally distributed)\n')
-            stat,shapiro_test_oxy_p = shapiro(a)
-            stat,shapiro_test_hyp_p = shapiro(b)
-            print('        p = {} for oxygenated inlets'.format(round(shapiro_test_oxy_p,3)))
-            print('        p = {} for hypoxic inlets'.format(round(shapiro_test_hyp_p,3)))
-            print('        => Data are normally distributed\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Perform Bartlett's test
-            print(' 2. Check whether Exchange Flow & Vertical of oxygenated and hypoxic')
-            print('    inlet groups have similar variances')
-            print('      Bartlett\'s test (p < 0.05 means variances are significantly different)\n')
-            sta,bartlett_p_value = bartlett(a, b)
-            print('        p = {}'.format(round(bartlett_p_value,3)))
-            print('        => Variances are significantly different\n')
-            print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
-            # Conduct Welch's t-test
-            print(' 3. Check whether group-level mean Exchange Flow & Vertical of oxygenated')
-            print('    and hypoxic groups are statistically similar')
-            print('      Welch\'s t-test')
-            print('      Null hypothesis: Exchange Flow & Vertical of hypoxic and oxygenated inlets is the same')
-            print('      p < 0.05 means we reject null hypothesis\n')
-            ttest,p_value = ttest_ind(a, b, axis=0, equal_var=False)
-            print('        p = {}'.format(round(p_value,3)))
-            print('        => Exchange Flow & Vertical of hypoxic and oxygenated inlets are statistically similar\n')
-        else:
-            continue
-
+    # combined terms
+    oxy_dict = oxy_dict_combined
+    hyp_dict = hyp_dict_combined
 
     for i,dict in enumerate([oxy_dict,hyp_dict]):
     # average all oxygenated and hypoxic inlet rate values
@@ -6,9 +6,11 @@ during the drawdown period (June 15 through August 15).
 import numpy as np
 import matplotlib.pylab as plt
 
-def net_decrease_boxplots(dimensions_dict,deeplay_dict,
+def net_decrease_boxplots(dimensions_dict,rates,
                             minday,maxday):
-    
+    """
+    rates: inlet_rates.InletRates of the deep layer
+    """
 
     # initialize figure
     fig, ax = plt.subplots(1,1,figsize = (10,5.5))
@@ -19,6 +21,11 @@ def net_decrease_boxplots(dimensions_dict,deeplay_dict,
     ax.set_ylabel(r'$d/dt$DO [mg/L per day]', fontsize=12)
     ax.set_ylim([-0.55,0.4])
 
+    # drawdown-period net decrease rates [mg/L per day]
+    # (inlet x day) and their time means (inlet)
+    storage = rates.window(minday,maxday)[:,rates.term_index['d/dt(DO)']]
+    storage_means = rates.reduce(minday,maxday)[:,rates.term_index['d/dt(DO)']]
+
     # initialize lists to store net decrease rates
     storage_all = []
     storage_mean = []
@@ -34,15 +41,9 @@ def net_decrease_boxplots(dimensions_dict,deeplay_dict,
 
     for i,station in enumerate(stations_sorted):
         
-        # get daily net decrease rate
-        storage_daily =  deeplay_dict[station]['d/dt(DO)'][minday:maxday]/(deeplay_dict[station]['Volume'][minday:maxday]) # kmol O2 /s /m3
-        
-        # convert to mg/L per day
-        storage_daily = storage_daily.values * 1000 * 32 * 60 * 60 * 24
-
-        # add to array
-        storage_all.append(list(storage_daily))
-        storage_mean.append(np.nanmean(storage_daily))
+        # add daily net decrease rates to array
+        storage_all.append(list(storage[rates.inlet_index[station]]))
+        storage_mean.append(storage_means[rates.inlet_index[station]])
 
 
     # create boxplot
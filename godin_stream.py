@@ -0,0 +1,96 @@
+"""
+Streaming Godin 24-24-25 filter for hourly data that arrives in chunks.
+
+lowpass(data, f='godin') needs the whole record in memory, so adding a
+day of new model output means refiltering everything. GodinStream keeps
+only the last 70 hours it has seen and emits each tidally averaged value
+as soon as the 71-hour window centered on it is full, so an update costs
+O(chunk) instead of O(record).
+
+The values emitted are identical to the interior (non nan-padded) values
+of helper_functions.lowpass(data, f='godin') for the concatenated record.
+
+Example (daily operational update):
+    stream = GodinStream.load('godin_state.npz')   # or GodinStream()
+    start, filtered = stream.update(new_hourly_values)
+    stream.save('godin_state.npz')
+"""
+
+import numpy as np
+
+import helper_functions
+
+
+class GodinStream:
+
+    def __init__(self):
+        # Godin filter weights (71 hours)
+        self.filt = helper_functions.godin_shape()
+        self.nf = len(self.filt)
+        # last nf-1 samples seen, time on axis 0 (allocated on first update)
+        self.buffer = None
+        # number of valid samples in the buffer
+        self.nbuffer = 0
+        # total number of samples received so far
+        self.nseen = 0
+
+    def update(self, chunk):
+        """
+        Add new hourly samples and return the filtered values that
+        became available.
+
+        INPUT: chunk: array with time on axis 0 (any number of other
+            dimensions, which must be the same for every chunk)
+
+        OUTPUT: start, filtered
+            start: index (counted from the first sample ever received)
+                of the hour that filtered[0] is centered on
+            filtered: array of filtered values, time on axis 0
+                (empty along axis 0 if no window was completed)
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        if self.buffer is None:
+            self.buffer = np.zeros((self.nf-1,) + chunk.shape[1:])
+        elif chunk.shape[1:] != self.buffer.shape[1:]:
+            raise ValueError('GodinStream: chunk shape {} does not match previous chunks {}'.format(
+                chunk.shape[1:], self.buffer.shape[1:]))
+
+        # samples available for filtering: what is buffered plus the new chunk
+        data = np.concatenate((self.buffer[:self.nbuffer], chunk), axis=0)
+        nout = max(len(data) - self.nf + 1, 0)
+        # the first output is centered half a window after the oldest buffered sample
+        start = self.nseen - self.nbuffer + self.nf//2
+
+        # "valid" convolution of the available samples with the filter
+        filtered = np.zeros((nout,) + chunk.shape[1:])
+        for j in range(self.nf):
+            filtered += self.filt[self.nf-1-j] * data[j:j+nout]
+
+        # keep only the samples still needed for the next window
+        keep = min(len(data), self.nf-1)
+        self.buffer[:keep] = data[len(data)-keep:]
+        self.nbuffer = keep
+        self.nseen += len(chunk)
+
+        return start, filtered
+
+    def save(self, path):
+        """
+        Save the filter state (e.g. at the end of a daily run).
+        """
+        np.savez(path, buffer=self.buffer if self.buffer is not None else np.zeros(0),
+                 nbuffer=self.nbuffer, nseen=self.nseen,
+                 initialized=self.buffer is not None)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Restore a filter state written by save().
+        """
+        stream = cls()
+        with np.load(path) as state:
+            if state['initialized']:
+                stream.buffer = state['buffer']
+            stream.nbuffer = int(state['nbuffer'])
+            stream.nseen = int(state['nseen'])
+        return stream
@@ -0,0 +1,140 @@
+"""
+Grid geometry computed once from a LiveOcean grid file
+and shared by all map figures.
+
+GridGeometry holds the rho-grid lon/lat, the psi grid (plon, plat) from
+helper_functions.get_plon_plat, and (if the file has them) the depth h,
+the land/water mask and the masked depth zm. The arrays are saved to
+<grid file>.geometry.npz next to the grid file, so later runs only do
+one cheap load instead of rebuilding the psi grid and masks in every
+figure.
+
+The grid file is read through lazy_grid.LazyGrid, so with xlim/ylim
+only the index window covering that lon/lat box is read.
+
+Example:
+    grid = load_grid_geometry('../DATA_terminal_inlet_DO/LO_cas7_grid.nc',
+                              xlim=[-123.3,-122.1], ylim=[46.93,48.45])
+    ax.pcolormesh(grid.plon, grid.plat, -grid.zm)
+"""
+
+import os
+import numpy as np
+
+import helper_functions
+import lazy_grid
+import spatial_index
+
+# suffix of the saved geometry file
+SUFFIX = '.geometry.npz'
+
+
+class GridGeometry:
+
+    def __init__(self, lon, lat, plon=None, plat=None, h=None, mask=None):
+        # rho grid
+        self.lon = lon
+        self.lat = lat
+        # psi grid (cell edges) for pcolormesh
+        if plon is None or plat is None:
+            plon, plat = helper_functions.get_plon_plat(lon, lat)
+        self.plon = plon
+        self.plat = plat
+        # depth [m, positive down] and water mask (True = water)
+        self.h = h
+        self.mask = mask
+        # depth [m, negative down] with nans on land
+        if h is not None and mask is not None:
+            self.zm = np.where(mask, -h, np.nan)
+        else:
+            self.zm = None
+        # bytes read from the grid file to build this geometry
+        # (0 if it was loaded from a saved geometry file)
+        self.bytes_read = 0
+        # spatial index of the rho grid (built on first use)
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        spatial_index.SpatialIndex of the rho grid, for
+        lon/lat -> eta/xi lookups.
+        """
+        if self._index is None:
+            self._index = spatial_index.SpatialIndex(self.lon, self.lat)
+        return self._index
+
+    @classmethod
+    def from_lazy_grid(cls, lg, eta=slice(None), xi=slice(None)):
+        """
+        Build the geometry from a LazyGrid, reading only the
+        eta/xi index window. h and mask_rho are optional
+        (e.g. PugetSound_gridsizes.nc only has lon_rho and lat_rho).
+        """
+        lon = lg.read('lon_rho', eta, xi)
+        lat = lg.read('lat_rho', eta, xi)
+        h = lg.read('h', eta, xi) if lg.has('h') else None
+        mask = lg.read('mask_rho', eta, xi) != 0 if lg.has('mask_rho') else None
+        grid = cls(lon, lat, h=h, mask=mask)
+        grid.bytes_read = lg.bytes_read
+        return grid
+
+    def land_water(self, water_value):
+        """
+        Returns a binary land/water map for plotting:
+        nan on land and water_value in the water.
+        """
+        return np.where(self.mask, water_value, np.nan)
+
+    def save(self, path):
+        arrays = {'lon': self.lon, 'lat': self.lat,
+                  'plon': self.plon, 'plat': self.plat}
+        if self.h is not None:
+            arrays['h'] = self.h
+        if self.mask is not None:
+            arrays['mask'] = self.mask
+        # write to a temporary file first so readers never see a partial file
+        # (np.savez adds .npz to names that do not end in it)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['lon'], arrays['lat'],
+                       plon=arrays['plon'], plat=arrays['plat'],
+                       h=arrays['h'] if 'h' in arrays else None,
+                       mask=arrays['mask'] if 'mask' in arrays else None)
+
+
+def load_grid_geometry(grid_file, xlim=None, ylim=None):
+    """
+    Returns the GridGeometry of a grid file, read from the saved
+    geometry next to it if that is newer than the grid file,
+    otherwise built from the grid file (and saved for next time).
+
+    xlim, ylim: optional [min, max] lon/lat box; only the part of the
+        grid covering the box (plus one cell) is read and kept
+    """
+    if xlim is None or ylim is None:
+        geometry_file = grid_file + SUFFIX
+    else:
+        geometry_file = grid_file + '.{:.4f}_{:.4f}_{:.4f}_{:.4f}'.format(
+            xlim[0], xlim[1], ylim[0], ylim[1]) + SUFFIX
+    if (os.path.exists(geometry_file) and
+            os.path.getmtime(geometry_file) >= os.path.getmtime(grid_file)):
+        return GridGeometry.load(geometry_file)
+
+    with lazy_grid.LazyGrid(grid_file) as lg:
+        if xlim is None or ylim is None:
+            grid = GridGeometry.from_lazy_grid(lg)
+        else:
+            eta, xi = lg.window(xlim, ylim)
+            grid = GridGeometry.from_lazy_grid(lg, eta, xi)
+    try:
+        grid.save(geometry_file)
+    except OSError:
+        # e.g. read-only data directory: just rebuild next time
+        pass
+    return grid
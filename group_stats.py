@@ -0,0 +1,190 @@
+"""
+Hypothesis tests comparing two groups of inlets
+(e.g. oxygenated vs. hypoxic) for many budget terms at once.
+
+The input is one (2 groups x inlets x terms) array, nan-padded where a
+group has fewer inlets than the other. For every term, the engine runs
+    Shapiro-Wilk test of each group (are the inlet values normal?)
+    Bartlett's test (do the groups have the same variance?)
+    Welch's t-test (do the groups have the same mean?)
+Welch and Bartlett are computed for all terms at once; Shapiro-Wilk has
+no closed form and is run term by term.
+
+Several season windows or alternative groupings can be tested in one
+call by putting them side by side along the term axis (with a matching
+index, e.g. a pandas MultiIndex of (window, term)).
+
+Example:
+    values, terms = stack_groups([oxy_dict, hyp_dict])
+    table = compare_groups(values, terms)
+    print_group_tests(table, ['d/dt(DO)'])
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import shapiro
+from scipy.stats import t as t_dist
+from scipy.stats import chi2
+
+# significance level used in the printed conclusions
+ALPHA = 0.05
+
+# default group labels
+LABELS = ('oxy', 'hyp')
+
+# budget terms compared between hypoxic and oxygenated inlets
+# during the drawdown period (figure_10 panels c and d)
+TTEST_TERMS = ['d/dt(DO)',
+               'Photosynthesis & Consumption',
+               'Exchange Flow & Vertical']
+
+
+def stack_groups(group_dicts, terms=None):
+    """
+    Stack dictionaries of {term: list of inlet values} (one per group,
+    as returned by figure_10.get_group_averages) into one array.
+
+    INPUT:
+        group_dicts: list of dictionaries, one per group
+        terms: terms to include (default: all terms of the first group)
+
+    OUTPUT: values (groups x inlets x terms, nan-padded), terms
+    """
+    if terms is None:
+        terms = list(group_dicts[0].keys())
+    ninlets = max(len(group[term]) for group in group_dicts for term in terms)
+    values = np.full((len(group_dicts), ninlets, len(terms)), np.nan)
+    for g,group in enumerate(group_dicts):
+        for j,term in enumerate(terms):
+            values[g,:len(group[term]),j] = group[term]
+    return values, terms
+
+
+def compare_groups(values, index=None, labels=LABELS):
+    """
+    Run all tests for every term.
+
+    INPUT:
+        values: array (2 groups x inlets x terms); nan's are ignored
+        index: label of each term (list or pandas Index; default 0, 1, ...)
+        labels: names of the two groups (used in the column names)
+
+    OUTPUT: DataFrame with one row per term and columns
+        n_<label>, mean_<label>, std_<label>, shapiro_p_<label> (per group),
+        bartlett_stat, bartlett_p, welch_t, welch_df, welch_p
+        (welch_t > 0 means the first group has the larger mean)
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 3 or values.shape[0] != 2:
+        raise ValueError('compare_groups: values must be (2 groups x inlets x terms), got shape {}'.format(values.shape))
+
+    # group statistics, shape (groups x terms)
+    n = np.sum(~np.isnan(values), axis=1)
+    with warnings.catch_warnings():
+        # terms without enough data give nan's
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(values, axis=1)
+        var = np.nanvar(values, axis=1, ddof=1)
+
+    table = {}
+    for g,label in enumerate(labels):
+        table['n_' + label] = n[g]
+        table['mean_' + label] = mean[g]
+        table['std_' + label] = np.sqrt(var[g])
+        table['shapiro_p_' + label] = shapiro_p(values[g])
+    table['bartlett_stat'], table['bartlett_p'] = bartlett_test(n, var)
+    table['welch_t'], table['welch_df'], table['welch_p'] = welch_test(n, mean, var)
+
+    if index is None:
+        index = np.arange(values.shape[2])
+    return pd.DataFrame(table, index=index)
+
+
+def welch_test(n, mean, var):
+    """
+    Welch's t-test (two-sided) of group 0 vs. group 1 for every term,
+    from the group sizes, means and variances (arrays of shape groups x terms).
+
+    OUTPUT: t statistic, degrees of freedom, p-value (one per term)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        se2 = var / n
+        t = (mean[0] - mean[1]) / np.sqrt(se2[0] + se2[1])
+        df = (se2[0] + se2[1])**2 / (se2[0]**2/(n[0]-1) + se2[1]**2/(n[1]-1))
+        p = 2 * t_dist.sf(np.abs(t), df)
+    return t, df, p
+
+
+def bartlett_test(n, var):
+    """
+    Bartlett's test for equal variances of all groups for every term,
+    from the group sizes and variances (arrays of shape groups x terms).
+
+    OUTPUT: test statistic, p-value (one per term)
+    """
+    k = n.shape[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ntot = np.sum(n, axis=0)
+        pooled = np.sum((n - 1) * var, axis=0) / (ntot - k)
+        stat = (ntot - k) * np.log(pooled) - np.sum((n - 1) * np.log(var), axis=0)
+        stat = stat / (1 + (np.sum(1/(n - 1), axis=0) - 1/(ntot - k)) / (3*(k - 1)))
+        p = chi2.sf(stat, k - 1)
+    return stat, p
+
+
+def shapiro_p(values):
+    """
+    Shapiro-Wilk p-value of every column of values (inlets x terms),
+    ignoring nan's (nan for columns with fewer than 3 values).
+    """
+    p = np.full(values.shape[1], np.nan)
+    for j in range(values.shape[1]):
+        column = values[:,j][~np.isnan(values[:,j])]
+        if len(column) >= 3:
+            stat,p[j] = shapiro(column)
+    return p
+
+
+def print_group_tests(table, terms, labels=LABELS, names=('oxygenated','hypoxic')):
+    """
+    Print the Shapiro-Wilk, Bartlett and Welch results of some terms
+    (rows of a compare_groups table).
+    """
+    for term in terms:
+        row = table.loc[term]
+        print('\n=============================================================')
+        print('{:=^61}'.format('Welch\'s t-test for {}'.format(term)))
+        print('=============================================================\n')
+        # Shapiro-Wilk test
+        print(' 1. Check that inlet-level mean {} of {}'.format(term, names[0]))
+        print('    and {} groups are normally distributed'.format(names[1]))
+        print('      Shapiro-Wilk test (p < 0.05 means data are NOT normally distributed)\n')
+        for label,name in zip(labels,names):
+            print('        p = {} for {} inlets'.format(round(row['shapiro_p_' + label],3), name))
+        if all(row['shapiro_p_' + label] >= ALPHA for label in labels):
+            print('        => Data are normally distributed\n')
+        else:
+            print('        => Data are NOT normally distributed\n')
+        print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
+        # Bartlett's test
+        print(' 2. Check whether {} of {} and {}'.format(term, names[0], names[1]))
+        print('    inlet groups have similar variances')
+        print('      Bartlett\'s test (p < 0.05 means variances are significantly different)\n')
+        print('        p = {}'.format(round(row['bartlett_p'],3)))
+        if row['bartlett_p'] < ALPHA:
+            print('        => Variances are significantly different\n')
+        else:
+            print('        => Variances are not significantly different\n')
+        print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
+        # Welch's t-test
+        print(' 3. Check whether group-level mean {} of {}'.format(term, names[0]))
+        print('    and {} groups are statistically similar'.format(names[1]))
+        print('      Welch\'s t-test')
+        print('      Null hypothesis: {} of {} and {} inlets is the same'.format(term, names[1], names[0]))
+        print('      p < 0.05 means we reject null hypothesis\n')
+        print('        p = {}'.format(round(row['welch_p'],3)))
+        if row['welch_p'] < ALPHA:
+            print('        => {} of {} and {} inlets are statistically different\n'.format(term, names[1], names[0]))
+        else:
+            print('        => {} of {} and {} inlets are statistically similar\n'.format(term, names[1], names[0]))
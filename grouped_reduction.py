@@ -0,0 +1,150 @@
+"""
+Calendar-driven grouped reductions of daily time series.
+
+Group boundaries (months, weeks, seasons, or any [start, end) window)
+are derived from the actual date index, so leap years and other start
+dates are handled without hard-coded day indices. Reductions are done
+for every series at once (time on axis 0, any number of other axes,
+e.g. time x inlets x variables).
+
+Example:
+    labels, starts, ends = group_bounds(dates, freq='M')
+    monthly = grouped_reduce(values, starts, ends, stat='nanmean')
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+
+# reductions supported by grouped_reduce
+STATS = ['nanmean', 'nanmedian', 'nanstd']
+
+
+def group_bounds(dates, freq='M'):
+    """
+    Get the index bounds of each calendar group in a date index.
+
+    INPUT:
+        dates: DatetimeIndex (or anything pandas can turn into one)
+            with one entry per sample along the time axis
+        freq: pandas period frequency, e.g.
+            'M' (months), 'W' (weeks), 'Q-NOV' (seasons DJF, MAM, JJA, SON),
+            'Y' (years)
+
+    OUTPUT: labels, starts, ends
+        labels: PeriodIndex with the period of each group
+        starts, ends: integer arrays; group i is dates[starts[i]:ends[i]]
+    """
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        # group by local calendar date
+        dates = dates.tz_localize(None)
+    periods = dates.to_period(freq)
+    codes = periods.asi8
+    # a new group starts wherever the period changes
+    starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    ends = np.append(starts[1:], len(dates))
+    return periods[starts], starts, ends
+
+
+def window_bounds(dates, windows):
+    """
+    Get the index bounds of arbitrary date windows (e.g. the drawdown
+    period) in a date index.
+
+    INPUT:
+        dates: DatetimeIndex with one entry per sample
+        windows: list of (first date, last date) pairs, inclusive,
+            as strings or Timestamps, e.g. [('2017-06-15','2017-08-15')]
+
+    OUTPUT: starts, ends (group i is dates[starts[i]:ends[i]])
+    """
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    first = pd.DatetimeIndex([window[0] for window in windows])
+    last = pd.DatetimeIndex([window[1] for window in windows])
+    starts = dates.searchsorted(first, side='left')
+    ends = dates.searchsorted(last + pd.Timedelta(days=1), side='left')
+    return np.asarray(starts), np.asarray(ends)
+
+
+def grouped_reduce(values, starts, ends, stat='nanmean'):
+    """
+    Reduce every series in values over each group [starts[i], ends[i]).
+
+    INPUT:
+        values: array with time on axis 0
+        starts, ends: group bounds (see group_bounds / window_bounds)
+        stat: 'nanmean', 'nanmedian' or 'nanstd'
+
+    OUTPUT: array of shape (number of groups,) + values.shape[1:]
+        (nan for groups without any valid data)
+    """
+    values = np.asarray(values, dtype=float)
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+
+    if stat == 'nanmean':
+        total, count = _segment_sums(values, starts, ends)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    elif stat == 'nanstd':
+        # shift by each series' overall mean before summing squares
+        # to avoid cancellation in (sum(x^2) - sum(x)^2/n)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            shift = np.nanmean(values, axis=0)
+        shift = np.where(np.isnan(shift), 0, shift)
+        total, count = _segment_sums(values - shift, starts, ends)
+        total2, count = _segment_sums((values - shift)**2, starts, ends)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = total2/count - (total/count)**2
+        return np.where(count > 0, np.sqrt(np.maximum(var, 0)), np.nan)
+
+    elif stat == 'nanmedian':
+        # gather every group into a nan-padded (groups x longest group) block
+        lengths = ends - starts
+        nlong = max(lengths.max(initial=0), 1)
+        offsets = np.arange(nlong)
+        idx = starts[:,None] + offsets[None,:]
+        # padded positions point at an extra row of nan's
+        idx = np.where(offsets[None,:] < lengths[:,None], idx, len(values))
+        padded = np.concatenate((values, np.full((1,) + values.shape[1:], np.nan)), axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            return np.nanmedian(padded[idx], axis=1)
+
+    else:
+        raise ValueError('grouped_reduce: unsupported stat {} (use one of {})'.format(stat, STATS))
+
+
+def grouped_stats(values, dates, freq='M', stats=STATS):
+    """
+    Convenience wrapper: group by calendar period and compute several
+    statistics at once.
+
+    OUTPUT: labels, {stat: array of shape (groups,) + values.shape[1:]}
+    """
+    labels, starts, ends = group_bounds(dates, freq)
+    return labels, {stat: grouped_reduce(values, starts, ends, stat) for stat in stats}
+
+
+def _segment_sums(values, starts, ends):
+    # nan-aware sums and counts over [start, end) for all groups at once
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    # an extra row of zeros lets ends point one past the last sample
+    zeros = np.zeros((1,) + values.shape[1:])
+    filled = np.concatenate((filled, zeros), axis=0)
+    valid = np.concatenate((valid.astype(float), zeros), axis=0)
+    # reduceat over interleaved (start, end) pairs; every other entry is a group
+    idx = np.column_stack((starts, ends)).ravel()
+    total = np.add.reduceat(filled, idx, axis=0)[::2]
+    count = np.add.reduceat(valid, idx, axis=0)[::2]
+    # reduceat returns the first element for empty groups
+    empty = (ends <= starts).reshape((-1,) + (1,)*(values.ndim-1))
+    total = np.where(empty, 0, total)
+    count = np.where(empty, 0, count)
+    return total, count
@@ -5,14 +5,31 @@ Parker MacCready
 """
 
 import numpy as np
+import pandas as pd
 import pytz
+from functools import lru_cache
 
-def lowpass(data, f='hanning', n=40, nanpad=True):
+# cost of the FFT backend per nfft*log2(nfft) relative to the cost of the
+# direct backend per multiply-add, measured with benchmark_lowpass.py
+# (the two break even near a 30-point filter for long records).
+FFT_COST_RATIO = 2.0
+
+def lowpass(data, f='hanning', n=40, nanpad=True, method='auto', min_coverage=None):
     """
     A replacement for almost all previous filter code.
     f = 'hanning' (default) or 'godin'
+    method = 'auto' (default), 'direct' or 'fft'
+        'auto' picks the cheaper backend from the record and filter length
+    min_coverage = None (default) or a fraction between 0 and 1
+        None: a nan anywhere in a window makes that output nan.
+        Otherwise nan's are skipped and the filter weights are renormalized
+        over the valid samples in each window (normalized convolution);
+        the output is nan only where the valid samples carry less than
+        min_coverage of the total filter weight.
     
     Input: ND numpy array, any number of dimensions, with time on axis 0.
+        Every other axis is filtered independently, so a whole
+        (time x inlets x terms) block can be smoothed in one call.
     
     Output: Array of the same size, filtered with Hanning window of length n,
         or the Godin filter (hourly data only) padded with nan's.
@@ -28,10 +45,25 @@ def lowpass(data, f='hanning', n=40, nanpad=True):
             print('ERROR in filt_general(): unsupported filter ' + f)
             filt = np.nan
         npad = np.floor(len(filt)/2).astype(int)
-        sh = data.shape
-        df = data.flatten('F')
-        dfs = np.convolve(df, filt, mode = 'same')
-        smooth = dfs.reshape(sh, order='F')
+        data = np.asarray(data)
+        if method == 'auto':
+            method = choose_method(data.shape[0], len(filt))
+        if method == 'fft':
+            convolve = fftconvolve_axis0
+        else:
+            convolve = convolve_axis0
+        if min_coverage is None:
+            smooth = convolve(data, filt)
+        else:
+            # filter the zero-filled data and the valid-sample mask together
+            # (stacked on a trailing axis, so still a single call)
+            valid = ~np.isnan(data)
+            both = convolve(np.stack((np.where(valid, data, 0), valid), axis=-1), filt)
+            weight = both[...,1]
+            coverage = weight / filt.sum()
+            smooth = np.full(data.shape, np.nan)
+            enough = coverage >= max(min_coverage, 1e-12)
+            smooth[enough] = both[...,0][enough] / weight[enough]
         # note that the indexing below defaults to being on axis 0,
         # and correctly broadcasts without having to mention the other axes
         if nanpad:
@@ -41,6 +73,86 @@ def lowpass(data, f='hanning', n=40, nanpad=True):
             smooth[:npad] = data[:npad]
             smooth[-npad:] = data[-npad:]
         return smooth
+
+def convolve_axis0(data, filt):
+    """
+    Convolve every series along axis 0 of data with filt.
+    Equivalent to np.convolve(series, filt, mode='same') for each
+    column, but done for all columns at once.
+    """
+    nt = data.shape[0]
+    nf = len(filt)
+    # zero pad the time axis so each output sample sees a full window,
+    # aligned the same way as np.convolve(..., mode='same')
+    pad = [(nf//2, (nf-1)//2)] + [(0,0)]*(data.ndim-1)
+    padded = np.pad(data.astype(float), pad)
+    # accumulate one filter tap at a time (vectorized over all other axes)
+    smooth = np.zeros(data.shape)
+    for j in range(nf):
+        smooth += filt[nf-1-j] * padded[j:j+nt]
+    return smooth
+
+def fftconvolve_axis0(data, filt):
+    """
+    Same result as convolve_axis0(), computed with FFTs along axis 0.
+    Cost is O(N log N) instead of O(N K), which pays off for long
+    hourly records and long filters.
+    A nan in the input makes the same output samples nan as in the
+    direct convolution (the ones whose window contains it), instead
+    of spreading over the whole record.
+    """
+    nt = data.shape[0]
+    nf = len(filt)
+    nfft = next_fast_len(nt + nf - 1)
+    # index of the first sample of the 'same' part of the full convolution
+    i0 = (nf-1)//2
+    shape = (nf,) + (1,)*(data.ndim-1)
+    Filt = np.fft.rfft(np.reshape(filt, shape), n=nfft, axis=0)
+
+    data = data.astype(float)
+    isnan = np.isnan(data)
+    if isnan.any():
+        data = np.where(isnan, 0, data)
+    smooth = np.fft.irfft(np.fft.rfft(data, n=nfft, axis=0) * Filt, n=nfft, axis=0)[i0:i0+nt]
+    if isnan.any():
+        # convolve the nan mask with the (positive) filter weights to
+        # find every output sample whose window contains a nan
+        Weights = np.fft.rfft(np.reshape(np.abs(filt), shape), n=nfft, axis=0)
+        touched = np.fft.irfft(np.fft.rfft(isnan.astype(float), n=nfft, axis=0) * Weights,
+                               n=nfft, axis=0)[i0:i0+nt]
+        smooth[touched > 0.5*np.abs(filt[filt != 0]).min()] = np.nan
+    return smooth
+
+def choose_method(nt, nf):
+    """
+    Returns 'fft' or 'direct', whichever is estimated to be faster
+    for a record of length nt and a filter of length nf.
+    """
+    nfft = next_fast_len(nt + nf - 1)
+    direct_cost = nt * nf
+    fft_cost = FFT_COST_RATIO * nfft * np.log2(nfft)
+    if fft_cost < direct_cost:
+        return 'fft'
+    return 'direct'
+
+def next_fast_len(n):
+    """
+    Returns the smallest length >= n with no prime factors other
+    than 2, 3 and 5, for which numpy's FFT is fast.
+    """
+    best = 2**int(np.ceil(np.log2(n)))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            # smallest power of two that brings p35 up to n
+            p = p35
+            while p < n:
+                p *= 2
+            best = min(best, p)
+            p35 *= 3
+        p5 *= 5
+    return best
     
 def godin_shape():
     """
@@ -67,14 +179,32 @@ def hanning_shape(n=40):
     filt = filt / filt.sum()
     return filt
 
+@lru_cache(maxsize=None)
+def get_tz(tzname):
+    # timezone objects are looked up once and reused
+    return pytz.timezone(tzname)
+
 def get_dt_local(dt, tzl='US/Pacific'):
     # take a model datetime (assumed to be UTC) and return local datetime
-    tz_utc = pytz.timezone('UTC')
-    tz_local = pytz.timezone(tzl)
+    tz_utc = get_tz('UTC')
+    tz_local = get_tz(tzl)
     dt_utc = dt.replace(tzinfo=tz_utc)
     dt_local = dt_utc.astimezone(tz_local)
     return dt_local
 
+def get_dt_local_index(dates, tzl='US/Pacific'):
+    """
+    Vectorized version of get_dt_local.
+    Takes model datetimes (assumed to be UTC if they have no time zone)
+    as a DatetimeIndex (or anything pandas can turn into one) and
+    returns a time zone aware DatetimeIndex in local time, converted
+    in one call instead of one Python datetime at a time.
+    """
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is None:
+        dates = dates.tz_localize(get_tz('UTC'))
+    return dates.tz_convert(get_tz(tzl))
+
 def get_plon_plat(lon, lat):
     """
     This takes the 2-D lon and lat grids (ndarrays) and returns extended
@@ -103,6 +233,21 @@ def get_plon_plat(lon, lat):
     plon, plat = np.meshgrid(Plon, Plat)
     return plon, plat
 
+def pcolormesh_cropped(ax, plon, plat, field, xlim, ylim, index, halo=1, **kwargs):
+    """
+    Same as ax.pcolormesh(plon, plat, field, **kwargs), but only passes
+    the part of the grid inside the lon/lat box (plus a halo of cells),
+    which is much faster and gives smaller files for a small region
+    of a large grid. Does not set the axis limits.
+
+    index: spatial_index.SpatialIndex of the rho grid of field
+        (e.g. GridGeometry.index), which finds the visible cells
+    """
+    eta, xi = index.cells(xlim, ylim, halo)
+    eta_p = slice(eta.start, eta.stop + 1)
+    xi_p = slice(xi.start, xi.stop + 1)
+    return ax.pcolormesh(plon[eta_p, xi_p], plat[eta_p, xi_p], field[eta, xi], **kwargs)
+
 def dar(ax):
     """
     Fixes the plot aspect ratio to be locally Cartesian.
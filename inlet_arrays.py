@@ -0,0 +1,50 @@
+"""
+Stack the per-inlet dictionaries into numpy arrays, so calculations
+can be done for all inlets (and terms) at once instead of in a loop
+over inlets.
+
+Arrays have time on axis 0 (as in grouped_reduction.py),
+then inlets, then terms.
+
+Example:
+    rates = stack_terms(deeplay_dict, inlets, ['TEF Exchange Flow','Bio Consumption'])
+    V = inlet_volumes(dimensions_dict, inlets)
+    rates_mgLday = rates / V[None,:,None] * kmolm3sec_to_mgLday
+"""
+
+import numpy as np
+
+
+def stack_terms(layer_dict, inlets, terms):
+    """
+    INPUT:
+        layer_dict: e.g. deeplay_dict or shallowlay_dict
+            ({inlet: {term: daily time series}})
+        inlets: list of inlets
+        terms: list of terms
+
+    OUTPUT: float array (days x inlets x terms)
+    """
+    if hasattr(layer_dict, 'stack_terms'):
+        # inlet_dataset.LayerDict: taken from its array in one step
+        return layer_dict.stack_terms(inlets, terms)
+    return np.stack([np.stack([np.asarray(layer_dict[inlet][term], dtype=float)
+                               for term in terms], axis=1)
+                     for inlet in inlets], axis=1)
+
+
+def stack_term(layer_dict, inlets, term):
+    """
+    Same as stack_terms for a single term.
+
+    OUTPUT: float array (days x inlets)
+    """
+    return stack_terms(layer_dict, inlets, [term])[:,:,0]
+
+
+def inlet_volumes(dimensions_dict, inlets):
+    """
+    OUTPUT: array (inlets,) of inlet volumes [m^3]
+    """
+    return np.array([np.asarray(dimensions_dict[inlet]['Inlet volume'], dtype=float).ravel()[0]
+                     for inlet in inlets])
@@ -0,0 +1,283 @@
+"""
+Deep and shallow layer inlet data in one contiguous array.
+
+InletDataset holds every layer, inlet, budget term and day of
+deeplay_dict and shallowlay_dict in one read-only float array of shape
+(layer x inlet x term x day), with integer index maps for the names.
+Selecting one layer, inlet or term and a window of days returns a view
+of that array (no copy); lists of names return copies.
+
+As the values are read-only, views can be shared by all stages and
+passed around freely. from_store writes the array to the store once
+(store_dir/inlet_dataset.npy) and memory-maps it on later runs, so runs
+that only use a few inlets or terms only read those.
+
+During migration, as_dict(layer) returns an adapter that behaves like
+the original nested dictionary ({inlet: {term: Series}}, with the
+Series backed by views of the array), so existing call sites such as
+deeplay_dict[inlet][term][minday:maxday] keep working, and
+inlet_arrays.stack_terms uses the array directly when given an adapter.
+
+Example:
+    dataset = InletDataset.from_store(store_dir)
+    lynch = dataset.view('deep', 'lynchcove')                    # (term x day)
+    drawdown = dataset.view('deep', term='d/dt(DO)', minday=164, maxday=225)  # (inlet x day)
+    deeplay_dict = dataset.as_dict('deep')
+    deeplay_dict['lynchcove']['Bio Consumption']                # pandas Series
+"""
+
+import os
+import json
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+import data_store
+
+# layers and the dictionaries they come from
+LAYERS = {'deep': 'deeplay_dict', 'shallow': 'shallowlay_dict'}
+
+# name of the array (and its .json description) in the store directory
+BLOCK = 'inlet_dataset'
+
+
+class InletDataset:
+
+    def __init__(self, values, layers, inlets, terms, index=None, layer_terms=None):
+        """
+        values: float array (layer x inlet x term x day)
+        layers, inlets, terms: names along the first three axes
+        index: index of the days (e.g. of the original Series; default 0, 1, ...)
+        layer_terms: {layer: terms that layer has} (default: all terms;
+            the values of missing terms are nan)
+        """
+        values = np.ascontiguousarray(values, dtype=float)
+        if values.shape[:3] != (len(layers), len(inlets), len(terms)):
+            raise ValueError('InletDataset: values of shape {} for {} layers, {} inlets and {} terms'.format(
+                values.shape, len(layers), len(inlets), len(terms)))
+        values.flags.writeable = False
+        self.values = values
+        self.layers = list(layers)
+        self.inlets = list(inlets)
+        self.terms = list(terms)
+        self.layer_index = {layer: i for i,layer in enumerate(self.layers)}
+        self.inlet_index = {inlet: i for i,inlet in enumerate(self.inlets)}
+        self.term_index = {term: i for i,term in enumerate(self.terms)}
+        self.index = pd.RangeIndex(values.shape[3]) if index is None else pd.Index(index)
+        if layer_terms is None:
+            layer_terms = {layer: self.terms for layer in self.layers}
+        self.layer_terms = {layer: list(layer_terms[layer]) for layer in self.layers}
+        # set by from_store (see data_store.StoredDict)
+        self.store_key = None
+        # adapters returned by as_dict
+        self._layer_dicts = {}
+
+    @classmethod
+    def from_dicts(cls, layer_dicts, inlets=None):
+        """
+        Build the dataset from nested dictionaries.
+
+        INPUT:
+            layer_dicts: {layer: {inlet: {term: daily time series}}},
+                e.g. {'deep': deeplay_dict, 'shallow': shallowlay_dict}
+            inlets: inlets to include (default: those of the first layer)
+        """
+        layers = list(layer_dicts)
+        if inlets is None:
+            inlets = list(layer_dicts[layers[0]])
+        # terms of every layer (in the order of its first inlet), and all terms
+        layer_terms = {layer: list(layer_dicts[layer][inlets[0]]) for layer in layers}
+        terms = []
+        for layer in layers:
+            terms += [term for term in layer_terms[layer] if term not in terms]
+
+        first = layer_dicts[layers[0]][inlets[0]][layer_terms[layers[0]][0]]
+        ndays = len(first)
+        values = np.full((len(layers), len(inlets), len(terms), ndays), np.nan)
+        for l,layer in enumerate(layers):
+            for i,inlet in enumerate(inlets):
+                for term in layer_terms[layer]:
+                    series = np.asarray(layer_dicts[layer][inlet][term], dtype=float)
+                    if len(series) != ndays:
+                        raise ValueError('InletDataset: {} {} {} has {} days, not {}'.format(
+                            layer, inlet, term, len(series), ndays))
+                    values[l,i,terms.index(term)] = series
+        index = first.index if isinstance(first, pd.Series) else None
+        return cls(values, layers, inlets, terms, index, layer_terms)
+
+    @classmethod
+    def from_store(cls, store_dir, layers=LAYERS):
+        """
+        Build the dataset from the columnar store (see data_store.py).
+        The array is memory-mapped from store_dir/inlet_dataset.npy,
+        which is (re)written from the layer dictionaries when it is
+        missing or a layer's source pickle has changed.
+
+        INPUT:
+            layers: {layer: name of its dictionary in the store}
+        """
+        # identifies the source pickles (see data_store.StoredDict)
+        keys = [data_store.store_key(store_dir, name) for name in layers.values()]
+        store_key = None
+        if None not in keys:
+            store_key = '|'.join(layer + ':' + key for layer, key in zip(layers, keys))
+            dataset = cls._load_block(store_dir, store_key)
+            if dataset is not None:
+                return dataset
+
+        layer_dicts = {layer: data_store.load_dict(store_dir, name)
+                       for layer, name in layers.items()}
+        dataset = cls.from_dicts(layer_dicts)
+        dataset.store_key = store_key
+        if store_key is not None:
+            dataset._save_block(store_dir)
+        return dataset
+
+    @classmethod
+    def _load_block(cls, store_dir, store_key):
+        # memory-mapped dataset written by _save_block
+        # (None if there is none for these source pickles)
+        path = os.path.join(store_dir, BLOCK)
+        if not os.path.exists(path + '.json'):
+            return None
+        with open(path + '.json', 'r') as handle:
+            info = json.load(handle)
+        if info['store_key'] != store_key:
+            return None
+        values = np.load(path + '.npy', mmap_mode='r')
+        index = np.load(path + '_index.npy') if info['index'] else None
+        dataset = cls(values, info['layers'], info['inlets'], info['terms'],
+                      index, info['layer_terms'])
+        dataset.store_key = store_key
+        return dataset
+
+    def _save_block(self, store_dir):
+        # write the array (and a non-default day index) to the store,
+        # then its description, which marks the block as complete
+        path = os.path.join(store_dir, BLOCK)
+        arrays = {'.npy': self.values}
+        if not self.index.equals(pd.RangeIndex(len(self.index))):
+            index = np.asarray(self.index)
+            if index.dtype.hasobject:
+                # cannot be memory-mapped: keep the dataset in memory only
+                return
+            arrays['_index.npy'] = index
+        for suffix, values in arrays.items():
+            # write to a temporary file first so readers never see a partial array
+            with open(path + suffix + '.tmp', 'wb') as handle:
+                np.save(handle, values)
+            os.replace(path + suffix + '.tmp', path + suffix)
+        info = {'store_key': self.store_key, 'layers': self.layers, 'inlets': self.inlets,
+                'terms': self.terms, 'layer_terms': self.layer_terms,
+                'index': '_index.npy' in arrays}
+        with open(path + '.json.tmp', 'w') as handle:
+            json.dump(info, handle, indent=1)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def view(self, layer=None, inlet=None, term=None, minday=None, maxday=None):
+        """
+        View (no copy) of one layer, inlet and/or term and the days
+        [minday, maxday). Axes of the names given are dropped.
+
+        OUTPUT: e.g. view('deep') is (inlet x term x day),
+            view('deep', term='d/dt(DO)') is (inlet x day)
+        """
+        key = tuple(slice(None) if name is None else index[name]
+                    for name, index in [(layer, self.layer_index),
+                                        (inlet, self.inlet_index),
+                                        (term, self.term_index)])
+        return self.values[key + (slice(minday, maxday),)]
+
+    def series(self, layer, inlet, term):
+        """
+        Daily values of one layer, inlet and term as a pandas Series
+        backed by the array.
+        """
+        return pd.Series(self.view(layer, inlet, term), index=self.index, name=term, copy=False)
+
+    def take(self, layer, inlets=None, terms=None, minday=None, maxday=None):
+        """
+        (inlet x term x day) array of lists of inlets and terms (a copy).
+        """
+        rows = slice(None) if inlets is None else [self.inlet_index[inlet] for inlet in inlets]
+        columns = slice(None) if terms is None else [self.term_index[term] for term in terms]
+        values = self.view(layer, minday=minday, maxday=maxday)
+        if isinstance(rows, list) and isinstance(columns, list):
+            return values[np.ix_(rows, columns)]
+        return values[rows][:,columns]
+
+    def as_dict(self, layer):
+        """
+        Adapter that behaves like the original {inlet: {term: Series}} dictionary.
+        """
+        if layer not in self._layer_dicts:
+            self._layer_dicts[layer] = LayerDict(self, layer)
+        return self._layer_dicts[layer]
+
+
+class LayerDict(Mapping):
+    """
+    Read-only {inlet: {term: Series}} view of one layer of an InletDataset.
+    """
+
+    def __init__(self, dataset, layer):
+        self.dataset = dataset
+        self.layer = layer
+        # {inlet: InletDict}, built on first access
+        self._inlet_dicts = {}
+
+    @property
+    def store_key(self):
+        # identifies the source pickles (for result_cache.py)
+        if self.dataset.store_key is None:
+            return None
+        return self.dataset.store_key + '|' + self.layer
+
+    def __getitem__(self, inlet):
+        if inlet not in self._inlet_dicts:
+            if inlet not in self.dataset.inlet_index:
+                raise KeyError(inlet)
+            self._inlet_dicts[inlet] = InletDict(self.dataset, self.layer, inlet)
+        return self._inlet_dicts[inlet]
+
+    def __iter__(self):
+        return iter(self.dataset.inlets)
+
+    def __len__(self):
+        return len(self.dataset.inlets)
+
+    def stack_terms(self, inlets, terms):
+        """
+        (days x inlets x terms) array, as inlet_arrays.stack_terms.
+        """
+        for term in terms:
+            if term not in self.dataset.layer_terms[self.layer]:
+                raise KeyError(term)
+        return np.ascontiguousarray(self.dataset.take(self.layer, inlets, terms).transpose(2,0,1))
+
+
+class InletDict(Mapping):
+    """
+    Read-only {term: Series} view of one layer and inlet of an InletDataset.
+    """
+
+    def __init__(self, dataset, layer, inlet):
+        self.dataset = dataset
+        self.layer = layer
+        self.inlet = inlet
+        # {term: Series}, built on first access (the Series are views
+        # of the read-only array, so they can be shared)
+        self._series = {}
+
+    def __getitem__(self, term):
+        if term not in self._series:
+            if term not in self.dataset.layer_terms[self.layer]:
+                raise KeyError(term)
+            self._series[term] = self.dataset.series(self.layer, self.inlet, term)
+        return self._series[term]
+
+    def __iter__(self):
+        return iter(self.dataset.layer_terms[self.layer])
+
+    def __len__(self):
+        return len(self.dataset.layer_terms[self.layer])
@@ -0,0 +1,172 @@
+"""
+Volume-normalized deep layer budget rates of all inlets, computed once.
+
+InletRates holds one (inlet x term x day) array of every deep layer
+budget term divided by the deep layer volume of the same day, in mg/L
+per day. Figures and tests read their drawdown-period values from this
+array instead of each dividing by the volume again, and window
+reductions (mean, median, quantiles over [minday, maxday)) are cached,
+so e.g. the drawdown means are computed only once per run.
+
+For sweeps over many windows, window_mean uses nan-aware cumulative
+sums and counts along the day axis, so the mean over any window is two
+lookups, and all windows of a sweep are computed in one operation
+(see window_sweep.py).
+
+Example:
+    rates = InletRates(deeplay_dict, inlets, kmolm3sec_to_mgLday)
+    means = rates.reduce(minday, maxday)                     # (inlet x term)
+    lynch = rates.reduce(minday, maxday)[rates.inlet_index['lynchcove']]
+    q90 = rates.reduce(minday, maxday, 'quantile', q=0.9)
+    sweep = rates.window_mean(starts[:,None], ends[None,:], terms=['d/dt(DO)'])
+"""
+
+import warnings
+import numpy as np
+
+import inlet_arrays
+
+# entries of deeplay_dict that are not budget terms
+NOT_RATES = ['Volume', 'Qin m3/s']
+
+# reductions supported by InletRates.reduce
+STATS = ['mean', 'median', 'quantile']
+
+
+class InletRates:
+
+    def __init__(self, deeplay_dict, inlets, kmolm3sec_to_mgLday, terms=None):
+        """
+        deeplay_dict: {inlet: {term: daily time series}}, including 'Volume'
+        terms: budget terms to include (default: every term except NOT_RATES,
+            in the order of deeplay_dict)
+        """
+        if terms is None:
+            terms = [term for term in deeplay_dict[inlets[0]] if term not in NOT_RATES]
+        self.inlets = list(inlets)
+        self.terms = list(terms)
+        self.inlet_index = {inlet: i for i,inlet in enumerate(self.inlets)}
+        self.term_index = {term: j for j,term in enumerate(self.terms)}
+
+        # (days x inlets x terms) rates and (days x inlets) volumes
+        values = inlet_arrays.stack_terms(deeplay_dict, self.inlets, self.terms)
+        volume = inlet_arrays.stack_term(deeplay_dict, self.inlets, 'Volume')
+        # kmol O2 /s /m3 -> mg/L per day, stored as (inlet x term x day)
+        self.values = np.ascontiguousarray(
+            (values / volume[:,:,None] * kmolm3sec_to_mgLday).transpose(1,2,0))
+
+        # cached window reductions {(minday, maxday, stat, q): array}
+        self._reductions = {}
+        # cumulative sums and counts of valid values (built on first use)
+        self._cumsum = None
+        self._cumcount = None
+
+    def __getstate__(self):
+        # the cached reductions and cumulative sums are not part of the state
+        # (so pickles and result_cache fingerprints do not depend on them)
+        state = self.__dict__.copy()
+        state['_reductions'] = {}
+        state['_cumsum'] = None
+        state['_cumcount'] = None
+        return state
+
+    def series(self, inlet, term):
+        """
+        Daily rates [mg/L per day] of one inlet and term.
+        """
+        return self.values[self.inlet_index[inlet], self.term_index[term]]
+
+    def window(self, minday, maxday):
+        """
+        (inlet x term x day) view of the days [minday, maxday).
+        """
+        return self.values[:,:,minday:maxday]
+
+    def reduce(self, minday, maxday, stat='mean', q=None):
+        """
+        Reduce every inlet and term over the days [minday, maxday)
+        (nan's are ignored). The result is cached, do not modify it.
+
+        INPUT:
+            stat: 'mean', 'median' or 'quantile'
+            q: quantile(s) in [0, 1] (for stat='quantile')
+
+        OUTPUT: array (inlet x term), or (quantiles x inlet x term)
+            for a list of quantiles
+        """
+        key = (minday, maxday, stat, None if q is None else tuple(np.atleast_1d(q)))
+        if key not in self._reductions:
+            window = self.window(minday, maxday)
+            with warnings.catch_warnings():
+                # inlets without valid data in the window give nan's
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                if stat == 'mean':
+                    result = np.nanmean(window, axis=2)
+                elif stat == 'median':
+                    result = np.nanmedian(window, axis=2)
+                elif stat == 'quantile':
+                    result = np.nanquantile(window, q, axis=2)
+                else:
+                    raise ValueError('InletRates.reduce: unsupported stat {} (use one of {})'.format(stat, STATS))
+            result.flags.writeable = False
+            self._reductions[key] = result
+        return self._reductions[key]
+
+    def window_mean(self, minday, maxday, terms=None):
+        """
+        nan-aware mean over the days [minday, maxday) from cumulative sums,
+        for one window or for arrays of windows.
+
+        INPUT:
+            minday, maxday: integers or integer arrays (broadcast against each other)
+            terms: terms to include (default: all)
+
+        OUTPUT: array of shape broadcast(minday, maxday).shape + (inlet x term)
+            (nan for empty windows and windows without valid data)
+        """
+        if self._cumsum is None:
+            # (day+1 x inlet x term), with a leading row of zeros
+            values = self.values.transpose(2,0,1)
+            valid = ~np.isnan(values)
+            zeros = np.zeros((1,) + values.shape[1:])
+            self._cumsum = np.concatenate((zeros, np.cumsum(np.where(valid, values, 0), axis=0)))
+            self._cumcount = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+        cumsum = self._cumsum
+        cumcount = self._cumcount
+        if terms is not None:
+            columns = [self.term_index[term] for term in terms]
+            cumsum = cumsum[:,:,columns]
+            cumcount = cumcount[:,:,columns]
+
+        ndays = self.values.shape[2]
+        minday, maxday = np.broadcast_arrays(np.clip(minday, 0, ndays), np.clip(maxday, 0, ndays))
+        total = cumsum[maxday] - cumsum[minday]
+        count = cumcount[maxday] - cumcount[minday]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    def group_values(self, minday, maxday, groups, terms=None, stat='mean'):
+        """
+        Window reductions of groups of inlets, as a nan-padded
+        (groups x inlets x terms) array for group_stats / resampling.
+
+        INPUT:
+            groups: list of lists of inlets
+            terms: terms to include (default: all)
+        """
+        if terms is None:
+            terms = self.terms
+        reduced = self.reduce(minday, maxday, stat)
+        columns = [self.term_index[term] for term in terms]
+        values = np.full((len(groups), max(len(group) for group in groups), len(terms)), np.nan)
+        for g,group in enumerate(groups):
+            rows = [self.inlet_index[inlet] for inlet in group]
+            values[g,:len(rows)] = reduced[np.ix_(rows, columns)]
+        return values
+
+    def split_groups(self, hyp_inlets):
+        """
+        Split the inlets into [oxygenated, hypoxic] (in inlet order).
+        """
+        return [[inlet for inlet in self.inlets if inlet not in hyp_inlets],
+                [inlet for inlet in self.inlets if inlet in hyp_inlets]]
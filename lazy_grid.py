@@ -0,0 +1,166 @@
+"""
+Lazy, windowed access to LiveOcean grid files.
+
+xr.open_dataset does not read any data until .values is called, but
+calling .values on a whole variable pulls the full field into memory.
+LazyGrid only reads the variables and the eta/xi index window that a
+consumer asks for, and keeps count of the bytes actually read, so the
+map figures can run on memory-limited nodes and on larger grids.
+If dask is installed, the dataset is opened with dask chunks.
+
+Data is read in whole chunks (dask chunks, and the chunks of chunked or
+compressed netCDF files), so the bytes counted are those of every chunk
+a read touches, not only of the values returned.
+
+Example:
+    with LazyGrid('../DATA_terminal_inlet_DO/LO_cas7_grid.nc') as lg:
+        eta, xi = lg.window([-123.3,-122.1], [46.93,48.45])
+        h = lg.read('h', eta, xi)
+        print(lg.report())
+"""
+
+import importlib.util
+import numpy as np
+
+import spatial_index
+
+# default dask chunk size along each grid dimension
+CHUNK = 256
+
+# prefixes of the horizontal grid dimensions (rho, u, v and psi points)
+GRID_DIMS = ('eta_', 'xi_')
+
+
+class LazyGrid:
+
+    def __init__(self, path, chunks='auto'):
+        """
+        path: grid file
+        chunks: 'auto' (CHUNK x CHUNK along the grid dimensions of every
+            variable if dask is installed), None (no dask),
+            or a dictionary of chunk sizes passed to xr.open_dataset
+        """
+        import xarray as xr
+        self.path = path
+        if chunks == 'auto':
+            self.ds = xr.open_dataset(path)
+            if importlib.util.find_spec('dask') is not None:
+                self.ds = self.ds.chunk(grid_chunks(self.ds))
+        else:
+            self.ds = xr.open_dataset(path, chunks=chunks)
+        # bytes read so far, in total and per variable
+        self.bytes_read = 0
+        self.bytes_by_variable = {}
+        # 1-D lon/lat axes (read on first use)
+        self._lon_axis = None
+        self._lat_axis = None
+        # spatial index (built on first use)
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.ds.close()
+
+    def has(self, name):
+        return name in self.ds.variables
+
+    def shape(self, name):
+        # shape of a variable (from the metadata only)
+        return self.ds[name].shape
+
+    def read(self, name, eta=slice(None), xi=slice(None)):
+        """
+        Read one 2-D variable over an index window.
+        Returns a numpy array.
+        """
+        values = np.asarray(self.ds[name][eta, xi].values)
+        self._count(name, self.bytes_touched(name, eta, xi))
+        return values
+
+    def axes(self):
+        """
+        1-D lon and lat axes of a plaid grid
+        (reads only one row of lon_rho and one column of lat_rho).
+        """
+        if self._lon_axis is None:
+            self._lon_axis = self.read('lon_rho', 0, slice(None))
+            self._lat_axis = self.read('lat_rho', slice(None), 0)
+        return self._lon_axis, self._lat_axis
+
+    def window(self, xlim, ylim, halo=1):
+        """
+        eta, xi slices of the rho cells inside a lon/lat box,
+        plus halo cells on every side (plaid grids only).
+        """
+        return self.index().bbox(xlim, ylim, halo)
+
+    def index(self):
+        """
+        spatial_index.SpatialIndex of a plaid grid, built from the 1-D axes
+        (the 2-D lon/lat grids are broadcast views, not read).
+        """
+        if self._index is None:
+            lon, lat = self.axes()
+            shape = (len(lat), len(lon))
+            self._index = spatial_index.SpatialIndex(np.broadcast_to(lon, shape),
+                                                     np.broadcast_to(lat[:,None], shape), plaid=True)
+        return self._index
+
+    def report(self):
+        """
+        One-line summary of the bytes read, compared to reading
+        every variable of the file in full.
+        """
+        total = sum(self.ds[name].size * self.ds[name].dtype.itemsize
+                    for name in self.ds.variables)
+        by_variable = ', '.join('{} {:.1f} MB'.format(name, nbytes/1e6)
+                                for name, nbytes in self.bytes_by_variable.items())
+        return 'read {:.1f} MB of {:.1f} MB ({})'.format(self.bytes_read/1e6, total/1e6, by_variable)
+
+    def bytes_touched(self, name, *key):
+        """
+        Bytes of the chunks of a variable that reading var[key] touches
+        (dask chunks, then the file chunks they cover; the values
+        themselves for contiguous variables without dask).
+        """
+        var = self.ds[name]
+        # which positions along each dimension are read
+        touched = []
+        for n, k in zip(var.shape, key + (slice(None),)*(var.ndim - len(key))):
+            mask = np.zeros(n, dtype=bool)
+            mask[k] = True
+            touched.append(mask)
+        # widen to whole chunks: dask chunks first, as dask reads
+        # each of them from the file in one go
+        if var.chunks is not None:
+            touched = [_whole_chunks(mask, np.cumsum(sizes))
+                       for mask, sizes in zip(touched, var.chunks)]
+        chunksizes = var.encoding.get('chunksizes')
+        if chunksizes is not None and not var.encoding.get('contiguous', False):
+            touched = [_whole_chunks(mask, np.arange(size, len(mask) + size, size))
+                       for mask, size in zip(touched, chunksizes)]
+        return int(np.prod([mask.sum() for mask in touched])) * var.dtype.itemsize
+
+    def _count(self, name, nbytes):
+        self.bytes_read += nbytes
+        self.bytes_by_variable[name] = self.bytes_by_variable.get(name, 0) + nbytes
+
+
+def grid_chunks(ds, chunk=CHUNK):
+    """
+    Chunk sizes for the horizontal grid dimensions of every variable
+    in a dataset (e.g. eta_rho/xi_rho, eta_u/xi_u, eta_psi/xi_psi).
+    """
+    return {dim: chunk for name in ds.variables for dim in ds[name].dims
+            if dim.startswith(GRID_DIMS)}
+
+
+def _whole_chunks(mask, ends):
+    # positions of every chunk (ending before ends) that has a position in mask
+    chunk = np.searchsorted(ends, np.arange(len(mask)), side='right')
+    return np.isin(chunk, np.unique(chunk[mask]))
@@ -4,99 +4,56 @@ studying drivers of low oxygen in Puget Sound terminal inlets.
 
 Aurora Leeson
 August 2025
+
+Usage:
+    python main.py                 statistics and all figures
+    python main.py stats           budget error, group tests and regressions
+    python main.py figures         all figures
+    python main.py figure 10       one figure (e.g. 1, 07, figure_12, window_sensitivity)
+
+Options:
+    --only <stage> [...]      run only these stages (or the stages producing
+                              these values) and the stages they depend on,
+                              e.g. --only figure_12 or --only group_tests
+    --workers <n>             number of threads for the stages (default: one
+                              per CPU, 1 runs every stage in turn)
+    --headless                render figures with the Agg backend and save them
+                              to figure_dir instead of showing them
+    --reload                  reload the project modules (to make editing easier
+                              when re-running the script in an interactive session)
+    --trace-memory            also trace the peak Python memory of each stage
+                              (runs the stages one after the other)
+    --profile-json <file>     write the stage profile to a JSON file
+
+Every stage (reading a dictionary, the monthly means, a regression,
+a figure, ...) declares its inputs and outputs in build_graph(), and
+stage_graph.py runs independent stages concurrently and only the stages
+that the requested results depend on. Project modules are imported when
+a stage first needs them, so e.g. `stats` never imports matplotlib,
+cmocean or xarray. All inputs and results are kept in the dictionary
+`run` (also after `%run main.py stats` in IPython).
 """
 
-import pandas as pd
-import xarray as xr
-import matplotlib.pylab as plt
-import pickle
-
-# import helper functions
-import helper_functions
-import get_monthly_means
-import budget_error
-import figure_01
-import figure_07
-import figure_08
-import figure_09
-import figure_10
-import figure_11
-import figure_12
-import multiple_regression
-
-# reload to make editing easier
-from importlib import reload
-reload(helper_functions)
-reload(get_monthly_means)
-reload(budget_error)
-reload(figure_01)
-reload(figure_07)
-reload(figure_08)
-reload(figure_09)
-reload(figure_10)
-reload(figure_11)
-reload(figure_12)
-reload(multiple_regression)
-
-plt.close('all')
+import os
+import sys
+import argparse
+import threading
+from functools import partial
+from importlib import import_module, reload
 
 ##########################################################
-##                    Read in data                      ##
+##                 Key values                           ##
 ##########################################################
 
-print('Reading data...')
-
-
-# LiveOcean grid (cas7 version)
-grid_ds = xr.open_dataset('../DATA_terminal_inlet_DO/LO_cas7_grid.nc')
-
-# Puget Sound sub-domain within LiveOcean
-PSbox_ds = xr.open_dataset('../DATA_terminal_inlet_DO/PugetSound_gridsizes.nc')
-
-# Puget Sound hypoxic volume time series
-with open('../DATA_terminal_inlet_DO/PS_hypoxic_volume_dict.pickle', 'rb') as handle:
-    hyp_vol_dict = pickle.load(handle)
-
-# Number of days that each grid cell experiences bottom hypoxia per year
-with open('../DATA_terminal_inlet_DO/days_with_bottom_hypoxia_dict.pickle', 'rb') as handle:
-    hyp_days_dict = pickle.load(handle)
-
-# Mean bottom DO concentration of each grid cell during hypoxic season
-with open('../DATA_terminal_inlet_DO/mean_hypoxic_season_bottom_DO_dict.pickle', 'rb') as handle:
-    hyp_seas_DO_dict = pickle.load(handle)
+# directory with input data
+data_dir = '../DATA_terminal_inlet_DO'
 
-# NOTE: data in deeplay_dict and shallowlay_dict
-# are tidally-averaged daily time series
-# in units of kmol O2 per second
-# Values have been passed through a 71-hour lowpass Godin filter
-# (Thomson & Emery, 2014)
-
-# terminal inlet deep layer values
-with open('../DATA_terminal_inlet_DO/deeplay_dict.pickle', 'rb') as handle:
-    deeplay_dict = pickle.load(handle)
-
-# terminal inlet shallow layer values
-with open('../DATA_terminal_inlet_DO/shallowlay_dict.pickle', 'rb') as handle:
-    shallowlay_dict = pickle.load(handle)
-
-# terminal inlet dimensions
-with open('../DATA_terminal_inlet_DO/dimensions_dict.pickle', 'rb') as handle:
-    dimensions_dict = pickle.load(handle)
-
-# terminal inlet DO concentrations [mg/L]
-with open('../DATA_terminal_inlet_DO/DOconcen_dict.pickle', 'rb') as handle:
-    DOconcen_dict = pickle.load(handle)
-
-# get inlet names
-inlets = list(deeplay_dict.keys())
+# directory the figures are saved to (with --headless)
+figure_dir = 'figures'
 
 # list of hypoxic inlets
 hyp_inlets = ['penn','case','holmes','portsusan','lynchcove','dabob']
 
-##########################################################
-##                 Key values                           ##
-##########################################################
-
 # convert from kmol O2 per m3 per second to mg/L per day
 kmolm3sec_to_mgLday = 1000 * 32 * 60 * 60 * 24
 
@@ -104,27 +61,19 @@ kmolm3sec_to_mgLday = 1000 * 32 * 60 * 60 * 24
 minday = 164
 maxday = 225
 
-##########################################################
-##   Get dates for analysis (2017.01.02 to 2017.12.30)  ##
-##########################################################
-
+# year of the analysis (data from 2017.01.02 to 2017.12.30)
 year = '2017'
 
-# set up dates
-startdate = year + '.01.01'
-enddate = year + '.12.31'
-enddate_hrly = str(int(year)+1)+'.01.01 00:00:00'
+# constants available to every stage
+CONSTANTS = {'hyp_inlets': hyp_inlets,
+             'kmolm3sec_to_mgLday': kmolm3sec_to_mgLday,
+             'minday': minday,
+             'maxday': maxday}
 
-# create time_vector
-dates_hrly = pd.date_range(start= startdate, end=enddate_hrly, freq= 'h')
-dates_local_hrly = [helper_functions.get_dt_local(x) for x in dates_hrly]
-# crop time vector (because we only have jan 2 - dec 30)
-dates_daily = pd.date_range(start= startdate, end=enddate, freq= 'd')[2::]
-dates_local_daily = [helper_functions.get_dt_local(x) for x in dates_daily]
-
-##########################################################
-##                 Get monthly means                    ## 
-##########################################################
+# pickled dictionaries in the data store (see data_store.DICT_FILES)
+# (deeplay_dict and shallowlay_dict are read into inlet_dataset instead)
+DICT_NAMES = ['hyp_vol_dict','hyp_days_dict','hyp_seas_DO_dict',
+              'dimensions_dict','DOconcen_dict']
 
 # MONTHLYmean_XXXX are arrays of monthly mean values
 # for all inlets, compressed into a single array
@@ -132,87 +81,423 @@ dates_local_daily = [helper_functions.get_dt_local(x) for x in dates_daily]
 # df_MONTHLY_mean_XXX are dataframes, where each column
 # is an individual inlet. All columns contain monthly
 # mean values corresponding to the inlet (ie., 12 rows)
-
-[MONTHLYmean_DOdeep,
-MONTHLYmean_DOin,
-MONTHLYmean_Tflush,
-MONTHLYmean_perchyp,
-df_MONTHLYmean_DOdeep,
-df_MONTHLYmean_DOin,
-df_MONTHLYmean_Tflush,
-df_MONTHLYmean_perchyp] = get_monthly_means.get_monthly_means(deeplay_dict,DOconcen_dict,
-                                                                dimensions_dict,inlets)
+MONTHLY_MEANS = ['MONTHLYmean_DOdeep','MONTHLYmean_DOin','MONTHLYmean_Tflush','MONTHLYmean_perchyp',
+                 'df_MONTHLYmean_DOdeep','df_MONTHLYmean_DOin','df_MONTHLYmean_Tflush','df_MONTHLYmean_perchyp']
+
+# figures in the order they are listed: {name: (module, function, inputs)}
+FIGURES = {
+    # Bathymetry map
+    'figure_01': ('figure_01', 'model_bathy',
+                  ['grid']),
+    # Hypoxic volume time series
+    'figure_07': ('figure_07', 'hypoxic_volume',
+                  ['grid','hyp_vol_dict','PSbox']),
+    # Map of Puget Sound hypoxia
+    'figure_08': ('figure_08', 'pugetsound_hyp_map',
+                  ['grid','PSbox','hyp_days_dict','hyp_seas_DO_dict']),
+    # Mean DOdeep vs % hyp vol and  DOdeep time series
+    'figure_09': ('figure_09', 'dodeep_hypvol_timeseries',
+                  ['MONTHLYmean_DOdeep','MONTHLYmean_perchyp','DOconcen_dict',
+                   'dates_local_daily','dates_local_hrly','inlets','minday','maxday']),
+    # Budget Bar Charts
+    'figure_10': ('figure_10', 'budget_barchart',
+                  ['inlets','shallowlay_dict','deeplay_dict',
+                   'dates_local_hrly','dates_local_daily','hyp_inlets',
+                   'minday','maxday','kmolm3sec_to_mgLday','rates','group_averages']),
+    # Net decrease (Jun 15 to Aug 15) boxplots
+    'figure_11': ('figure_11', 'net_decrease_boxplots',
+                  ['dimensions_dict','rates','minday','maxday']),
+    # Sensitivity to the drawdown window choice
+    'window_sensitivity': ('window_sweep', 'plot_window_sensitivity',
+                           ['window_sweep','dates_local_daily','minday','maxday']),
+    # Plot monthly mean DOdeep, DOin, Tflush, and % hyp vol
+    'figure_12': ('figure_12', 'plot_monthly_means',
+                  MONTHLY_MEANS[:7]),
+}
+
+# results printed by the stats command
+STATS = ['closure','group_tests','group_perm','group_boot','regression','regression_by_inlet']
 
 ##########################################################
-##               Deep Budget Error Analysis             ##
+##                  Module loading                      ##
 ##########################################################
 
-# calculate and print error of budget
-# expressed as a % of QinDOin and biological consumption
-budget_error.budget_error(inlets,shallowlay_dict,deeplay_dict,
-                          dimensions_dict,kmolm3sec_to_mgLday)
+# set by --reload
+RELOAD = False
+_reloaded = set()
+# stages import modules from several threads
+_reload_lock = threading.Lock()
+
+
+def module(name):
+    """
+    Import a project module on first use
+    (and reload it once per run with --reload).
+    """
+    mod = import_module(name)
+    if RELOAD:
+        with _reload_lock:
+            if name not in _reloaded:
+                mod = reload(mod)
+                _reloaded.add(name)
+    return mod
 
 ##########################################################
-##                   Bathymetry map                     ## 
+##                       Stages                         ##
 ##########################################################
 
-figure_01.model_bathy(grid_ds)
+def read_grid():
+    # LiveOcean grid (cas7 version)
+    # (psi grid and masks are computed once and saved next to the grid file)
+    # only the Salish Sea part of the grid shown in the map figures is read
+    grid = module('grid_geometry').load_grid_geometry(data_dir + '/LO_cas7_grid.nc',
+                                                      xlim=[-124.98549,-122],
+                                                      ylim=[46.8165519,50.39679])
+    if grid.bytes_read > 0:
+        print('    LO_cas7_grid: read {:.1f} MB'.format(grid.bytes_read/1e6))
+    return grid
 
-##########################################################
-##             Hypoxic volume time series               ## 
-##########################################################
 
-figure_07.hypoxic_volume(grid_ds,hyp_vol_dict,PSbox_ds)
+def read_PSbox():
+    # Puget Sound sub-domain within LiveOcean
+    PSbox = module('grid_geometry').load_grid_geometry(data_dir + '/PugetSound_gridsizes.nc')
+    if PSbox.bytes_read > 0:
+        print('    PugetSound_gridsizes: read {:.1f} MB'.format(PSbox.bytes_read/1e6))
+    return PSbox
 
-##########################################################
-##              Map of Puget Sound hypoxia              ## 
-##########################################################
 
-figure_08.pugetsound_hyp_map(grid_ds,PSbox_ds,hyp_days_dict,
-                             hyp_seas_DO_dict)
+def build_store():
+    # convert the pickled dictionaries to a columnar, memory-mapped store
+    # (only done on the first run, or when a pickle has changed)
+    return module('data_store').build_store(data_dir)
 
-##########################################################
-##   Mean DOdeep vs % hyp vol and  DOdeep time series   ## 
-##########################################################
 
-figure_09.dodeep_hypvol_timeseries(MONTHLYmean_DOdeep,
-                                    MONTHLYmean_perchyp,
-                                    DOconcen_dict,
-                                    dates_local_daily,
-                                    dates_local_hrly,
-                                    inlets,minday,maxday)
+def load_dict(name, store_dir):
+    # hyp_vol_dict: Puget Sound hypoxic volume time series
+    # hyp_days_dict: number of days that each grid cell experiences bottom hypoxia per year
+    # hyp_seas_DO_dict: mean bottom DO concentration of each grid cell during hypoxic season
+    # dimensions_dict: terminal inlet dimensions
+    # DOconcen_dict: terminal inlet DO concentrations [mg/L]
+    return module('data_store').load_dict(store_dir, name)
 
-##########################################################
-##                  Budget Bar Charts                   ##
-##########################################################
 
-figure_10.budget_barchart(inlets,shallowlay_dict,deeplay_dict,
-                    dates_local_hrly,dates_local_daily,hyp_inlets,
-                    minday,maxday,kmolm3sec_to_mgLday)
+def read_inlet_dataset(store_dir):
+    # terminal inlet deep and shallow layer values,
+    # as one (layer x inlet x term x day) array
+
+    # NOTE: data in deeplay_dict and shallowlay_dict
+    # are tidally-averaged daily time series
+    # in units of kmol O2 per second
+    # Values have been passed through a 71-hour lowpass Godin filter
+    # (Thomson & Emery, 2014)
+    return module('inlet_dataset').InletDataset.from_store(store_dir)
+
+
+def layer_dict(layer, inlet_dataset):
+    # {inlet: {term: Series}} view of one layer, for code written
+    # for the original dictionaries
+    return inlet_dataset.as_dict(layer)
+
+
+def open_cache():
+    # cache of analysis results, keyed on a hash of each stage's inputs
+    # (delete the directory or call cache.clear() to start over)
+    return module('result_cache').ResultCache(data_dir + '/result_cache')
+
+
+def get_inlets(deeplay_dict):
+    # get inlet names
+    return list(deeplay_dict.keys())
+
+
+def get_dates():
+    import pandas as pd
+    helper_functions = module('helper_functions')
+
+    # set up dates
+    startdate = year + '.01.01'
+    enddate = year + '.12.31'
+    enddate_hrly = str(int(year)+1)+'.01.01 00:00:00'
+
+    # create time_vector
+    dates_hrly = pd.date_range(start= startdate, end=enddate_hrly, freq= 'h')
+    dates_local_hrly = helper_functions.get_dt_local_index(dates_hrly)
+    # crop time vector (because we only have jan 2 - dec 30)
+    dates_daily = pd.date_range(start= startdate, end=enddate, freq= 'd')[2::]
+    dates_local_daily = helper_functions.get_dt_local_index(dates_daily)
+    # calendar dates of the daily data (index 0 is Jan 02),
+    # used to find month boundaries
+    dates_data = pd.date_range(start= year + '.01.02', periods=len(dates_daily), freq= 'd')
+
+    return dates_local_hrly, dates_local_daily, dates_data
+
+
+def monthly_means(cache, deeplay_dict, DOconcen_dict, dimensions_dict, inlets, dates_data):
+    return cache.cached('get_monthly_means',module('get_monthly_means').get_monthly_means,
+                        deeplay_dict,DOconcen_dict,
+                        dimensions_dict,inlets,dates_data)
+
+
+def closure_table(cache, inlets, shallowlay_dict, deeplay_dict, dimensions_dict,
+                  kmolm3sec_to_mgLday, dates_data):
+    # budget closure diagnostics for every inlet, annual and monthly
+    # (table indexed by inlet and period, see budget_closure.py)
+    return cache.cached('budget_closure',module('budget_closure').closure_table,
+                        inlets,shallowlay_dict,deeplay_dict,
+                        dimensions_dict,kmolm3sec_to_mgLday,dates=dates_data)
+
+
+def inlet_rates(deeplay_dict, inlets, kmolm3sec_to_mgLday):
+    # volume-normalized deep layer rates [mg/L per day] of every inlet, term and day
+    # (shared by figure_10, figure_11 and the group tests)
+    return module('inlet_rates').InletRates(deeplay_dict,inlets,kmolm3sec_to_mgLday)
+
+
+def group_averages(cache, rates, hyp_inlets, minday, maxday):
+    # mean rates of oxygenated and hypoxic inlets (used in figure_10)
+    # (keyed on the rates array, see InletRates.__getstate__)
+    return cache.cached('group_averages',module('figure_10').get_group_averages,
+                        rates,hyp_inlets,minday,maxday)
+
+
+def group_values(rates, hyp_inlets, minday, maxday):
+    # drawdown-period means of every budget term, (oxygenated, hypoxic) x inlets x terms
+    return rates.group_values(minday,maxday,rates.split_groups(hyp_inlets))
+
+
+def group_tests(group_values, rates):
+    # Shapiro-Wilk, Bartlett's and Welch's t-test of hypoxic vs. oxygenated
+    # inlets for every budget term (one row per term)
+    return module('group_stats').compare_groups(group_values,rates.terms)
+
+
+def group_perm(group_values, rates):
+    # exact permutation tests
+    # (no normality assumption, with only 6 and 7 inlets per group)
+    return module('resampling').permutation_test(group_values,rates.terms)
+
+
+def group_boot(group_values, rates):
+    # bootstrap confidence intervals of the group differences
+    return module('resampling').bootstrap_ci(group_values,rates.terms)
+
+
+def window_sweep(rates, hyp_inlets, minday, maxday):
+    import numpy as np
+    # Welch's t-test of d/dt(DO) for every window start/end
+    # within 45 days of the drawdown window
+    return module('window_sweep').sweep_group_test(rates,'d/dt(DO)',hyp_inlets,
+                                                   starts=np.arange(minday-45,minday+46),
+                                                   ends=np.arange(maxday-45,maxday+46))
+
+
+def regression(cache, MONTHLYmean_DOdeep, MONTHLYmean_DOin, MONTHLYmean_Tflush):
+    return cache.cached('multiple_regression',
+                        module('multiple_regression').multiple_regression,
+                        MONTHLYmean_DOdeep,
+                        MONTHLYmean_DOin,
+                        MONTHLYmean_Tflush,
+                        verbose=False)
+
+
+def regression_by_inlet(cache, df_MONTHLYmean_DOdeep, df_MONTHLYmean_DOin, df_MONTHLYmean_Tflush):
+    # the same model for every inlet and every leave-one-inlet-out subset
+    return cache.cached('regression_by_inlet',
+                        module('multiple_regression').regression_by_inlet,
+                        df_MONTHLYmean_DOdeep,
+                        df_MONTHLYmean_DOin,
+                        df_MONTHLYmean_Tflush)
+
+
+def draw_figure(name, *args):
+    # call the figure function of one figure
+    module_name, function_name, inputs = FIGURES[name]
+    return getattr(module(module_name), function_name)(*args)
+
+
+def render_figure(name, *args):
+    # draw one figure with the Agg backend and save it to figure_dir
+    # (runs on a worker process)
+    return module('render_figures').render_figure(name, partial(draw_figure, name), args, figure_dir)
+
+
+def build_graph(headless=False):
+    """
+    All stages with their inputs and outputs.
+
+    INPUT:
+        headless: figures are saved to figure_dir on worker processes
+            (otherwise they are shown, from the main thread)
+    """
+    graph = module('stage_graph').StageGraph()
+
+    # read in data
+    graph.add('grid', read_grid)
+    graph.add('PSbox', read_PSbox)
+    graph.add('store_dir', build_store)
+    for name in DICT_NAMES:
+        graph.add(name, partial(load_dict, name), inputs=['store_dir'])
+    graph.add('inlet_dataset', read_inlet_dataset, inputs=['store_dir'])
+    graph.add('deeplay_dict', partial(layer_dict, 'deep'), inputs=['inlet_dataset'])
+    graph.add('shallowlay_dict', partial(layer_dict, 'shallow'), inputs=['inlet_dataset'])
+    graph.add('cache', open_cache)
+    graph.add('inlets', get_inlets, inputs=['deeplay_dict'])
+    graph.add('dates', get_dates, outputs=['dates_local_hrly','dates_local_daily','dates_data'])
+
+    # monthly means
+    graph.add('get_monthly_means', monthly_means,
+              inputs=['cache','deeplay_dict','DOconcen_dict','dimensions_dict','inlets','dates_data'],
+              outputs=MONTHLY_MEANS)
+
+    # deep budget error analysis
+    graph.add('budget_closure', closure_table,
+              inputs=['cache','inlets','shallowlay_dict','deeplay_dict','dimensions_dict',
+                      'kmolm3sec_to_mgLday','dates_data'],
+              outputs=['closure'])
+
+    # drawdown-period group averages and tests
+    graph.add('rates', inlet_rates, inputs=['deeplay_dict','inlets','kmolm3sec_to_mgLday'])
+    graph.add('group_averages', group_averages, inputs=['cache','rates','hyp_inlets','minday','maxday'])
+    graph.add('group_values', group_values, inputs=['rates','hyp_inlets','minday','maxday'])
+    graph.add('group_tests', group_tests, inputs=['group_values','rates'])
+    graph.add('group_perm', group_perm, inputs=['group_values','rates'])
+    graph.add('group_boot', group_boot, inputs=['group_values','rates'])
+    graph.add('window_sweep', window_sweep, inputs=['rates','hyp_inlets','minday','maxday'])
+
+    # multiple regression
+    graph.add('multiple_regression', regression,
+              inputs=['cache','MONTHLYmean_DOdeep','MONTHLYmean_DOin','MONTHLYmean_Tflush'],
+              outputs=['regression'])
+    graph.add('regression_by_inlet', regression_by_inlet,
+              inputs=['cache','df_MONTHLYmean_DOdeep','df_MONTHLYmean_DOin','df_MONTHLYmean_Tflush'],
+              outputs=['regression_by_inlet','regression_leave_one_out'])
+
+    # figures (headless: the paths of the files written)
+    for name, (module_name, function_name, inputs) in FIGURES.items():
+        if headless:
+            graph.add(name, partial(render_figure, name), inputs=inputs, where='process')
+        else:
+            graph.add(name, partial(draw_figure, name), inputs=inputs, outputs=[], where='main')
+
+    return graph
 
 ##########################################################
-##        Net decrease (Jun 15 to Aug 15) boxplots      ## 
+##                      Statistics                      ##
 ##########################################################
 
-figure_11.net_decrease_boxplots(dimensions_dict,deeplay_dict,
-                                minday,maxday)
-
-#########################################################
-##Plot monthly mean DOdeep, DOin, Tflush, and % hyp vol##
-#########################################################
-        
-figure_12.plot_monthly_means(MONTHLYmean_DOdeep,
-                            MONTHLYmean_DOin,
-                            MONTHLYmean_Tflush,
-                            MONTHLYmean_perchyp,
-                            df_MONTHLYmean_DOdeep,
-                            df_MONTHLYmean_DOin,
-                            df_MONTHLYmean_Tflush)
+def print_stats(run):
+    """
+    Print the budget error, group tests and regressions (those that were computed).
+    """
+    # error of budget
+    # expressed as a % of QinDOin and biological consumption
+    if 'closure' in run:
+        budget_error = module('budget_error')
+        error_QinDOin, error_consumption = budget_error.bulk_error(run['closure'])
+        budget_error.print_budget_error(error_QinDOin,error_consumption)
+
+    # drawdown-period group tests
+    if 'group_tests' in run:
+        group_stats = module('group_stats')
+        group_stats.print_group_tests(run['group_tests'], group_stats.TTEST_TERMS)
+    if 'group_perm' in run and 'group_boot' in run:
+        module('resampling').print_resampling(run['group_perm'], run['group_boot'],
+                                              module('group_stats').TTEST_TERMS)
+
+    # multiple regression, pooled and by inlet
+    if 'regression' in run:
+        module('multiple_regression').print_multiple_regression(run['regression'])
+    if 'regression_by_inlet' in run:
+        module('multiple_regression').print_regression_by_inlet(run['regression_by_inlet'],
+                                                                run['regression_leave_one_out'])
 
 ##########################################################
-##                 Multiple regression                  ## 
+##                  Command line                        ##
 ##########################################################
 
-multiple_regression.multiple_regression(MONTHLYmean_DOdeep,
-                                        MONTHLYmean_DOin,
-                                        MONTHLYmean_Tflush)
\ No newline at end of file
+def figure_name(arg):
+    """
+    Figure name from a command line argument (e.g. '1', '07' or 'figure_12').
+    """
+    name = 'figure_{:02d}'.format(int(arg)) if arg.isdigit() else arg
+    if name not in FIGURES:
+        raise ValueError('unknown figure {} (use one of {})'.format(arg, ', '.join(FIGURES)))
+    return name
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Drivers of low oxygen in Puget Sound terminal inlets.')
+    parser.add_argument('command', nargs='?', default='all', choices=['all','stats','figures','figure'])
+    parser.add_argument('figure', nargs='?', help='figure number or name (for the figure command)')
+    parser.add_argument('--only', nargs='+', default=None, metavar='STAGE')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--reload', action='store_true')
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--profile-json', default=None)
+    args = parser.parse_args(argv)
+    if (args.command == 'figure') != (args.figure is not None):
+        parser.error('give a figure number with the figure command (and only then)')
+    if args.figure is not None:
+        try:
+            args.figure = figure_name(args.figure)
+        except ValueError as error:
+            parser.error(str(error))
+    return args
+
+
+def main(argv=None):
+    global RELOAD
+    args = parse_args(argv)
+    RELOAD = args.reload
+
+    graph = build_graph(headless=args.headless)
+    if args.only is not None:
+        targets = args.only
+    elif args.command == 'figure':
+        targets = [args.figure]
+    else:
+        targets = (STATS if args.command in ('all','stats') else []) + \
+                  (list(FIGURES) if args.command in ('all','figures') else [])
+    try:
+        stages = graph.upstream(targets, CONSTANTS)
+    except KeyError as error:
+        sys.exit('main.py: {}'.format(error.args[0]))
+    figures = [name for name in stages if name in FIGURES]
+
+    # wall time, CPU time and memory of every stage (summary printed at the end)
+    profiler = module('stage_profiler').StageProfiler(trace_memory=args.trace_memory)
+    workers = args.workers or os.cpu_count() or 1
+    concurrent = workers > 1 and not args.trace_memory
+
+    process_pool = None
+    if figures and args.headless:
+        # Agg backend, figures written to figure_dir, one process per figure
+        # (the workers are started before any stage runs)
+        render_figures = module('render_figures')
+        render_figures.use_agg()
+        if concurrent:
+            process_pool = render_figures.process_pool(min(len(figures), workers))
+    elif figures:
+        import matplotlib.pyplot as plt
+        plt.close('all')
+
+    try:
+        with profiler.stage('{} stages'.format(len(stages))):
+            run = graph.run(targets, values=CONSTANTS, max_workers=workers,
+                            process_pool=process_pool, profiler=profiler)
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    print_stats(run)
+
+    profiler.print_summary()
+    if args.profile_json is not None:
+        profiler.to_json(args.profile_json)
+    run['profiler'] = profiler
+    return run
+
+
+if __name__ == '__main__':
+    run = main(sys.argv[1:])
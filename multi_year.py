@@ -0,0 +1,196 @@
+"""
+Run the budget, monthly-mean, regression and t-test analysis
+for every available year, in parallel across years,
+and collect the results into one multi-year table.
+
+Year-specific inlet dictionaries are expected in
+../DATA_terminal_inlet_DO/<year>/ (same file names as for 2017).
+The 2017 dictionaries in ../DATA_terminal_inlet_DO itself are used
+for 2017 if there is no 2017 subdirectory.
+
+Run as a script:
+    python multi_year.py [year ...]
+writes multi_year_results.csv (one row per year)
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+import data_store
+import get_monthly_means
+import budget_error
+import multiple_regression
+import group_stats
+import inlet_rates
+
+# directory with input data
+DATA_DIR = '../DATA_terminal_inlet_DO'
+
+# year of the dictionaries stored directly in DATA_DIR
+DEFAULT_YEAR = '2017'
+
+# dictionaries needed by the analysis
+INLET_DICTS = ['deeplay_dict','shallowlay_dict','dimensions_dict','DOconcen_dict']
+
+# list of hypoxic inlets
+HYP_INLETS = ['penn','case','holmes','portsusan','lynchcove','dabob']
+
+# convert from kmol O2 per m3 per second to mg/L per day
+KMOLM3SEC_TO_MGLDAY = 1000 * 32 * 60 * 60 * 24
+
+# drawdown period (June 15 through August 15)
+DRAWDOWN = ('06-15','08-15')
+
+# budget terms compared between hypoxic and oxygenated inlets (as in figure_10)
+TTEST_TERMS = group_stats.TTEST_TERMS
+
+
+def year_data_dir(year, data_dir=DATA_DIR):
+    """
+    Returns the directory with the inlet dictionaries of a year
+    (None if there is no data for that year).
+    """
+    path = os.path.join(data_dir, year)
+    if os.path.exists(os.path.join(path, data_store.DICT_FILES['deeplay_dict'])):
+        return path
+    if year == DEFAULT_YEAR and os.path.exists(os.path.join(data_dir, data_store.DICT_FILES['deeplay_dict'])):
+        return data_dir
+    return None
+
+
+def available_years(data_dir=DATA_DIR):
+    """
+    Returns a sorted list of all years with inlet dictionaries.
+    """
+    years = [name for name in os.listdir(data_dir)
+             if name.isdigit() and len(name) == 4 and year_data_dir(name, data_dir) is not None]
+    if DEFAULT_YEAR not in years and year_data_dir(DEFAULT_YEAR, data_dir) is not None:
+        years.append(DEFAULT_YEAR)
+    return sorted(years)
+
+
+def run_year(year, data_dir=DATA_DIR, hyp_inlets=HYP_INLETS,
+             kmolm3sec_to_mgLday=KMOLM3SEC_TO_MGLDAY):
+    """
+    Run the analysis for one year and return one row (dict) of results.
+    """
+    # read data (through the columnar store)
+    year_dir = year_data_dir(year, data_dir)
+    if year_dir is None:
+        raise FileNotFoundError('run_year: no inlet dictionaries for {} in {}'.format(year, data_dir))
+    store_dir = data_store.build_store(year_dir, names=INLET_DICTS)
+    deeplay_dict = data_store.load_dict(store_dir, 'deeplay_dict')
+    shallowlay_dict = data_store.load_dict(store_dir, 'shallowlay_dict')
+    dimensions_dict = data_store.load_dict(store_dir, 'dimensions_dict')
+    DOconcen_dict = data_store.load_dict(store_dir, 'DOconcen_dict')
+    inlets = list(deeplay_dict.keys())
+
+    # calendar dates of the daily data (index 0 is Jan 02)
+    ndays = len(deeplay_dict[inlets[0]]['d/dt(DO)'])
+    dates_data = pd.date_range(start= year + '.01.02', periods=ndays, freq= 'd')
+    # yearday of drawdown period
+    minday = dates_data.searchsorted(pd.Timestamp(year + '-' + DRAWDOWN[0]))
+    maxday = dates_data.searchsorted(pd.Timestamp(year + '-' + DRAWDOWN[1]))
+
+    row = {'year': year, 'n_inlets': len(inlets), 'minday': minday, 'maxday': maxday}
+
+    # monthly means
+    [MONTHLYmean_DOdeep,
+    MONTHLYmean_DOin,
+    MONTHLYmean_Tflush,
+    MONTHLYmean_perchyp,
+    df_MONTHLYmean_DOdeep,
+    df_MONTHLYmean_DOin,
+    df_MONTHLYmean_Tflush,
+    df_MONTHLYmean_perchyp] = get_monthly_means.get_monthly_means(deeplay_dict,DOconcen_dict,
+                                                                    dimensions_dict,inlets,dates_data)
+    row['mean_DOdeep'] = np.nanmean(MONTHLYmean_DOdeep)
+    row['mean_DOin'] = np.nanmean(MONTHLYmean_DOin)
+    row['mean_Tflush'] = np.nanmean(MONTHLYmean_Tflush)
+    row['mean_perchyp'] = np.nanmean(MONTHLYmean_perchyp)
+
+    # budget error
+    error_QinDOin, error_consumption = budget_error.budget_error(inlets,shallowlay_dict,deeplay_dict,
+                                                                 dimensions_dict,kmolm3sec_to_mgLday,
+                                                                 verbose=False)
+    row['error_QinDOin_percent'] = error_QinDOin
+    row['error_consumption_percent'] = error_consumption
+
+    # multiple regression
+    # (skip nan months, e.g. from inlets with missing data)
+    valid = ~np.isnan(MONTHLYmean_DOdeep + MONTHLYmean_DOin + MONTHLYmean_Tflush)
+    regression = multiple_regression.multiple_regression(MONTHLYmean_DOdeep[valid],
+                                                         MONTHLYmean_DOin[valid],
+                                                         MONTHLYmean_Tflush[valid],
+                                                         verbose=False)
+    row.update(regression)
+
+    # Welch's t-test of hypoxic vs. oxygenated inlets during drawdown
+    row.update(drawdown_ttests(deeplay_dict,inlets,hyp_inlets,
+                               minday,maxday,kmolm3sec_to_mgLday))
+
+    return row
+
+
+def drawdown_ttests(deeplay_dict,inlets,hyp_inlets,
+                    minday,maxday,kmolm3sec_to_mgLday):
+    """
+    Welch's t-test of drawdown-period rates [mg/L per day]
+    of hypoxic vs. oxygenated inlets, for each term in TTEST_TERMS.
+    Returns a dictionary with the group means and p-value of each term.
+    """
+    # drawdown-period means normalized by volume [mg/L per day], (2 groups x inlets x terms)
+    rates = inlet_rates.InletRates(deeplay_dict,inlets,kmolm3sec_to_mgLday,terms=TTEST_TERMS)
+    values = rates.group_values(minday,maxday,rates.split_groups(hyp_inlets))
+    table = group_stats.compare_groups(values, TTEST_TERMS)
+
+    results = {}
+    for attribute in TTEST_TERMS:
+        results['hyp_mean ' + attribute] = table.loc[attribute,'mean_hyp']
+        results['oxy_mean ' + attribute] = table.loc[attribute,'mean_oxy']
+        results['welch_p ' + attribute] = table.loc[attribute,'welch_p']
+    return results
+
+
+def run_years(years=None, data_dir=DATA_DIR, max_workers=None, **kwargs):
+    """
+    Run run_year() for every year on a process pool.
+
+    INPUT:
+        years: list of years (default: all available years)
+        max_workers: number of processes (default: one per CPU, at most one per year)
+        kwargs: passed on to run_year()
+
+    OUTPUT: DataFrame with one row per year
+        (years without data are skipped, with n_inlets = 0 and nan results)
+    """
+    if years is None:
+        years = available_years(data_dir)
+    missing = [year for year in years if year_data_dir(year, data_dir) is None]
+    for year in missing:
+        print('multi_year: no inlet dictionaries for {} in {}, skipped'.format(year, data_dir))
+    found = [year for year in years if year not in missing]
+    if max_workers is None:
+        max_workers = min(len(found), os.cpu_count() or 1)
+
+    if max_workers <= 1:
+        results = {year: run_year(year, data_dir, **kwargs) for year in found}
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {year: pool.submit(run_year, year, data_dir, **kwargs) for year in found}
+            results = {year: future.result() for year, future in futures.items()}
+
+    # one row per year, in the order requested
+    rows = [results[year] if year in results else {'year': year, 'n_inlets': 0}
+            for year in years]
+    return pd.DataFrame(rows).set_index('year')
+
+
+if __name__ == '__main__':
+    years = sys.argv[1:] if len(sys.argv) > 1 else None
+    results = run_years(years)
+    results.to_csv('multi_year_results.csv')
+    print(results.T)
@@ -1,53 +1,142 @@
 """
 Calculate multiple linear regression
 of DOdeep dependece on DOin and Tflush
+
+returns a dictionary with the fitted coefficients
+and the r, R^2 and p values that are printed
+
+regression_by_inlet fits the same model for every inlet and for
+every leave-one-inlet-out subset (see batch_regression.py)
 """
 import numpy as np
-from scipy.linalg import lstsq
+import pandas as pd
 from scipy.stats import pearsonr
 
+import batch_regression
+
 def multiple_regression(MONTHLYmean_DOdeep,
                         MONTHLYmean_DOin,
-                        MONTHLYmean_Tflush):
-    
-
-    print('\n=============================================================')
-    print('==================Multiple Linear Regression=================')
-    print('=============================================================\n')
-
-    # create array of predictors
-    input_array = np.array([MONTHLYmean_DOin, MONTHLYmean_Tflush, [1]*len(MONTHLYmean_DOin)]).T
+                        MONTHLYmean_Tflush,
+                        verbose=True):
 
+    # create array of predictors (a batch of one fit)
+    input_array = batch_regression.design([MONTHLYmean_DOin, MONTHLYmean_Tflush])
 
-    B,a,b,c = lstsq(input_array,MONTHLYmean_DOdeep)
-    slope_DOin = B[0]
-    slope_Tflush = B[1]
-    intercept = B[2]
+    fit = batch_regression.fit(input_array,MONTHLYmean_DOdeep)
+    slope_DOin, slope_Tflush, intercept = fit['coef'][0]
 
+    results = {'slope_DOin': slope_DOin,
+               'slope_Tflush': slope_Tflush,
+               'intercept': intercept,
+               'se_DOin': fit['se'][0,0],
+               'se_Tflush': fit['se'][0,1],
+               'se_intercept': fit['se'][0,2]}
 
     # calculate r^2 and p value
+    # DO_deep dependence on DO_in
     r,p = pearsonr(MONTHLYmean_DOin,MONTHLYmean_DOdeep)
-    print('DO_deep dependence on DO_in')
-    print('   r = {}'.format(round(r,3)))
-    print('   R^2 = {}'.format(round((r**2),3)))
-    print('   p = {:.2e}'.format(p))
+    results['r_DOin'] = r
+    results['p_DOin'] = p
 
     # calculate r^2 and p value
+    # (DO_in - DO_deep) dependence on T_flush
     r,p = pearsonr(MONTHLYmean_Tflush,MONTHLYmean_DOin-MONTHLYmean_DOdeep)
-    print('\n(DO_in - DO_deep) dependence on T_flush')
-    print('   r = {}'.format(round(r,3)))
-    print('   R^2 = {}'.format(round((r**2),3)))
-    print('   p = {:.2e}'.format(p))
-
-    print('\nMean deep layer DO [mg/L] = {}*DOin + {}*Tflush + {}\n'.format(
-        round(slope_DOin,2),round(slope_Tflush,2),round(intercept,2)))
+    results['r_Tflush'] = r
+    results['p_Tflush'] = p
 
     # calculate r^2 and p value
+    # DO_deep dependence on DO_in and T_flush
     predicted_DOdeep = slope_DOin * MONTHLYmean_DOin + slope_Tflush * MONTHLYmean_Tflush + intercept
     r,p = pearsonr(MONTHLYmean_DOdeep,predicted_DOdeep)
+    results['r_model'] = r
+    results['p_model'] = p
+
+    if verbose:
+        print_multiple_regression(results)
+
+    return results
+
+def print_multiple_regression(results):
+
+    print('\n=============================================================')
+    print('==================Multiple Linear Regression=================')
+    print('=============================================================\n')
+
+    print('DO_deep dependence on DO_in')
+    print('   r = {}'.format(round(results['r_DOin'],3)))
+    print('   R^2 = {}'.format(round((results['r_DOin']**2),3)))
+    print('   p = {:.2e}'.format(results['p_DOin']))
+
+    print('\n(DO_in - DO_deep) dependence on T_flush')
+    print('   r = {}'.format(round(results['r_Tflush'],3)))
+    print('   R^2 = {}'.format(round((results['r_Tflush']**2),3)))
+    print('   p = {:.2e}'.format(results['p_Tflush']))
+
+    print('\nMean deep layer DO [mg/L] = {}*DOin + {}*Tflush + {}\n'.format(
+        round(results['slope_DOin'],2),round(results['slope_Tflush'],2),round(results['intercept'],2)))
+
     print('DO_deep dependence on DO_in and T_flush')
-    print('   r = {}'.format(round(r,3)))
-    print('   R^2 = {}'.format(round((r**2),3)))
-    print('   p = {:.2e}'.format(p))
-    
-    return
\ No newline at end of file
+    print('   r = {}'.format(round(results['r_model'],3)))
+    print('   R^2 = {}'.format(round((results['r_model']**2),3)))
+    print('   p = {:.2e}'.format(results['p_model']))
+
+def regression_by_inlet(df_MONTHLYmean_DOdeep,
+                        df_MONTHLYmean_DOin,
+                        df_MONTHLYmean_Tflush,
+                        k=4):
+    """
+    Fit DOdeep = a*DOin + b*Tflush + c for every inlet, and for all inlets
+    with one inlet left out at a time, in one batched call each.
+
+    INPUT: dataframes of monthly means (one column per inlet)
+        k: number of folds of the cross-validation of the per-inlet fits
+
+    returns (by_inlet, leave_one_out), dataframes with one row per inlet:
+        slope_DOin, slope_Tflush, intercept (and se_...), R2, p_model, n
+        (by_inlet also has the k-fold cross-validated cv_R2 and cv_rmse)
+    """
+    inlets = list(df_MONTHLYmean_DOdeep.columns)
+    # (inlets x months)
+    DOdeep = df_MONTHLYmean_DOdeep.T.values
+    DOin = df_MONTHLYmean_DOin.T.values
+    Tflush = df_MONTHLYmean_Tflush.T.values
+
+    # one fit per inlet
+    X = batch_regression.design([DOin, Tflush])
+    by_inlet = _coefficient_table(batch_regression.fit(X, DOdeep), inlets)
+    cv = batch_regression.kfold_cv(X, DOdeep, k=k)
+    by_inlet['cv_R2'] = cv['r2']
+    by_inlet['cv_rmse'] = cv['rmse']
+
+    # one fit per left-out inlet, on all (inlet, month) samples
+    groups = np.repeat(np.arange(len(inlets)), DOdeep.shape[1])
+    labels, masks = batch_regression.leave_one_out_masks(groups)
+    X = batch_regression.design([DOin.ravel(), Tflush.ravel()])
+    X = np.broadcast_to(X, (len(labels),) + X.shape[1:])
+    leave_one_out = _coefficient_table(batch_regression.fit(X, DOdeep.ravel(), mask=masks),
+                                       [inlets[label] for label in labels])
+
+    return by_inlet, leave_one_out
+
+def _coefficient_table(fit, index):
+    # dataframe of the coefficients of DOdeep = a*DOin + b*Tflush + c
+    table = pd.DataFrame(fit['coef'], index=index,
+                         columns=['slope_DOin','slope_Tflush','intercept'])
+    for i,name in enumerate(['DOin','Tflush','intercept']):
+        table['se_' + name] = fit['se'][:,i]
+    table['R2'] = fit['r2']
+    table['p_model'] = fit['p_model']
+    table['n'] = fit['n']
+    return table
+
+def print_regression_by_inlet(by_inlet, leave_one_out):
+
+    print('\n=============================================================')
+    print('============Multiple Linear Regression by Inlet==============')
+    print('=============================================================\n')
+
+    print('Fit for each inlet (monthly means, k-fold cross-validated R^2)')
+    print(by_inlet[['slope_DOin','slope_Tflush','intercept','R2','cv_R2']].round(3).to_string())
+
+    print('\nFit for all inlets with one inlet left out')
+    print(leave_one_out[['slope_DOin','slope_Tflush','intercept','R2']].round(3).to_string())
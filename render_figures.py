@@ -0,0 +1,107 @@
+"""
+Render figures headless (Agg backend) and save them to files,
+with the figure functions dispatched to a process pool.
+
+The figure functions are independent and each one ends in plt.show(),
+which does nothing with the Agg backend. Every figure that a function
+leaves open is saved as <outdir>/<name>.<format> (or <name>_<n>.<format>
+if it opens several) and then closed.
+
+Example:
+    jobs = [('figure_01', figure_01.model_bathy, (grid_ds,)), ...]
+    paths = render_all(jobs, outdir='figures')
+"""
+
+import os
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# default output formats
+FORMATS = ('png','pdf')
+
+
+def use_agg():
+    """
+    Switch matplotlib to the non-interactive Agg backend
+    (also if pyplot has already been imported).
+    """
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def render_figure(name, func, args=(), outdir='figures', formats=FORMATS, dpi=200):
+    """
+    Call one figure function with the Agg backend and save the
+    figures it creates.
+
+    OUTPUT: list of paths of the files written
+    """
+    use_agg()
+    import matplotlib.pyplot as plt
+
+    plt.close('all')
+    with warnings.catch_warnings():
+        # plt.show() warns that Agg is non-interactive
+        warnings.filterwarnings('ignore', message='.*non-interactive.*')
+        func(*args)
+
+    os.makedirs(outdir, exist_ok=True)
+    paths = []
+    fignums = plt.get_fignums()
+    for i,num in enumerate(fignums):
+        fig = plt.figure(num)
+        stem = name if len(fignums) == 1 else '{}_{}'.format(name, i+1)
+        for fmt in formats:
+            path = os.path.join(outdir, '{}.{}'.format(stem, fmt))
+            fig.savefig(path, dpi=dpi, bbox_inches='tight')
+            paths.append(path)
+    plt.close('all')
+    return paths
+
+
+def process_pool(max_workers):
+    """
+    Process pool for rendering figures (Agg backend in every worker).
+
+    The workers are started right away, so they are forked before the
+    caller starts any threads (forking a process with running threads
+    can deadlock).
+    """
+    # fork (where available) so workers do not re-run the calling script
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                               initializer=use_agg)
+    # with fork, the first task starts all workers
+    pool.submit(int).result()
+    return pool
+
+
+def render_all(jobs, outdir='figures', formats=FORMATS, max_workers=None, dpi=200):
+    """
+    Render a list of figure jobs in parallel.
+
+    INPUT:
+        jobs: list of (name, figure function, tuple of arguments)
+        outdir: directory to write the figures to
+        formats: file formats to write (e.g. ('png','pdf'))
+        max_workers: number of processes (default: one per CPU, at most one per job)
+            1 renders all figures in this process
+
+    OUTPUT: dictionary {name: list of paths written}
+    """
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+
+    if max_workers <= 1:
+        return {name: render_figure(name, func, args, outdir, formats, dpi)
+                for name, func, args in jobs}
+
+    with process_pool(max_workers) as pool:
+        futures = {name: pool.submit(render_figure, name, func, args, outdir, formats, dpi)
+                   for name, func, args in jobs}
+        return {name: future.result() for name, future in futures.items()}
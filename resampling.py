@@ -0,0 +1,255 @@
+"""
+Permutation tests and bootstrap confidence intervals for comparing
+two groups of inlets (e.g. oxygenated vs. hypoxic), for many budget
+terms at once.
+
+The input is the same (2 groups x inlets x terms) nan-padded array as in
+group_stats.py. Each resample (a permutation of the group labels, or a
+bootstrap draw) is a row of inlet weights, so a whole chunk of resamples
+is evaluated for all terms with one matrix product:
+    group sums = weights (draws x inlets) @ values (inlets x terms)
+Chunks bound the memory use, and can be spread over a process pool.
+
+With 13 inlets split 7/6 there are only C(13,6) = 1716 group assignments,
+so permutation tests are exact (every assignment is evaluated); above
+MAX_EXACT assignments, N_RANDOM random permutations are used instead.
+
+Example:
+    values, terms = group_stats.stack_groups([oxy_dict, hyp_dict])
+    perm = permutation_test(values, terms)
+    boot = bootstrap_ci(values, terms)
+"""
+
+import os
+import itertools
+from math import comb
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# largest number of group assignments that is enumerated exactly
+MAX_EXACT = 1000000
+
+# number of random permutations if there are more than MAX_EXACT assignments
+N_RANDOM = 100000
+
+# default number of bootstrap draws
+N_BOOT = 10000
+
+# resamples evaluated per chunk
+CHUNK = 20000
+
+# statistics supported by permutation_test
+STATISTICS = ['mean_diff', 'welch_t']
+
+# default group labels
+LABELS = ('oxy', 'hyp')
+
+
+def permutation_test(values, index=None, statistic='mean_diff',
+                     max_exact=MAX_EXACT, n_random=N_RANDOM, seed=0,
+                     chunk=CHUNK, max_workers=1):
+    """
+    Two-sided permutation test of group 0 vs. group 1 for every term.
+
+    INPUT:
+        values: array (2 groups x inlets x terms), nan-padded
+        index: label of each term (default 0, 1, ...)
+        statistic: 'mean_diff' (difference of group means) or
+            'welch_t' (Welch's t statistic)
+        max_exact: enumerate all group assignments if there are at most this many,
+            otherwise use n_random random permutations (drawn with seed)
+        chunk: number of assignments evaluated at once
+        max_workers: number of processes (1: no process pool, None: one per CPU)
+
+    OUTPUT: DataFrame with one row per term and columns
+        observed (statistic of the actual groups), p_value, n_draws, exact
+    """
+    if statistic not in STATISTICS:
+        raise ValueError('permutation_test: unsupported statistic {} (use one of {})'.format(statistic, STATISTICS))
+    pooled, n_first = _pool(values)
+    n_total = pooled.shape[0]
+
+    # observed statistic: the first n_first inlets form group 0
+    observed = _group_statistic(np.arange(n_first)[None,:], pooled, statistic)[0]
+
+    n_assignments = comb(n_total, n_first)
+    exact = n_assignments <= max_exact
+    if exact:
+        chunks = _combination_chunks(n_total, n_first, chunk)
+        n_draws = n_assignments
+    else:
+        chunks = _random_permutation_chunks(n_total, n_first, n_random, chunk, seed)
+        n_draws = n_random
+
+    # count the assignments with a statistic at least as extreme as observed
+    # (with a small tolerance, so ties with the observed value are counted)
+    tolerance = 1e-12 * np.maximum(np.abs(observed), 1)
+    count = np.zeros(pooled.shape[1])
+    for stats in _map_chunks(_group_statistic, chunks, (pooled, statistic), max_workers):
+        count += np.sum(np.abs(stats) >= np.abs(observed) - tolerance, axis=0)
+    # a random test does not necessarily include the observed assignment
+    p_value = count / n_draws if exact else (count + 1) / (n_draws + 1)
+    # terms with no valid statistic
+    p_value = np.where(np.isnan(observed), np.nan, p_value)
+
+    if index is None:
+        index = np.arange(pooled.shape[1])
+    return pd.DataFrame({'observed': observed, 'p_value': p_value,
+                         'n_draws': n_draws, 'exact': exact}, index=index)
+
+
+def bootstrap_ci(values, index=None, n_boot=N_BOOT, ci=0.95, seed=0,
+                 chunk=CHUNK, max_workers=1, labels=LABELS):
+    """
+    Bootstrap confidence intervals of the group means and of the difference
+    of the group means (group 0 - group 1) of every term. Inlets are
+    resampled with replacement within each group.
+
+    INPUT:
+        values: array (2 groups x inlets x terms), nan-padded
+        index: label of each term (default 0, 1, ...)
+        n_boot: number of bootstrap draws
+        ci: confidence level
+        chunk, max_workers: as in permutation_test
+
+    OUTPUT: DataFrame with one row per term and columns
+        mean_<label>, low_<label>, high_<label> (for both groups and 'diff')
+    """
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    table = {}
+    means = []
+    for g,label in enumerate(labels):
+        group = _drop_padding(values[g])
+        n = group.shape[0]
+        # draw all indices up front (in chunks), so results do not depend on max_workers
+        chunks = [rng.integers(0, n, size=(min(chunk, n_boot - start), n))
+                  for start in range(0, n_boot, chunk)]
+        boot = np.concatenate(list(_map_chunks(_bootstrap_means, chunks, (group,), max_workers)), axis=0)
+        means.append(boot)
+        table['mean_' + label] = _nanmean(group)
+    means.append(means[0] - means[1])
+    table['mean_diff'] = table['mean_' + labels[0]] - table['mean_' + labels[1]]
+
+    alpha = (1 - ci) / 2
+    for label,boot in zip(list(labels) + ['diff'], means):
+        table['low_' + label] = np.nanquantile(boot, alpha, axis=0)
+        table['high_' + label] = np.nanquantile(boot, 1 - alpha, axis=0)
+
+    if index is None:
+        index = np.arange(values.shape[2])
+    columns = [prefix + label for label in list(labels) + ['diff']
+               for prefix in ['mean_', 'low_', 'high_']]
+    return pd.DataFrame(table, index=index)[columns]
+
+
+def print_resampling(perm, boot, terms, labels=LABELS, names=('oxygenated','hypoxic')):
+    """
+    Print permutation test p-values and bootstrap confidence intervals
+    of some terms.
+    """
+    print('\n=============================================================')
+    print('=============Permutation tests and bootstrap CIs=============')
+    print('=============================================================\n')
+    for term in terms:
+        print(term)
+        kind = 'exact' if perm.loc[term,'exact'] else 'random'
+        print('   permutation test ({} of {} assignments): p = {}'.format(
+            kind, perm.loc[term,'n_draws'], round(perm.loc[term,'p_value'],3)))
+        for label,name in zip(list(labels) + ['diff'], list(names) + ['difference']):
+            print('   {:>11} mean = {:.3f}  [{:.3f}, {:.3f}] mg/L per day'.format(
+                name, boot.loc[term,'mean_' + label],
+                boot.loc[term,'low_' + label], boot.loc[term,'high_' + label]))
+        print('')
+
+
+def _pool(values):
+    # pool both groups into one (inlets x terms) array, dropping padding rows;
+    # the first n_first rows are group 0
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 3 or values.shape[0] != 2:
+        raise ValueError('values must be (2 groups x inlets x terms), got shape {}'.format(values.shape))
+    first = _drop_padding(values[0])
+    second = _drop_padding(values[1])
+    return np.concatenate((first, second), axis=0), first.shape[0]
+
+
+def _drop_padding(group):
+    # drop rows (inlets) that are nan for every term
+    return group[~np.all(np.isnan(group), axis=1)]
+
+
+def _nanmean(values):
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, values, 0).sum(axis=0) / valid.sum(axis=0)
+
+
+def _group_statistic(members, pooled, statistic):
+    # statistic of group 0 (the inlets in each row of members) vs. all other inlets,
+    # for every assignment (rows) and term (columns)
+    n_total = pooled.shape[0]
+    weights = np.zeros((members.shape[0], n_total))
+    np.put_along_axis(weights, members, 1, axis=1)
+    valid = ~np.isnan(pooled)
+    filled = np.where(valid, pooled, 0)
+    # sums and counts of both groups, (assignments x terms)
+    n_a = weights @ valid
+    n_b = valid.sum(axis=0) - n_a
+    sum_a = weights @ filled
+    sum_b = filled.sum(axis=0) - sum_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_a = sum_a / n_a
+        mean_b = sum_b / n_b
+        if statistic == 'mean_diff':
+            return mean_a - mean_b
+        # welch_t
+        sq_a = weights @ filled**2
+        sq_b = (filled**2).sum(axis=0) - sq_a
+        var_a = (sq_a - n_a * mean_a**2) / (n_a - 1)
+        var_b = (sq_b - n_b * mean_b**2) / (n_b - 1)
+        return (mean_a - mean_b) / np.sqrt(var_a/n_a + var_b/n_b)
+
+
+def _bootstrap_means(draws, group):
+    # group means (draws x terms) of bootstrap draws (rows of inlet indices)
+    n = group.shape[0]
+    weights = np.zeros((draws.shape[0], n))
+    rows = np.repeat(np.arange(draws.shape[0]), draws.shape[1])
+    np.add.at(weights, (rows, draws.ravel()), 1)
+    valid = ~np.isnan(group)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weights @ np.where(valid, group, 0)) / (weights @ valid)
+
+
+def _combination_chunks(n_total, n_first, chunk):
+    # all n_first-subsets of range(n_total), as (chunk x n_first) index arrays
+    combinations = itertools.combinations(range(n_total), n_first)
+    while True:
+        block = list(itertools.islice(combinations, chunk))
+        if not block:
+            return
+        yield np.array(block, dtype=np.intp).reshape(len(block), n_first)
+
+
+def _random_permutation_chunks(n_total, n_first, n_random, chunk, seed):
+    # random n_first-subsets of range(n_total), as (chunk x n_first) index arrays
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_random, chunk):
+        size = min(chunk, n_random - start)
+        yield np.argsort(rng.random((size, n_total)), axis=1)[:,:n_first]
+
+
+def _map_chunks(func, chunks, args, max_workers):
+    # func(chunk, *args) for every chunk, in this process or on a process pool
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers <= 1:
+        for chunk in chunks:
+            yield func(chunk, *args)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(func, chunk, *args) for chunk in chunks]
+        for future in futures:
+            yield future.result()
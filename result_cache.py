@@ -0,0 +1,209 @@
+"""
+On-disk cache of analysis results, keyed on a hash of the inputs.
+
+Each stage (e.g. get_monthly_means, budget_error) is cached under a key
+made from the stage name, the source of the stage function's module and
+of every project module it uses (directly or through other project
+modules, e.g. grouped_reduction.py for get_monthly_means), and a content
+hash of every argument it receives (inlet lists, minday/maxday,
+conversion factors, ...). Dictionaries loaded from the data store are
+keyed on their source pickle (name, size and mtime, see
+data_store.StoredDict) instead of their contents, so the memory-mapped
+arrays are not read just to compute a key. A stage is therefore only
+recomputed when something it actually depends on has changed: e.g.
+changing hyp_inlets only invalidates stages that take hyp_inlets.
+
+Results are pickled to <cache_dir>/<key>.pickle. When the cache grows
+beyond max_bytes, the least recently used results are deleted.
+
+Example:
+    cache = ResultCache('../DATA_terminal_inlet_DO/result_cache')
+    out = cache.cached('get_monthly_means', get_monthly_means.get_monthly_means,
+                       deeplay_dict, DOconcen_dict, dimensions_dict, inlets, dates)
+"""
+
+import os
+import sys
+import glob
+import types
+import pickle
+import hashlib
+import inspect
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+# default size limit of the cache
+MAX_BYTES = 500 * 1024**2
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # names of stages that were loaded from / written to the cache this run
+        self.hits = []
+        self.misses = []
+
+    def key(self, stage, func, args, kwargs):
+        """
+        Returns the cache key of one call of a stage.
+        """
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        # include the code of the stage and of the project modules it uses,
+        # so editing any of them invalidates old results
+        for source_file in project_sources(func):
+            with open(source_file, 'rb') as handle:
+                h.update(handle.read())
+        h.update(fingerprint(args).encode())
+        h.update(fingerprint(kwargs).encode())
+        return h.hexdigest()
+
+    def cached(self, stage, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), loaded from the cache if
+        the stage was already computed with the same inputs.
+        """
+        path = os.path.join(self.cache_dir, self.key(stage, func, args, kwargs) + '.pickle')
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as handle:
+                    result = pickle.load(handle)
+                # mark as recently used
+                os.utime(path)
+                self.hits.append(stage)
+                return result
+            except (OSError, EOFError, pickle.UnpicklingError):
+                # e.g. a partially written file; recompute below
+                pass
+
+        result = func(*args, **kwargs)
+        self.misses.append(stage)
+        # write to a temporary file first so readers never see a partial result
+        with open(path + '.tmp', 'wb') as handle:
+            pickle.dump(result, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.evict()
+        return result
+
+    def evict(self):
+        """
+        Delete the least recently used results until the cache
+        is smaller than max_bytes.
+        """
+        # (stages can run concurrently, so another stage may
+        # delete a file between listing and removing it)
+        files = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pickle')):
+            try:
+                files.append((os.stat(path), path))
+            except FileNotFoundError:
+                pass
+        total = sum(stat.st_size for stat, path in files)
+        for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= stat.st_size
+
+    def clear(self):
+        """
+        Delete all cached results.
+        """
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pickle')):
+            os.remove(path)
+
+
+def project_sources(func):
+    """
+    Source files of the module defining func and of every project module
+    (a module in the same directory) it uses, directly or indirectly,
+    found through the modules, functions and classes in their namespaces.
+
+    OUTPUT: sorted list of paths
+    """
+    module = inspect.getmodule(func)
+    if module is None or getattr(module, '__file__', None) is None:
+        return []
+    project_dir = os.path.dirname(os.path.abspath(module.__file__))
+
+    def project_module(obj):
+        # the project module obj is or belongs to (None if it is not one)
+        if not isinstance(obj, types.ModuleType):
+            obj = sys.modules.get(getattr(obj, '__module__', None) or '')
+        path = getattr(obj, '__file__', None)
+        if path is not None and os.path.dirname(os.path.abspath(path)) == project_dir:
+            return obj
+        return None
+
+    found = {module.__name__: module}
+    todo = [module]
+    while todo:
+        for value in list(vars(todo.pop()).values()):
+            if not isinstance(value, (types.ModuleType, types.FunctionType, type)):
+                continue
+            used = project_module(value)
+            if used is not None and used.__name__ not in found:
+                found[used.__name__] = used
+                todo.append(used)
+    return sorted(os.path.abspath(mod.__file__) for mod in found.values())
+
+
+def fingerprint(obj):
+    """
+    Returns a content hash (hex string) of numbers, strings, numpy
+    arrays, pandas objects and (nested) lists, tuples and dicts of them.
+    """
+    h = hashlib.sha256()
+    _update(h, obj)
+    return h.hexdigest()
+
+
+def _update(h, obj):
+    # feed the type and contents of obj into the hash h
+    h.update(type(obj).__name__.encode())
+    if isinstance(obj, Mapping) and getattr(obj, 'store_key', None) is not None:
+        # loaded from the data store: keyed on the source pickle
+        h.update(obj.store_key.encode())
+    elif isinstance(obj, Mapping):
+        # dicts and dictionary adapters (e.g. inlet_dataset.LayerDict)
+        h.update(str(len(obj)).encode())
+        for key, value in obj.items():
+            _update(h, key)
+            _update(h, value)
+    elif isinstance(obj, (list, tuple)):
+        h.update(str(len(obj)).encode())
+        for value in obj:
+            _update(h, value)
+    elif isinstance(obj, pd.DataFrame):
+        _update(h, list(obj.columns))
+        _update(h, obj.index)
+        for column in obj.columns:
+            _update(h, obj[column].to_numpy())
+    elif isinstance(obj, pd.Series):
+        _update(h, obj.index)
+        _update(h, obj.to_numpy())
+    elif isinstance(obj, pd.Index):
+        if isinstance(obj, pd.RangeIndex):
+            h.update(repr((obj.start, obj.stop, obj.step)).encode())
+        else:
+            h.update(str(obj.dtype).encode())
+            _update(h, obj.astype(str).to_numpy() if obj.dtype == object else obj.to_numpy())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _update(h, obj.tolist())
+        else:
+            h.update(str(obj.dtype).encode())
+            h.update(str(obj.shape).encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update(repr(obj).encode())
+    else:
+        # anything else (e.g. Timestamps) is hashed through its pickle
+        h.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,189 @@
+"""
+Spatial index for lon/lat -> grid cell lookups on the rho grid.
+
+For plaid grids (lon only varies along xi and lat only along eta),
+lookups are binary searches on the 1-D lon and lat axes. For curvilinear
+grids, the cell centres are projected to meters (helper_functions.ll2xy
+about the grid centre) and put in a KD-tree. Distances are always
+computed with helper_functions.ll2xy, in meters.
+
+All queries take arrays of points or boxes, so many stations or inlet
+mouths can be mapped in one call.
+
+Example:
+    index = SpatialIndex(PSbox.lon, PSbox.lat)
+    eta, xi, dist = index.nearest([-123.29,-122.76], [48.14,48.93])
+    eta_slice, xi_slice = index.bbox([-123.3,-122.1], [46.93,48.45])
+    eta_slice, xi_slice = index.cells([-123.3,-122.1], [46.93,48.45], halo=1)
+"""
+
+import numpy as np
+
+import helper_functions
+
+# number of KD-tree candidates checked per point (curvilinear grids)
+K = 4
+
+
+class SpatialIndex:
+
+    def __init__(self, lon, lat, plaid=None):
+        """
+        lon, lat: 2-D rho grid (eta x xi) in degrees
+        plaid: True/False, or None to check the grid
+        """
+        self.lon = np.asarray(lon)
+        self.lat = np.asarray(lat)
+        self.shape = self.lon.shape
+        if plaid is None:
+            plaid = is_plaid(self.lon, self.lat)
+        self.plaid = plaid
+
+        if plaid:
+            # 1-D axes (increasing)
+            self.lon_axis = self.lon[0,:]
+            self.lat_axis = self.lat[:,0]
+            self.tree = None
+        else:
+            from scipy.spatial import cKDTree
+            # project to meters about the grid centre
+            self.lon0 = np.nanmean(self.lon)
+            self.lat0 = np.nanmean(self.lat)
+            x, y = helper_functions.ll2xy(self.lon, self.lat, self.lon0, self.lat0)
+            self.tree = cKDTree(np.column_stack((x.ravel(), y.ravel())))
+
+    def nearest(self, lon, lat):
+        """
+        Nearest rho cell of each point.
+
+        INPUT: lon, lat of the points (scalars or arrays of the same shape)
+
+        OUTPUT: eta, xi indices and distance [m] to the cell centre
+            (same shape as lon, lat)
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        if self.plaid:
+            # the distance is separable in lon and lat, so the nearest
+            # cell is the nearest lon and the nearest lat on the axes
+            xi = _nearest_on_axis(self.lon_axis, lon)
+            eta = _nearest_on_axis(self.lat_axis, lat)
+        else:
+            # the projection about the grid centre is slightly distorted
+            # away from the centre, so take the K nearest candidates from
+            # the tree and keep the closest one in the local projection
+            x, y = helper_functions.ll2xy(lon, lat, self.lon0, self.lat0)
+            k = min(K, self.tree.n)
+            dist, cells = self.tree.query(np.column_stack((np.ravel(x), np.ravel(y))), k=k)
+            cells = cells.reshape(-1,k)
+            eta, xi = np.unravel_index(cells, self.shape)
+            dist = self.distance(np.ravel(lon)[:,None], np.ravel(lat)[:,None], eta, xi)
+            best = np.argmin(dist, axis=1)
+            rows = np.arange(len(best))
+            eta = eta[rows,best].reshape(lon.shape)
+            xi = xi[rows,best].reshape(lon.shape)
+        return eta, xi, self.distance(lon, lat, eta, xi)
+
+    def distance(self, lon, lat, eta, xi):
+        """
+        Distance [m] from points to the centres of rho cells (eta, xi).
+        """
+        x, y = helper_functions.ll2xy(self.lon[eta, xi], self.lat[eta, xi],
+                                      np.asarray(lon), np.asarray(lat))
+        return np.sqrt(x**2 + y**2)
+
+    def bbox(self, xlim, ylim, halo=0):
+        """
+        eta, xi slices of the rho cells inside a lon/lat box,
+        plus halo cells on every side.
+        (for curvilinear grids: the index range of all cells in the box)
+        """
+        eta0, eta1, xi0, xi1 = self.bboxes([xlim], [ylim], halo)
+        return slice(eta0[0], eta1[0]), slice(xi0[0], xi1[0])
+
+    def cells(self, xlim, ylim, halo=0):
+        """
+        eta, xi slices of the rho cells that overlap a lon/lat box
+        (e.g. the cells visible in a map), plus halo cells on every side.
+        Cells span halfway to their neighbours, as the psi grid of
+        helper_functions.get_plon_plat (plaid grids only).
+        """
+        if not self.plaid:
+            raise ValueError('SpatialIndex.cells: only supported for plaid grids')
+        slices = []
+        for axis, lim in [(self.lat_axis, ylim), (self.lon_axis, xlim)]:
+            # cell edges inside the box; cell i spans edges i to i+1, so the
+            # cells overlapping the box are the one before the first edge
+            # to the one after the last edge
+            first, last = _axis_range(_cell_edges(axis), lim[0], lim[1])
+            slices.append(slice(max(int(first) - 1 - halo, 0), min(int(last) + halo, len(axis))))
+        return tuple(slices)
+
+    def bboxes(self, xlims, ylims, halo=0):
+        """
+        Index ranges of many lon/lat boxes at once.
+
+        INPUT: xlims, ylims: arrays (nbox x 2) of [min, max] lon and lat
+
+        OUTPUT: arrays eta_start, eta_stop, xi_start, xi_stop (one value per box)
+            (start == stop if there are no cells in a box)
+        """
+        xlims = np.asarray(xlims, dtype=float).reshape(-1,2)
+        ylims = np.asarray(ylims, dtype=float).reshape(-1,2)
+        neta, nxi = self.shape
+        if self.plaid:
+            xi0, xi1 = _axis_range(self.lon_axis, xlims[:,0], xlims[:,1])
+            eta0, eta1 = _axis_range(self.lat_axis, ylims[:,0], ylims[:,1])
+        else:
+            nbox = len(xlims)
+            eta0 = np.zeros(nbox, dtype=int)
+            eta1 = np.zeros(nbox, dtype=int)
+            xi0 = np.zeros(nbox, dtype=int)
+            xi1 = np.zeros(nbox, dtype=int)
+            for i in range(nbox):
+                inside = ((self.lon >= xlims[i,0]) & (self.lon <= xlims[i,1]) &
+                          (self.lat >= ylims[i,0]) & (self.lat <= ylims[i,1]))
+                rows = np.flatnonzero(inside.any(axis=1))
+                cols = np.flatnonzero(inside.any(axis=0))
+                if len(rows) > 0:
+                    eta0[i], eta1[i] = rows[0], rows[-1] + 1
+                    xi0[i], xi1[i] = cols[0], cols[-1] + 1
+        # add the halo (only to boxes that contain cells)
+        empty = (eta1 <= eta0) | (xi1 <= xi0)
+        eta0 = np.where(empty, eta0, np.maximum(eta0 - halo, 0))
+        eta1 = np.where(empty, eta0, np.minimum(eta1 + halo, neta))
+        xi0 = np.where(empty, xi0, np.maximum(xi0 - halo, 0))
+        xi1 = np.where(empty, xi0, np.minimum(xi1 + halo, nxi))
+        return eta0, eta1, xi0, xi1
+
+
+def is_plaid(lon, lat):
+    """
+    True if lon only varies along xi and lat only along eta,
+    and both increase.
+    """
+    return (np.array_equal(lon, np.broadcast_to(lon[0:1,:], lon.shape)) and
+            np.array_equal(lat, np.broadcast_to(lat[:,0:1], lat.shape)) and
+            np.all(np.diff(lon[0,:]) > 0) and np.all(np.diff(lat[:,0]) > 0))
+
+
+def _axis_range(axis, lo, hi):
+    # start and stop of the axis values in [lo, hi] (binary search)
+    return np.searchsorted(axis, lo, side='left'), np.searchsorted(axis, hi, side='right')
+
+
+def _cell_edges(axis):
+    # edges of the cells around the axis values: halfway between them,
+    # and half a cell beyond the first and last (as get_plon_plat)
+    half = np.diff(axis) / 2
+    return np.concatenate(([axis[0] - half[0]], axis[:-1] + half, [axis[-1] + half[-1]]))
+
+
+def _nearest_on_axis(axis, values):
+    # index of the nearest axis value of each value
+    # (binary search, then pick the closer of the two neighbours;
+    # ties go to the lower index, as with np.argmin)
+    i = np.clip(np.searchsorted(axis, values), 1, len(axis) - 1)
+    left = axis[i - 1]
+    right = axis[i]
+    return np.where(np.abs(values - left) <= np.abs(right - values), i - 1, i)
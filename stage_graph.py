@@ -0,0 +1,211 @@
+"""
+A small task-graph scheduler for the analysis stages in main.py.
+
+Each stage declares the names of the values it needs (inputs) and of
+the values it produces (outputs). A stage is started as soon as all its
+inputs are available, so independent branches (e.g. reading the grid
+for the maps while the monthly means and regressions are computed) run
+concurrently, and run(targets=...) computes only the stages the targets
+depend on.
+
+Stages run
+    'thread': on a thread pool (default; numpy, pandas and file reads
+        release the GIL for most of their work)
+    'process': on a process pool, if one is given (e.g. headless figures,
+        as pyplot is not thread-safe), otherwise in the main thread
+    'main': in the main thread (e.g. interactive figures)
+
+Example:
+    graph = StageGraph()
+    graph.add('read', read_data, outputs=['deeplay_dict','inlets'])
+    graph.add('rates', InletRates, inputs=['deeplay_dict','inlets','factor'])
+    graph.add('figure_11', plot, inputs=['rates'], where='main')
+    values = graph.run(targets=['figure_11'], values={'factor': 2764800000})
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import stage_profiler
+
+# where a stage can run
+WHERE = ['thread','process','main']
+
+
+class StageGraph:
+
+    def __init__(self):
+        # {stage name: {'func', 'inputs', 'outputs', 'where'}}, in the order added
+        self.stages = {}
+        # {output name: name of the stage that produces it}
+        self.producers = {}
+
+    def add(self, name, func, inputs=(), outputs=None, where='thread'):
+        """
+        Add one stage.
+
+        INPUT:
+            name: stage name
+            func: called as func(*values of the inputs); returns the value of
+                its single output, or a sequence with one value per output
+            inputs: names of the values the stage needs (outputs of other
+                stages, or values given to run)
+            outputs: names of the values the stage produces (default: [name],
+                [] for a stage that only has side effects)
+            where: 'thread', 'process' or 'main'
+        """
+        if name in self.stages:
+            raise ValueError('StageGraph.add: stage {} already exists'.format(name))
+        if where not in WHERE:
+            raise ValueError('StageGraph.add: unsupported where={} (use one of {})'.format(where, WHERE))
+        outputs = [name] if outputs is None else list(outputs)
+        for output in outputs:
+            if output in self.producers:
+                raise ValueError('StageGraph.add: {} is already an output of stage {}'.format(
+                    output, self.producers[output]))
+        self.stages[name] = {'func': func, 'inputs': list(inputs), 'outputs': outputs, 'where': where}
+        for output in outputs:
+            self.producers[output] = name
+
+    def stage_of(self, target):
+        """
+        Name of the stage a target (stage or output name) refers to.
+        """
+        if target in self.stages:
+            return target
+        if target in self.producers:
+            return self.producers[target]
+        raise KeyError('no stage or output named {}'.format(target))
+
+    def upstream(self, targets=None, values=()):
+        """
+        Names of the stages needed for the targets (stage or output names,
+        default: all stages), in an order where every stage comes after the
+        stages it depends on. Stages whose outputs are all in values
+        are not needed.
+        """
+        if targets is None:
+            targets = list(self.stages)
+        order = []
+        # stages being visited (to find cycles) and stages already in order
+        visiting = set()
+        done = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError('StageGraph: stage {} depends on itself'.format(name))
+            visiting.add(name)
+            for value in self.stages[name]['inputs']:
+                if value in values:
+                    continue
+                if value not in self.producers:
+                    raise KeyError('StageGraph: stage {} needs {}, which no stage produces'.format(name, value))
+                visit(self.producers[value])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for target in targets:
+            name = self.stage_of(target)
+            outputs = self.stages[name]['outputs']
+            if outputs and all(output in values for output in outputs):
+                continue
+            visit(name)
+        return order
+
+    def run(self, targets=None, values=None, max_workers=None, process_pool=None, profiler=None):
+        """
+        Run the stages needed for the targets, each as soon as its inputs
+        are available.
+
+        INPUT:
+            targets: stage or output names (default: all stages)
+            values: dictionary of values that are already known (e.g. constants)
+            max_workers: number of threads (default: one per CPU);
+                1 runs all stages one after the other in the main thread
+            process_pool: executor for stages with where='process'
+            profiler: stage_profiler.StageProfiler that records every stage
+                (with trace_memory the stages run one after the other, so
+                the traced memory of each stage is its own)
+
+        OUTPUT: dictionary of the given values and all values computed
+        """
+        values = dict(values or {})
+        order = self.upstream(targets, values)
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if max_workers <= 1 or (profiler is not None and profiler.trace_memory):
+            for name in order:
+                stage = self.stages[name]
+                args = [values[value] for value in stage['inputs']]
+                if profiler is None:
+                    result = stage['func'](*args)
+                else:
+                    result = profiler.call(name, stage['func'], *args)
+                self._store(name, result, values)
+            return values
+
+        # stages each stage still waits for, and the stages waiting for it
+        needed = set(order)
+        waiting = {}
+        dependents = {name: [] for name in order}
+        for name in order:
+            waiting[name] = {self.producers[value] for value in self.stages[name]['inputs']
+                             if value not in values and self.producers[value] in needed}
+            for upstream in waiting[name]:
+                dependents[upstream].append(name)
+
+        ready = [name for name in order if not waiting[name]]
+        main_ready = []
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as threads:
+            try:
+                while ready or main_ready or running:
+                    # start every stage whose inputs are available
+                    for name in ready:
+                        stage = self.stages[name]
+                        if stage['where'] == 'main' or (stage['where'] == 'process' and process_pool is None):
+                            main_ready.append(name)
+                            continue
+                        pool = process_pool if stage['where'] == 'process' else threads
+                        args = [values[value] for value in stage['inputs']]
+                        running[pool.submit(stage_profiler.measure, stage['func'], *args)] = name
+                    ready = []
+
+                    # run one main-thread stage, or wait for a stage to finish
+                    if main_ready:
+                        name = main_ready.pop(0)
+                        stage = self.stages[name]
+                        args = [values[value] for value in stage['inputs']]
+                        finished = [(name, stage_profiler.measure(stage['func'], *args))]
+                    else:
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        finished = [(running.pop(future), future.result()) for future in done]
+
+                    for name, (result, record) in finished:
+                        if profiler is not None:
+                            profiler.add(name, **record)
+                        self._store(name, result, values)
+                        for dependent in dependents[name]:
+                            waiting[dependent].discard(name)
+                            if not waiting[dependent]:
+                                ready.append(dependent)
+            except BaseException:
+                # do not start stages that are still queued
+                for future in running:
+                    future.cancel()
+                raise
+        return values
+
+    def _store(self, name, result, values):
+        # put the result of a stage into values, one entry per output
+        outputs = self.stages[name]['outputs']
+        if len(outputs) == 1:
+            values[outputs[0]] = result
+        elif outputs:
+            if len(result) != len(outputs):
+                raise ValueError('StageGraph: stage {} returned {} values for {} outputs'.format(
+                    name, len(result), len(outputs)))
+            values.update(zip(outputs, result))
@@ -0,0 +1,235 @@
+"""
+Per-stage timing and memory instrumentation for main.py.
+
+Each stage (a data load, an analysis step, a figure) is wrapped in
+profiler.stage(name), which records
+    wall: wall-clock time [s]
+    cpu: CPU time of this process [s]
+    peak_rss: peak resident memory of the process while the stage ran [MB],
+        sampled every INTERVAL seconds by a background thread (nan where
+        the current RSS cannot be read, e.g. on macOS and Windows)
+    rss_growth: how much the stage raised the high-water mark of the
+        process memory (ru_maxrss) [MB], i.e. new memory it needed beyond
+        what earlier stages had already used
+    peak_traced: peak Python memory allocated during the stage, above what
+        was allocated when it started [MB] (only with trace_memory=True,
+        which uses tracemalloc and slows allocation-heavy code down)
+Stages can be nested; nested stages are indented in the summary.
+Stages that run on worker threads or processes (stage_graph.py) are
+measured there with measure(), which counts the CPU time of the worker
+thread only, and recorded with profiler.add().
+
+Example:
+    profiler = StageProfiler(trace_memory=True)
+    with profiler.stage('get_monthly_means'):
+        out = get_monthly_means.get_monthly_means(...)
+    profiler.print_summary()
+    profiler.to_json('profile.json')
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# seconds between two samples of the resident memory
+INTERVAL = 0.005
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    # not available on Windows (where /proc is not either)
+    PAGE_SIZE = 4096
+
+
+def peak_rss_mb():
+    """
+    High-water mark of the resident memory of this process [MB]
+    (nan where it cannot be measured).
+    """
+    if resource is None:
+        return float('nan')
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return maxrss / 1e6 if sys.platform == 'darwin' else maxrss / 1e3
+
+
+def current_rss_mb():
+    """
+    Current resident memory of this process [MB]
+    (nan where it cannot be read).
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as handle:
+            pages = int(handle.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    return pages * PAGE_SIZE / 1e6
+
+
+class RssSampler:
+    """
+    Context manager that samples the resident memory of this process
+    in a background thread; .peak is the highest value seen [MB].
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.peak = float('nan')
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.peak = current_rss_mb()
+        if self.peak == self.peak:
+            # (not started where the RSS cannot be read)
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._done.set()
+            self._thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+
+def measure(func, *args):
+    """
+    Returns func(*args) and a record of its wall time, the CPU time of
+    the calling thread and the memory of the calling process (peak_rss,
+    rss_growth), for stages that run on a worker thread or process
+    (see StageProfiler.add).
+    """
+    maxrss = peak_rss_mb()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    with RssSampler() as sampler:
+        result = func(*args)
+    record = {'wall': time.perf_counter() - wall,
+              'cpu': time.thread_time() - cpu,
+              'peak_rss': sampler.peak,
+              'rss_growth': peak_rss_mb() - maxrss}
+    return result, record
+
+
+class StageProfiler:
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        # one dict per finished stage, in the order the stages started
+        self.records = []
+        # stack of the running stages
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that records one stage.
+        """
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        record = {'stage': name, 'depth': len(self._stack)}
+        self.records.append(record)
+        running = {'start_traced': 0, 'peak_traced': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the parent stage keeps the peak it has seen so far
+            if self._stack:
+                self._stack[-1]['peak_traced'] = max(self._stack[-1]['peak_traced'], peak)
+            tracemalloc.reset_peak()
+            running['start_traced'] = current
+        self._stack.append(running)
+
+        maxrss = peak_rss_mb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        sampler = RssSampler()
+        sampler.start()
+        try:
+            yield record
+        finally:
+            sampler.stop()
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            record['peak_rss'] = sampler.peak
+            record['rss_growth'] = peak_rss_mb() - maxrss
+            self._stack.pop()
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], running['peak_traced'])
+                record['peak_traced'] = (peak - running['start_traced']) / 1e6
+                # pass the peak on to the parent stage
+                if self._stack:
+                    self._stack[-1]['peak_traced'] = max(self._stack[-1]['peak_traced'], peak)
+                tracemalloc.reset_peak()
+
+    def add(self, name, wall, cpu, peak_rss, rss_growth, depth=None):
+        """
+        Record a stage that was measured elsewhere (e.g. with measure()
+        on a worker thread or process), at the current nesting depth.
+        """
+        record = {'stage': name, 'depth': len(self._stack) if depth is None else depth,
+                  'wall': wall, 'cpu': cpu, 'peak_rss': peak_rss, 'rss_growth': rss_growth}
+        if self.trace_memory:
+            # not traced outside of stage()
+            record['peak_traced'] = float('nan')
+        self.records.append(record)
+        return record
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), recorded as one stage.
+        """
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def print_summary(self):
+        """
+        Print a table of all stages.
+        """
+        print('\n=============================================================')
+        print('========================Stage profile========================')
+        print('=============================================================\n')
+        header = '{:<36s} {:>9s} {:>9s} {:>14s} {:>15s}'.format('stage', 'wall [s]', 'cpu [s]',
+                                                                 'peak rss [MB]', 'rss growth [MB]')
+        if self.trace_memory:
+            header += ' {:>12s}'.format('traced [MB]')
+        print(header)
+        for record in self.records:
+            if 'wall' not in record:
+                # still running
+                continue
+            name = '  ' * record['depth'] + record['stage']
+            line = '{:<36s} {:9.3f} {:9.3f} {:14.1f} {:15.1f}'.format(name[:36], record['wall'], record['cpu'],
+                                                                     record['peak_rss'], record['rss_growth'])
+            if self.trace_memory:
+                line += ' {:12.1f}'.format(record['peak_traced'])
+            print(line)
+        total = sum(record.get('wall', 0) for record in self.records if record['depth'] == 0)
+        print('{:<36s} {:9.3f}'.format('total (top-level stages)', total))
+
+    def to_json(self, path):
+        """
+        Write all finished stages to a JSON file (a list of records).
+        """
+        with open(path, 'w') as handle:
+            json.dump([record for record in self.records if 'wall' in record], handle, indent=2)
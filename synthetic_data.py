@@ -0,0 +1,191 @@
+"""
+Write synthetic input data with the same files, keys and shapes as
+../DATA_terminal_inlet_DO, for benchmarks and for running the analysis
+without the real model output.
+
+The inlet dictionaries have seasonal cycles plus noise, and the budget
+terms add up to d/dt(DO) (up to a small error), so every stage and
+figure runs on them; the values are not meant to be realistic.
+The number of inlets, the years and the grid size can all be scaled.
+
+Layout (as expected by main.py and multi_year.py):
+    <data_dir>/LO_cas7_grid.nc            lon_rho, lat_rho, h, mask_rho
+    <data_dir>/PugetSound_gridsizes.nc    lon_rho, lat_rho of the Puget Sound box
+    <data_dir>/<dictionary files>         (data_store.DICT_FILES) of the first year
+    <data_dir>/<year>/<inlet dictionaries> of every other year
+
+Run as a script:
+    python synthetic_data.py <data_dir> [ninlets] [nyears]
+"""
+
+import os
+import sys
+import pickle
+import numpy as np
+import pandas as pd
+
+import data_store
+
+# real inlet names (used for the first inlets, so e.g. figure_10 finds 'lynchcove')
+INLETS = ['sinclair','quartermaster','dyes','crescent','penn','case',
+          'lynchcove','carr','holmes','portsusan','elliott','commencement','dabob']
+
+# deep layer budget terms (d/dt(DO) is their sum)
+BUDGET_TERMS = ['TEF Exchange Flow','WWTPs','Vertical Transport','Photosynthesis','Bio Consumption']
+
+# LiveOcean cas7 domain and grid size (eta x xi)
+DOMAIN = {'lon': (-130.0, -122.0), 'lat': (42.0, 52.0)}
+GRID_SHAPE = (1302, 663)
+
+# Puget Sound box
+PS_DOMAIN = {'lon': (-123.3, -122.1), 'lat': (46.9, 48.5)}
+
+# years of the hypoxic volume time series (as in figure_07)
+HYP_VOL_YEARS = ['2014','2015','2016','2017','2018','2019']
+
+
+def inlet_names(ninlets):
+    """
+    Returns ninlets inlet names (the real ones first).
+    """
+    return INLETS[:ninlets] + ['inlet{:03d}'.format(i) for i in range(len(INLETS), ninlets)]
+
+
+def make_inlet_dicts(inlets, year='2017', seed=0):
+    """
+    Synthetic deeplay_dict, shallowlay_dict, dimensions_dict and DOconcen_dict
+    with one value per day from Jan 02 to Dec 30 (as in the real data).
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start=year + '-01-02', end=year + '-12-30', freq='D')
+    ndays = len(dates)
+    # seasonal cycle peaking in late summer
+    season = np.sin(2*np.pi*(dates.dayofyear.values - 120)/365)
+
+    deeplay_dict = {}
+    shallowlay_dict = {}
+    dimensions_dict = {}
+    DOconcen_dict = {}
+    for inlet in inlets:
+        volume = 10**rng.uniform(7.5, 9.5)
+        depth = rng.uniform(5, 60)
+        # budget terms [kmol O2/s], scaled with the inlet volume
+        scale = volume * 1e-11
+        deep = {}
+        for term in BUDGET_TERMS:
+            amplitude = rng.uniform(0.5, 2) * scale
+            deep[term] = amplitude * (rng.uniform(-1, 1) + season) + 0.3 * amplitude * rng.standard_normal(ndays)
+        deep['Exchange Flow & Vertical'] = deep['TEF Exchange Flow'] + deep['Vertical Transport']
+        deep['Photosynthesis & Consumption'] = deep['Photosynthesis'] + deep['Bio Consumption']
+        deep['d/dt(DO)'] = sum(deep[term] for term in BUDGET_TERMS) + 0.05 * scale * rng.standard_normal(ndays)
+        deep['Volume'] = volume * (1 + 0.01 * rng.standard_normal(ndays))
+        deep['Qin m3/s'] = volume / (86400 * rng.uniform(5, 60)) * (1 + 0.3 * season)
+        deeplay_dict[inlet] = {term: pd.Series(values) for term, values in deep.items()}
+
+        # shallow layer: vertical transport nearly cancels the deep layer one
+        shallow = {term: scale * rng.standard_normal(ndays) for term in BUDGET_TERMS}
+        shallow['Vertical Transport'] = -deep['Vertical Transport'] + 0.05 * scale * rng.standard_normal(ndays)
+        shallow['Exchange Flow & Vertical'] = shallow['TEF Exchange Flow'] + shallow['Vertical Transport']
+        shallow['Photosynthesis & Consumption'] = shallow['Photosynthesis'] + shallow['Bio Consumption']
+        shallow['d/dt(DO)'] = sum(shallow[term] for term in BUDGET_TERMS)
+        shallow['Volume'] = volume * 0.5 * (1 + 0.01 * rng.standard_normal(ndays))
+        shallowlay_dict[inlet] = {term: pd.Series(values) for term, values in shallow.items()}
+
+        dimensions_dict[inlet] = pd.DataFrame({'Inlet volume': [volume], 'Mean depth': [depth]})
+
+        DOin = 7 - 1.5 * season + 0.3 * rng.standard_normal(ndays)
+        DOdeep = DOin - rng.uniform(0.5, 3) * (1 + season) + 0.3 * rng.standard_normal(ndays)
+        DOconcen_dict[inlet] = {'Deep Layer DO': pd.Series(DOdeep),
+                                'DOin': pd.Series(DOin),
+                                'percent hypoxic volume': pd.Series(np.clip(30 * (2 - DOdeep), 0, 100))}
+
+    return {'deeplay_dict': deeplay_dict,
+            'shallowlay_dict': shallowlay_dict,
+            'dimensions_dict': dimensions_dict,
+            'DOconcen_dict': DOconcen_dict}
+
+
+def make_grid(grid_shape=GRID_SHAPE, domain=DOMAIN, seed=0):
+    """
+    Synthetic plaid lon/lat grid with depth and land mask (numpy arrays).
+    """
+    rng = np.random.default_rng(seed)
+    lon, lat = np.meshgrid(np.linspace(*domain['lon'], grid_shape[1]),
+                           np.linspace(*domain['lat'], grid_shape[0]))
+    # deep offshore, shallow towards the east, with some bumps
+    h = 5 + 2000 * np.clip((domain['lon'][1] - 1 - lon) / 6, 0, 1) + 50 * np.abs(np.sin(3*lon) * np.cos(3*lat))
+    mask = (rng.random(grid_shape) > 0.3) | (lon < domain['lon'][1] - 2)
+    return lon, lat, h, mask
+
+
+def write_grid(path, lon, lat, h=None, mask=None):
+    """
+    Write a LiveOcean-style grid NetCDF file (rho grid only).
+    """
+    import xarray as xr
+    dims = ('eta_rho','xi_rho')
+    variables = {}
+    if h is not None:
+        variables['h'] = (dims, h)
+    if mask is not None:
+        variables['mask_rho'] = (dims, mask.astype(float))
+    xr.Dataset(variables, coords={'lon_rho': (dims, lon), 'lat_rho': (dims, lat)}).to_netcdf(path)
+
+
+def write_pickle(path, obj):
+    with open(path, 'wb') as handle:
+        pickle.dump(obj, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_dataset(data_dir, ninlets=len(INLETS), years=('2017',), grid_shape=GRID_SHAPE, seed=0):
+    """
+    Write a complete synthetic data directory.
+
+    INPUT:
+        data_dir: output directory (created if needed)
+        ninlets: number of inlets
+        years: years of inlet dictionaries (the first one goes into data_dir itself)
+        grid_shape: (eta, xi) size of the LiveOcean grid
+        seed: random seed
+
+    OUTPUT: list of inlet names
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    inlets = inlet_names(ninlets)
+
+    # grids
+    lon, lat, h, mask = make_grid(grid_shape, seed=seed)
+    write_grid(os.path.join(data_dir, 'LO_cas7_grid.nc'), lon, lat, h, mask)
+    xi = (lon[0,:] >= PS_DOMAIN['lon'][0]) & (lon[0,:] <= PS_DOMAIN['lon'][1])
+    eta = (lat[:,0] >= PS_DOMAIN['lat'][0]) & (lat[:,0] <= PS_DOMAIN['lat'][1])
+    ps_lon = lon[np.ix_(eta, xi)]
+    ps_lat = lat[np.ix_(eta, xi)]
+    write_grid(os.path.join(data_dir, 'PugetSound_gridsizes.nc'), ps_lon, ps_lat)
+
+    # Puget Sound hypoxia fields (on the Puget Sound box) and volume time series
+    rng = np.random.default_rng(seed)
+    files = data_store.DICT_FILES
+    hyp_days = np.where(rng.random(ps_lon.shape) > 0.7, rng.uniform(0, 120, ps_lon.shape), np.nan)
+    write_pickle(os.path.join(data_dir, files['hyp_days_dict']), {'avg': hyp_days})
+    write_pickle(os.path.join(data_dir, files['hyp_seas_DO_dict']),
+                 {'avg': np.where(np.isnan(hyp_days), np.nan, rng.uniform(0, 2, ps_lon.shape))})
+    days = np.arange(366)
+    write_pickle(os.path.join(data_dir, files['hyp_vol_dict']),
+                 {year: np.clip(4 * np.sin(np.pi*(days - 150)/150) + rng.standard_normal(366), 0, None)
+                  for year in HYP_VOL_YEARS})
+
+    # inlet dictionaries of every year
+    for i,year in enumerate(years):
+        year_dir = data_dir if i == 0 else os.path.join(data_dir, year)
+        os.makedirs(year_dir, exist_ok=True)
+        for name, obj in make_inlet_dicts(inlets, year, seed=seed + i).items():
+            write_pickle(os.path.join(year_dir, files[name]), obj)
+
+    return inlets
+
+
+if __name__ == '__main__':
+    data_dir = sys.argv[1]
+    ninlets = int(sys.argv[2]) if len(sys.argv) > 2 else len(INLETS)
+    nyears = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    write_dataset(data_dir, ninlets, years=[str(2017 + i) for i in range(nyears)])
@@ -0,0 +1,97 @@
+"""
+Sensitivity of the hypoxic vs. oxygenated comparison to the choice
+of the drawdown window.
+
+Every (minday, maxday) pair of a sweep is evaluated at once from the
+cumulative sums of inlet_rates.InletRates: the window means of every
+inlet, then the group means and Welch's t-test p-value (group_stats),
+giving (start x end) maps that are plotted as a heatmap.
+
+Example:
+    sweep = sweep_group_test(rates, 'd/dt(DO)', hyp_inlets,
+                             starts=np.arange(120,200), ends=np.arange(190,270))
+    plot_window_sensitivity(sweep, dates_local_daily, minday, maxday)
+"""
+
+import warnings
+import numpy as np
+import matplotlib.pylab as plt
+
+import group_stats
+
+
+def sweep_group_test(rates, term, hyp_inlets, starts, ends):
+    """
+    Group means and Welch's t-test of one term for every window
+    [start, end) of a sweep.
+
+    INPUT:
+        rates: inlet_rates.InletRates
+        term: budget term
+        hyp_inlets: list of hypoxic inlets (all other inlets are oxygenated)
+        starts, ends: 1-D arrays of first and last+1 days of the windows
+
+    OUTPUT: dictionary with
+        starts, ends, term
+        mean_oxy, mean_hyp, welch_p: arrays (starts x ends)
+            (nan for windows with end <= start)
+    """
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    # (starts x ends x inlets) window means
+    means = rates.window_mean(starts[:,None], ends[None,:], terms=[term])[...,0]
+    means = np.where((ends[None,:] > starts[:,None])[...,None], means, np.nan)
+
+    # group statistics, (2 groups x starts x ends)
+    groups = rates.split_groups(hyp_inlets)
+    columns = [[rates.inlet_index[inlet] for inlet in group] for group in groups]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        n = np.stack([np.sum(~np.isnan(means[...,c]), axis=-1) for c in columns])
+        mean = np.stack([np.nanmean(means[...,c], axis=-1) for c in columns])
+        var = np.stack([np.nanvar(means[...,c], axis=-1, ddof=1) for c in columns])
+    t, df, p = group_stats.welch_test(n, mean, var)
+
+    return {'starts': starts, 'ends': ends, 'term': term,
+            'mean_oxy': mean[0], 'mean_hyp': mean[1], 'welch_p': p}
+
+
+def plot_window_sensitivity(sweep, dates_local_daily, minday, maxday):
+    """
+    Heatmaps of the Welch's t-test p-value and of the difference of the
+    group means (hypoxic - oxygenated) for every window of a sweep,
+    with the drawdown window used in the figures marked.
+    """
+    # initialize figure
+    fig, ax = plt.subplots(1,2,figsize=(12,5.5))
+
+    # day of year of the window bounds (for the axes)
+    start_doy = dates_local_daily[sweep['starts']].dayofyear
+    end_doy = dates_local_daily[np.minimum(sweep['ends'], len(dates_local_daily)-1)].dayofyear
+
+    panels = [(sweep['welch_p'], 'Welch\'s t-test p-value', 'viridis', 0, 1),
+              (sweep['mean_hyp'] - sweep['mean_oxy'], 'hypoxic - oxygenated [mg/L per day]', 'RdBu_r', None, None)]
+    for i,(field,label,cmap,vmin,vmax) in enumerate(panels):
+        if vmin is None:
+            vmax = np.nanmax(np.abs(field))
+            vmin = -vmax
+        cs = ax[i].pcolormesh(end_doy, start_doy, field, cmap=cmap, vmin=vmin, vmax=vmax, shading='nearest')
+        cbar = fig.colorbar(cs, ax=ax[i])
+        cbar.set_label(label, fontsize=10)
+        # significance contour
+        if i == 0:
+            ax[i].contour(end_doy, start_doy, sweep['welch_p'], levels=[0.05], colors='white', linewidths=1.5)
+        # window used in the figures
+        ax[i].plot(dates_local_daily[maxday].dayofyear, dates_local_daily[minday].dayofyear,
+                   marker='*', markersize=14, color='k', markeredgecolor='white')
+        ax[i].set_xlabel('Window end [day of year]', fontsize=12)
+        ax[i].set_ylabel('Window start [day of year]', fontsize=12)
+        ax[i].tick_params(axis='both', labelsize=10)
+
+    ax[0].set_title('({}) {}'.format('a', sweep['term']), fontsize=12, loc='left', fontweight='bold')
+    ax[1].set_title('(b)', fontsize=12, loc='left', fontweight='bold')
+
+    plt.tight_layout()
+    plt.show()
+
+    return